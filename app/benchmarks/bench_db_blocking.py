@@ -0,0 +1,142 @@
+"""
+Бенчмарк: задержка /api/leaderboard и /api/battle/{id} во время медленного запроса.
+
+Запускает приложение in-process (httpx ASGITransport) с фейковой БД, в которой
+запрос профиля "висит" SLOW_QUERY_SECONDS, и параллельно меряет задержку
+быстрых эндпоинтов. Сравниваются два режима:
+
+  inline   - execute_query вызывается прямо в event loop (старое поведение)
+  executor - вызовы идут через run_db (ограниченный пул потоков)
+
+Запуск из директории app/:
+    python benchmarks/bench_db_blocking.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+SLOW_QUERY_SECONDS = 1.0
+FAST_QUERY_SECONDS = 0.002
+PROBE_REQUESTS = 40
+PROBE_WINDOW_SECONDS = 2.0
+WALLET = "11111111111111111111111111111112"
+
+
+class _BenchDB:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query, params=None, fetch="all"):
+        q = " ".join(query.split()).lower()
+        if "from users" in q and "where wallet_address" in q:
+            time.sleep(SLOW_QUERY_SECONDS)
+            now = main.datetime.utcnow()
+            return {
+                "id": 1,
+                "wallet_address": WALLET,
+                "username": "bench",
+                "avatar_url": None,
+                "created_at": now,
+                "last_login": now,
+            }
+        time.sleep(FAST_QUERY_SECONDS)
+        return [
+            {"user_id": i, "points": 1000 - i, "wins": i, "losses": 0, "username": f"u{i}", "wallet_address": f"w{i}"}
+            for i in range(100)
+        ]
+
+
+async def _inline_run_db(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _probe(client, url, headers):
+    # Fixed-rate probes; latency is measured from the *scheduled* send time so a
+    # stalled event loop shows up instead of silently delaying the next probe.
+    interval = PROBE_WINDOW_SECONDS / PROBE_REQUESTS
+    start = time.perf_counter()
+
+    async def one(scheduled):
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        resp = await client.get(url, headers=headers)
+        resp.raise_for_status()
+        return (time.perf_counter() - scheduled) * 1000
+
+    return await asyncio.gather(*(one(start + i * interval) for i in range(PROBE_REQUESTS)))
+
+
+async def _run(mode):
+    main.Database = _BenchDB
+    main.run_db = _inline_run_db if mode == "inline" else _original_run_db
+    main.app.state.testing = True
+
+    battle_id = "bench-battle"
+    main.app.state.battles[battle_id] = {
+        "battle_id": battle_id,
+        "status": main.BattleStatus.pending,
+        "wait_seconds": 60,
+        "resolve_at": time.time() + 60,
+        "result": None,
+    }
+    token = main.SecurityUtils.create_jwt_token({"userId": 1, "walletAddress": WALLET})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def slow_profiles():
+            # Keep one slow query in flight for the whole probe window
+            deadline = time.perf_counter() + PROBE_WINDOW_SECONDS
+            while time.perf_counter() < deadline:
+                await client.get("/api/user/profile", headers=headers)
+
+        slow = asyncio.create_task(slow_profiles())
+        await asyncio.sleep(0.05)
+        leaderboard, battle = await asyncio.gather(
+            _probe(client, "/api/leaderboard", {}),
+            _probe(client, f"/api/battle/{battle_id}", headers),
+        )
+        await slow
+    return {"/api/leaderboard": leaderboard, f"/api/battle/{{id}}": battle}
+
+
+_original_run_db = main.run_db
+
+
+def main_cli():
+    print(
+        f"slow query: {SLOW_QUERY_SECONDS * 1000:.0f} ms, "
+        f"{PROBE_REQUESTS} probes per endpoint over {PROBE_WINDOW_SECONDS:.0f} s"
+    )
+    print(f"{'mode':<10}{'endpoint':<22}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for mode in ("inline", "executor"):
+        results = asyncio.run(_run(mode))
+        for endpoint, values in results.items():
+            print(
+                f"{mode:<10}{endpoint:<22}"
+                f"{statistics.median(values):>10.1f}{_percentile(values, 95):>10.1f}{max(values):>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -309,6 +309,32 @@
         <span class="leaderboard-pts">${p.pts}</span>
       </div>
     `).join('');
+
+    const live = window.PhantomConnect;
+    if (live && live.subscribeLeaderboard && !renderLeaderboard.unsubscribe) {
+      renderLeaderboard.unsubscribe = live.subscribeLeaderboard(renderLiveLeaderboard);
+    }
+  }
+
+  /* Server data: build nodes with textContent, never innerHTML */
+  function renderLiveLeaderboard(top) {
+    const rows = top.slice(0, 5).map((p) => {
+      const item = document.createElement('div');
+      item.className = 'leaderboard-item';
+      const cells = [
+        ['leaderboard-rank', `#${p.rank}`],
+        ['leaderboard-name', p.username || `${String(p.wallet_address || '').slice(0, 6)}…`],
+        ['leaderboard-pts', String(p.points)]
+      ];
+      for (const [cls, text] of cells) {
+        const span = document.createElement('span');
+        span.className = cls;
+        span.textContent = text;
+        item.appendChild(span);
+      }
+      return item;
+    });
+    if (rows.length) leaderboardEl.replaceChildren(...rows);
   }
 
   /* --- NFT Grid (real from wallet scan) --- */
@@ -426,6 +452,9 @@
   }
 
   /* --- KOTH --- */
+  const MEDALS = ['🥇', '🥈', '🥉'];
+  let kothResetAt = null;
+
   function renderKOTH() {
     kothPodium.innerHTML = KOTH_TOP.map(p => `
       <div class="koth-place">
@@ -434,16 +463,53 @@
         <div class="koth-place-pts">${p.pts} pts</div>
       </div>
     `).join('');
+    loadKOTH();
+  }
+
+  async function loadKOTH() {
+    const live = window.PhantomConnect;
+    if (!live || !live.apiRequest) return;
+    try {
+      const data = await live.apiRequest('/leaderboard/koth');
+      kothResetAt = Date.parse(data.nextReset);
+      if (!data.top || !data.top.length) return;
+      /* Server data: textContent only */
+      const places = data.top.map((p, i) => {
+        const place = document.createElement('div');
+        place.className = 'koth-place';
+        const cells = [
+          ['koth-medal', MEDALS[i] || ''],
+          ['koth-place-name', p.username || `${String(p.wallet_address || '').slice(0, 6)}…`],
+          ['koth-place-pts', `${p.points} pts`]
+        ];
+        for (const [cls, text] of cells) {
+          const div = document.createElement('div');
+          div.className = cls;
+          div.textContent = text;
+          place.appendChild(div);
+        }
+        return place;
+      });
+      kothPodium.replaceChildren(...places);
+    } catch (e) {
+      console.warn('KOTH unavailable:', e);
+    }
   }
 
   function startKOTHTimer() {
-    let seconds = 86382;
     function tick() {
+      /* Until the server answers, count down to the next UTC midnight */
+      const now = Date.now();
+      const resetAt = kothResetAt || (Math.floor(now / 86400000) + 1) * 86400000;
+      const seconds = Math.max(0, Math.round((resetAt - now) / 1000));
+      if (seconds === 0 && kothResetAt) {
+        kothResetAt = null;
+        loadKOTH();
+      }
       const h = String(Math.floor(seconds / 3600)).padStart(2, '0');
       const m = String(Math.floor((seconds % 3600) / 60)).padStart(2, '0');
       const s = String(seconds % 60).padStart(2, '0');
       kothTimer.textContent = `${h}:${m}:${s}`;
-      seconds = seconds > 0 ? seconds - 1 : 86400;
     }
     tick();
     setInterval(tick, 1000);
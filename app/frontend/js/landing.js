@@ -249,14 +249,14 @@ if (typeof solana === 'undefined') {
           avatarUrl: avatarDataURL
         });
 
-        // Add scanned NFTs to user collection
-        for (const nft of scannedNFTs) {
-          await window.PhantomConnect.addNFT({
+        // Add scanned NFTs to user collection (single bulk upsert)
+        if (scannedNFTs.length) {
+          await window.PhantomConnect.addNFTs(scannedNFTs.map(nft => ({
             mintAddress: nft.mint,
             name: nft.name || 'Unknown Warrior',
             imageUrl: nft.image || '',
             rarity: nft.rarity || 'Common'
-          });
+          })));
         }
 
         window.location.href = 'app.html';
@@ -294,6 +294,13 @@ class PhantomConnectManager {
     });
   }
 
+  async addNFTs(nfts) {
+    return await this.apiRequest('/user/nfts/bulk', {
+      method: 'POST',
+      body: JSON.stringify({ nfts })
+    });
+  }
+
   async getSkills() {
     return await this.apiRequest('/skills');
   }
@@ -426,6 +433,46 @@ class PhantomConnectManager {
   async getLeaderboard() {
     return await this.apiRequest('/leaderboard');
   }
+
+  /**
+   * Live leaderboard over SSE: one snapshot, then compact diffs.
+   * onUpdate receives the full, ordered top list after every change.
+   * Returns a function that closes the stream.
+   */
+  subscribeLeaderboard(onUpdate) {
+    if (typeof EventSource === 'undefined') return () => {};
+    const source = new EventSource(`${this.API_BASE_URL}/leaderboard/stream`);
+    let byId = new Map();
+
+    const emit = () => {
+      const top = [...byId.values()].sort((a, b) => a.rank - b.rank);
+      onUpdate(top);
+    };
+
+    source.addEventListener('snapshot', (ev) => {
+      const data = JSON.parse(ev.data);
+      byId = new Map(data.leaderboard.map((e, i) => [e.user_id, { ...e, rank: i + 1 }]));
+      emit();
+    });
+
+    source.addEventListener('diff', (ev) => {
+      const data = JSON.parse(ev.data);
+      for (const id of data.removed) byId.delete(id);
+      for (const d of data.changed) {
+        const cur = byId.get(d.u) || { user_id: d.u };
+        cur.rank = d.r;
+        if ('p' in d) cur.points = d.p;
+        if ('w' in d) cur.wins = d.w;
+        if ('l' in d) cur.losses = d.l;
+        if ('n' in d) cur.username = d.n;
+        if ('a' in d) cur.wallet_address = d.a;
+        byId.set(d.u, cur);
+      }
+      emit();
+    });
+
+    return () => source.close();
+  }
 }
 
 // Global instance
@@ -3,31 +3,60 @@ WORLDBINDER Backend API
 FastAPI сервер с безопасной аутентификацией Phantom
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, Request, Response
+from fastapi import FastAPI, HTTPException, Depends, Header, status, Request, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import NotModifiedResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
-from pydantic import BaseModel, Field, validator
+from fastapi.responses import JSONResponse, FileResponse, RedirectResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field, constr, validator
 from pydantic_settings import BaseSettings
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import jwt
 import hashlib
+import json
+import random
 import time
 import base64
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, NamedTuple, Tuple
 import logging
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 import base58
 from nacl.signing import VerifyKey
 from nacl.exceptions import BadSignatureError
 import secrets
 import asyncio
+import sys
+import threading
+import functools
+import gzip
+import os
+import zlib
+from mimetypes import guess_type
+import re
+import select
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from collections import OrderedDict, deque
 from enum import Enum
+from types import MappingProxyType
 import httpx
 
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    import h2
+except ImportError:  # HTTP/1.1 keep-alive only
+    h2 = None
+
 # Настройки
 class Settings(BaseSettings):
     # База данных
@@ -36,6 +65,47 @@ class Settings(BaseSettings):
     db_name: str = Field("blizard", validation_alias="POSTGRES_DB")
     db_user: str = Field("admin", validation_alias="POSTGRES_USER")
     db_password: str = Field("12345", validation_alias="POSTGRES_PASSWORD")
+    db_connect_timeout: int = Field(5, validation_alias="POSTGRES_CONNECT_TIMEOUT")
+    db_pool_min_size: int = Field(1, validation_alias="POSTGRES_POOL_MIN_SIZE")
+    db_pool_max_size: int = Field(10, validation_alias="POSTGRES_POOL_MAX_SIZE")
+    db_pool_acquire_timeout: float = Field(5.0, validation_alias="POSTGRES_POOL_ACQUIRE_TIMEOUT")
+    db_pool_leak_timeout: float = Field(30.0, validation_alias="POSTGRES_POOL_LEAK_TIMEOUT")
+    db_executor_workers: int = Field(10, validation_alias="DB_EXECUTOR_WORKERS")
+    db_replica_dsn: str = Field("", validation_alias="POSTGRES_REPLICA_DSN")
+    db_replica_pool_max_size: int = Field(10, validation_alias="POSTGRES_REPLICA_POOL_MAX_SIZE")
+    db_read_your_writes_seconds: float = Field(5.0, validation_alias="DB_READ_YOUR_WRITES_SECONDS")
+    db_slow_query_ms: float = Field(200.0, validation_alias="DB_SLOW_QUERY_MS")
+    db_slow_query_log_size: int = Field(100, validation_alias="DB_SLOW_QUERY_LOG_SIZE")
+    leaderboard_flush_ms: int = Field(5, validation_alias="LEADERBOARD_FLUSH_MS")
+    leaderboard_batch_max: int = Field(500, validation_alias="LEADERBOARD_BATCH_MAX")
+    leaderboard_size: int = Field(100, validation_alias="LEADERBOARD_SIZE")
+    leaderboard_snapshot_max_age: float = Field(5.0, validation_alias="LEADERBOARD_SNAPSHOT_MAX_AGE")
+    rank_index_page_size: int = Field(50000, validation_alias="RANK_INDEX_PAGE_SIZE")
+    rank_index_resync_seconds: float = Field(300.0, validation_alias="RANK_INDEX_RESYNC_SECONDS")
+    leaderboard_listen_enabled: bool = Field(True, validation_alias="LEADERBOARD_LISTEN_ENABLED")
+    leaderboard_stream_tick_ms: int = Field(500, validation_alias="LEADERBOARD_STREAM_TICK_MS")
+    leaderboard_stream_queue_size: int = Field(32, validation_alias="LEADERBOARD_STREAM_QUEUE_SIZE")
+    leaderboard_stream_max_subscribers: int = Field(5000, validation_alias="LEADERBOARD_STREAM_MAX_SUBSCRIBERS")
+    leaderboard_stream_heartbeat_s: float = Field(15.0, validation_alias="LEADERBOARD_STREAM_HEARTBEAT_S")
+    koth_reset_enabled: bool = Field(True, validation_alias="KOTH_RESET_ENABLED")
+    koth_zero_batch_size: int = Field(1000, validation_alias="KOTH_ZERO_BATCH_SIZE")
+    koth_cache_seconds: float = Field(30.0, validation_alias="KOTH_CACHE_SECONDS")
+    skills_cache_seconds: float = Field(300.0, validation_alias="SKILLS_CACHE_SECONDS")
+    skills_listen_enabled: bool = Field(True, validation_alias="SKILLS_LISTEN_ENABLED")
+
+    # Кэш: локальный LRU + общий Redis-совместимый уровень (CACHE_URL пуст - только локальный)
+    cache_url: str = Field("", validation_alias="CACHE_URL")
+    cache_prefix: str = Field("wb", validation_alias="CACHE_PREFIX")
+    cache_local_max_entries: int = Field(10000, validation_alias="CACHE_LOCAL_MAX_ENTRIES")
+    cache_local_ttl: float = Field(2.0, validation_alias="CACHE_LOCAL_TTL")
+    cache_timeout: float = Field(0.5, validation_alias="CACHE_TIMEOUT")
+    cache_pool_size: int = Field(4, validation_alias="CACHE_POOL_SIZE")
+    cache_lock_ttl_ms: int = Field(5000, validation_alias="CACHE_LOCK_TTL_MS")
+
+    # Сжатие ответов
+    compression_min_size: int = Field(1024, validation_alias="COMPRESSION_MIN_SIZE")
+    compression_gzip_level: int = Field(6, validation_alias="COMPRESSION_GZIP_LEVEL")
+    compression_brotli_quality: int = Field(5, validation_alias="COMPRESSION_BROTLI_QUALITY")
     
     # JWT
     jwt_secret: str = Field("your-secret-key-change-in-production", validation_alias="JWT_SECRET")
@@ -46,12 +116,30 @@ class Settings(BaseSettings):
     frontend_url: str = Field("http://localhost:3001", validation_alias="FRONTEND_URL")
     rate_limit_requests: int = Field(100, validation_alias="RATE_LIMIT_REQUESTS")
     rate_limit_window: int = Field(900, validation_alias="RATE_LIMIT_WINDOW")
+    admin_token: str = Field("", validation_alias="ADMIN_TOKEN")
+    identity_cache_size: int = Field(10000, validation_alias="IDENTITY_CACHE_SIZE")
+    identity_listen_enabled: bool = Field(True, validation_alias="IDENTITY_LISTEN_ENABLED")
     
     # Solana
     solana_cluster: str = Field("mainnet-beta", validation_alias="SOLANA_CLUSTER")
     solana_rpc: str = Field("", validation_alias="SOLANA_RPC")
+    solana_rpc_batch_size: int = Field(100, validation_alias="SOLANA_RPC_BATCH_SIZE")
+    solana_rpc_batch_concurrency: int = Field(4, validation_alias="SOLANA_RPC_BATCH_CONCURRENCY")
+    http_http2: bool = Field(True, validation_alias="HTTP_HTTP2")
+    http_connect_timeout: float = Field(3.0, validation_alias="HTTP_CONNECT_TIMEOUT")
+    http_read_timeout: float = Field(25.0, validation_alias="HTTP_READ_TIMEOUT")
+    http_pool_timeout: float = Field(5.0, validation_alias="HTTP_POOL_TIMEOUT")
+    http_max_connections_per_host: int = Field(50, validation_alias="HTTP_MAX_CONNECTIONS_PER_HOST")
+    http_max_keepalive_per_host: int = Field(20, validation_alias="HTTP_MAX_KEEPALIVE_PER_HOST")
+    http_keepalive_expiry: float = Field(60.0, validation_alias="HTTP_KEEPALIVE_EXPIRY")
     helius_api_key: str = Field("", validation_alias="HELIUS_API_KEY")
+    helius_rpc_url: str = Field("https://mainnet.helius-rpc.com/", validation_alias="HELIUS_RPC_URL")
+    helius_scan_page_size: int = Field(1000, validation_alias="HELIUS_SCAN_PAGE_SIZE")
+    helius_scan_max_pages: int = Field(50, validation_alias="HELIUS_SCAN_MAX_PAGES")
     collection_address: str = Field("", validation_alias="COLLECTION_ADDRESS")
+    scan_cache_fresh_seconds: float = Field(60.0, validation_alias="SCAN_CACHE_FRESH_SECONDS")
+    scan_cache_stale_seconds: float = Field(600.0, validation_alias="SCAN_CACHE_STALE_SECONDS")
+    scan_cache_empty_seconds: float = Field(300.0, validation_alias="SCAN_CACHE_EMPTY_SECONDS")
 
     # Game
     nft_stats_salt: str = Field("change-me-nft-stats-salt", validation_alias="NFT_STATS_SALT")
@@ -101,6 +189,11 @@ class NFTData(BaseModel):
     rarity: str = Field("Common", pattern="^(Common|Rare|Epic|Legendary)$")
 
 
+class NFTBulkRequest(BaseModel):
+    """Пачка NFT для одного upsert"""
+    nfts: List[NFTData] = Field(..., min_length=1, max_length=100)
+
+
 class NFTStatsRequest(BaseModel):
     mintAddress: str = Field(..., min_length=44, max_length=44)
     rarity: str = Field("Common", pattern="^(Common|Rare|Epic|Legendary)$")
@@ -149,6 +242,7 @@ class UserResponse(BaseModel):
 
 class WalletScanRequest(BaseModel):
     walletAddress: str = Field(..., min_length=32, max_length=60)
+    refresh: bool = False
 
 
 class SkillsUpgradeRequest(BaseModel):
@@ -159,32 +253,609 @@ class SkillsUpgradeRequest(BaseModel):
 class TokenBalanceRequest(BaseModel):
     walletAddress: str = Field(..., min_length=32, max_length=60)
 
+
+class TokenBalancesRequest(BaseModel):
+    """Кошельки для пакетного запроса балансов TOKEN_MINT"""
+    wallets: List[constr(min_length=32, max_length=60)] = Field(..., min_length=1, max_length=5000)
+
 # База данных
-class Database:
+class PoolTimeout(Exception):
+    """Пул исчерпан: соединение не освободилось за acquire_timeout.
+
+    Намеренно не OperationalError: обработчики "БД недоступна" не должны
+    подменять перегрузку выдуманным ответом. Наружу отдаётся 503.
+    """
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений PostgreSQL.
+
+    Соединения создаются лениво до max_size, open() заранее поднимает min_size.
+    Для каждого выданного соединения запоминаются владелец и время выдачи,
+    чтобы находить соединения, которые так и не вернулись в пул.
+    """
+
+    def __init__(
+        self,
+        factory,
+        min_size: int = 1,
+        max_size: int = 10,
+        acquire_timeout: float = 5.0,
+        leak_timeout: float = 30.0,
+    ):
+        self._factory = factory
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.acquire_timeout = float(acquire_timeout)
+        self.leak_timeout = float(leak_timeout)
+        self._cond = threading.Condition()
+        self._idle: List[Any] = []
+        self._in_use: Dict[int, Dict[str, Any]] = {}
+        # idle + in use + connections being opened right now
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._counters = {"created": 0, "acquired": 0, "timeouts": 0, "discarded": 0, "leaked": 0}
+        self._max_wait = 0.0
+
+    def open(self) -> None:
+        with self._cond:
+            self._closed = False
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._factory()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                logger.warning(f"Database pool warm-up failed: {e}")
+                return
+            with self._cond:
+                self._counters["created"] += 1
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def acquire(self, owner: str = "", timeout: Optional[float] = None):
+        timeout = self.acquire_timeout if timeout is None else float(timeout)
+        started = time.monotonic()
+        deadline = started + timeout
+        conn = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.OperationalError("Connection pool is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    if conn.closed:
+                        self._size -= 1
+                        self._counters["discarded"] += 1
+                        conn = None
+                        continue
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"Timed out after {timeout:.1f}s waiting for a database connection"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if conn is None:
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self._in_use[id(conn)] = {"conn": conn, "owner": owner, "since": time.monotonic()}
+            self._counters["acquired"] += 1
+            self._max_wait = max(self._max_wait, time.monotonic() - started)
+        return conn
+
+    def release(self, conn, leaked: bool = False) -> None:
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+            if entry is None:
+                return
+            if leaked:
+                self._counters["leaked"] += 1
+                held = time.monotonic() - entry["since"]
+                logger.warning(
+                    f"DB connection acquired by {entry['owner'] or 'unknown'} was never released "
+                    f"(held {held:.1f}s), returning it to the pool"
+                )
+            discard = self._closed
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._counters["discarded"] += 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+        if discard:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def find_leaks(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {"owner": e["owner"], "held_s": round(now - e["since"], 3)}
+                for e in self._in_use.values()
+                if now - e["since"] >= self.leak_timeout
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            oldest = min((e["since"] for e in self._in_use.values()), default=None)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                **self._counters,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "oldest_checkout_s": round(now - oldest, 3) if oldest is not None else None,
+                "closed": self._closed,
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Соединение пула, помнящее, какие запросы на нём уже подготовлены"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class StatementRegistry:
+    """Реестр горячих запросов: PREPARE один раз на соединение, дальше EXECUTE по имени.
+
+    Запросы ищутся по нормализованному тексту, поэтому вызывающий код
+    продолжает передавать в execute_query обычный SQL с %s.
+    """
+
     def __init__(self):
-        self.pool = None
-    
+        self._by_sql: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(sql: str) -> str:
+        return " ".join(sql.split())
+
+    def register(self, name: str, sql: str) -> str:
+        text = self.normalize(sql)
+        n_params = text.count("%s")
+        pg_text = text
+        for i in range(1, n_params + 1):
+            pg_text = pg_text.replace("%s", f"${i}", 1)
+        execute = f"EXECUTE {name}"
+        if n_params:
+            execute += " (" + ", ".join(["%s"] * n_params) + ")"
+        self._by_sql[text] = {
+            "name": name,
+            "prepare": f"PREPARE {name} AS {pg_text}",
+            "execute": execute,
+            "hits": 0,
+            "misses": 0,
+        }
+        return sql
+
+    def lookup(self, sql: str) -> Optional[Dict[str, Any]]:
+        return self._by_sql.get(self.normalize(sql))
+
+    def record(self, stmt: Dict[str, Any], hit: bool) -> None:
+        with self._lock:
+            stmt["hits" if hit else "misses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_statement = {s["name"]: {"hits": s["hits"], "misses": s["misses"]} for s in self._by_sql.values()}
+        hits = sum(v["hits"] for v in per_statement.values())
+        misses = sum(v["misses"] for v in per_statement.values())
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+            "statements": per_statement,
+        }
+
+
+statements = StatementRegistry()
+
+SQL_USER_ID_BY_WALLET = statements.register(
+    "user_id_by_wallet",
+    "SELECT id FROM users WHERE wallet_address = %s",
+)
+SQL_LEADERBOARD_DEBIT = statements.register(
+    "leaderboard_debit",
+    "UPDATE leaderboard "
+    "SET points = points - %s "
+    "WHERE user_id = %s AND points >= %s "
+    "RETURNING points, wins, losses",
+)
+# Весь логин одним атомарным запросом: upsert пользователя, стартовые токены и
+# строка лидерборда. ON CONFLICT DO NOTHING достраивает аккаунты, которые
+# раньше остались без user_tokens/leaderboard; xmax = 0 только у новой строки.
+SQL_USER_LOGIN = statements.register(
+    "user_login",
+    """
+    WITH u AS (
+        INSERT INTO users (wallet_address, created_at, last_login)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (wallet_address)
+        DO UPDATE SET last_login = EXCLUDED.last_login
+        RETURNING id, wallet_address, username, avatar_url, created_at, last_login,
+                  (xmax = 0) AS is_new
+    ), t AS (
+        INSERT INTO user_tokens (user_id, balance)
+        SELECT id, 100000 FROM u
+        ON CONFLICT (user_id) DO NOTHING
+    ), l AS (
+        INSERT INTO leaderboard (user_id)
+        SELECT id FROM u
+        ON CONFLICT (user_id) DO NOTHING
+    )
+    SELECT id, wallet_address, username, avatar_url, created_at, last_login, is_new FROM u
+    """,
+)
+
+
+class QueryStats:
+    """Статистика по нормализованным запросам: гистограмма латентности,
+    строки, ошибки, откаты и журнал медленных запросов.
+    """
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    MAX_STATEMENTS = 500
+    OVERFLOW_KEY = "<other>"
+
+    _STRING_RE = re.compile(r"'(?:[^']|'')*'")
+    _NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+    _PARAM_RE = re.compile(r"%s|\$\d+")
+    _LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+
+    def __init__(self, slow_ms: float, slow_log_size: int):
+        self.slow_ms = slow_ms
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._slow = deque(maxlen=max(1, slow_log_size))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, sql: str) -> str:
+        """Литералы и параметры -> ?, списки VALUES/IN любой длины -> (...)"""
+        text = cls._STRING_RE.sub("?", sql)
+        text = cls._PARAM_RE.sub("?", text)
+        text = cls._NUMBER_RE.sub("?", text)
+        text = cls._LIST_RE.sub("(...)", text)
+        return " ".join(text.split())
+
+    def _entry(self, key: str) -> Dict[str, Any]:
+        entry = self._stats.get(key)
+        if entry is None:
+            if len(self._stats) >= self.MAX_STATEMENTS:
+                key = self.OVERFLOW_KEY
+                entry = self._stats.get(key)
+            if entry is None:
+                entry = {
+                    "calls": 0,
+                    "errors": 0,
+                    "rollbacks": 0,
+                    "rows": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "buckets": [0] * (len(self.BUCKETS_MS) + 1),
+                }
+                self._stats[key] = entry
+        return entry
+
+    def record(self, sql: str, elapsed_ms: float, rows: int = 0, error: bool = False, rollback: bool = False) -> None:
+        key = self.normalize(sql)
+        bucket = len(self.BUCKETS_MS)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        with self._lock:
+            entry = self._entry(key)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["rollbacks"] += int(rollback)
+            entry["rows"] += max(rows, 0)
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["buckets"][bucket] += 1
+            slow = self.slow_ms > 0 and elapsed_ms >= self.slow_ms
+            if slow:
+                self._slow.append({
+                    "statement": key,
+                    "ms": round(elapsed_ms, 3),
+                    "rows": rows,
+                    "error": error,
+                    "at": datetime.utcnow().isoformat() + "Z",
+                })
+        if slow:
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms, rows={rows}): {key[:500]}")
+
+    def _percentile(self, buckets: List[int], q: float) -> Optional[float]:
+        total = sum(buckets)
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for i, count in enumerate(buckets):
+            seen += count
+            if seen >= target:
+                return float(self.BUCKETS_MS[i]) if i < len(self.BUCKETS_MS) else None
+        return None
+
+    def _view(self, key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        calls = entry["calls"]
+        bounds = [str(b) for b in self.BUCKETS_MS] + ["inf"]
+        return {
+            "statement": key,
+            "calls": calls,
+            "errors": entry["errors"],
+            "rollbacks": entry["rollbacks"],
+            "rows": entry["rows"],
+            "rows_per_call": round(entry["rows"] / calls, 2) if calls else 0,
+            "total_ms": round(entry["total_ms"], 3),
+            "mean_ms": round(entry["total_ms"] / calls, 3) if calls else 0,
+            "max_ms": round(entry["max_ms"], 3),
+            # Верхняя граница корзины; None - хвост за последней границей
+            "p50_ms": self._percentile(entry["buckets"], 0.5),
+            "p95_ms": self._percentile(entry["buckets"], 0.95),
+            "histogram_ms": dict(zip(bounds, entry["buckets"])),
+        }
+
+    def snapshot(self, sort: str = "total_ms", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [self._view(k, {**v, "buckets": list(v["buckets"])}) for k, v in self._stats.items()]
+        rows.sort(key=lambda r: r.get(sort) or 0, reverse=True)
+        return rows[:limit] if limit else rows
+
+    def get(self, sql: str) -> Optional[Dict[str, Any]]:
+        key = self.normalize(sql)
+        with self._lock:
+            entry = self._stats.get(key)
+            return self._view(key, {**entry, "buckets": list(entry["buckets"])}) if entry else None
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._slow)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+query_stats = QueryStats(settings.db_slow_query_ms, settings.db_slow_query_log_size)
+
+
+# application_name соединений этого процесса: по нему воркер узнаёт свои NOTIFY
+WORKER_ID = f"worldbinder-{os.getpid()}-{secrets.token_hex(4)}"
+
+
+def _connect_primary():
+    return psycopg2.connect(
+        host=settings.db_host,
+        port=settings.db_port,
+        database=settings.db_name,
+        user=settings.db_user,
+        password=settings.db_password,
+        connect_timeout=settings.db_connect_timeout,
+        application_name=WORKER_ID,
+        connection_factory=PooledConnection,
+        cursor_factory=RealDictCursor,
+    )
+
+
+def _connect_replica():
+    conn = psycopg2.connect(
+        settings.db_replica_dsn,
+        connect_timeout=settings.db_connect_timeout,
+        connection_factory=PooledConnection,
+        cursor_factory=RealDictCursor,
+    )
+    # Guard against a DSN that accidentally points at a writable primary
+    conn.set_session(readonly=True)
+    return conn
+
+
+db_pool = ConnectionPool(
+    _connect_primary,
+    min_size=settings.db_pool_min_size,
+    max_size=settings.db_pool_max_size,
+    acquire_timeout=settings.db_pool_acquire_timeout,
+    leak_timeout=settings.db_pool_leak_timeout,
+)
+
+replica_pool: Optional[ConnectionPool] = None
+if settings.db_replica_dsn:
+    replica_pool = ConnectionPool(
+        _connect_replica,
+        min_size=0,
+        max_size=settings.db_replica_pool_max_size,
+        acquire_timeout=settings.db_pool_acquire_timeout,
+        leak_timeout=settings.db_pool_leak_timeout,
+    )
+
+
+class ReplicaRouter:
+    """Маршрутизация read-only запросов между репликой и primary.
+
+    После собственной записи пользователя его чтения в течение
+    window_seconds идут на primary (read-your-writes), чтобы не увидеть
+    отставшую реплику.
+    """
+
+    def __init__(self, window_seconds: float = 5.0):
+        self.window = max(0.0, float(window_seconds))
+        self._recent_writes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.replica_fallbacks = 0
+
+    def note_write(self, user: Optional[str]) -> None:
+        if not user or self.window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[user] = now + self.window
+            if len(self._recent_writes) > 10000:
+                self._recent_writes = {k: v for k, v in self._recent_writes.items() if v > now}
+
+    def read_from_primary(self, user: Optional[str]) -> bool:
+        if not user:
+            return False
+        with self._lock:
+            until = self._recent_writes.get(user)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._recent_writes[user]
+                return False
+            return True
+
+    def record(self, replica: bool) -> None:
+        with self._lock:
+            if replica:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+
+    def record_fallback(self) -> None:
+        with self._lock:
+            self.replica_fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replica_configured": replica_pool is not None,
+                "read_your_writes_seconds": self.window,
+                "pinned_users": len(self._recent_writes),
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "replica_fallbacks": self.replica_fallbacks,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._recent_writes.clear()
+
+
+replica_router = ReplicaRouter(settings.db_read_your_writes_seconds)
+
+
+def _is_read_query(query: str) -> bool:
+    return query.lstrip().lower().startswith("select")
+
+
+class Database:
+    """Соединение, взятое из пула на время одного запроса.
+
+    close() возвращает соединение в пул; если его забыли вызвать,
+    соединение вернётся из __del__ и будет учтено как утечка.
+    read_only=True отправляет запросы на реплику (если она настроена),
+    user - ключ пользователя для read-your-writes.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None, *, read_only: bool = False, user: Optional[str] = None):
+        self._explicit_pool = pool
+        self._pool = pool or db_pool
+        self._owner = sys._getframe(1).f_code.co_name
+        self.read_only = read_only
+        self.user = user
+        self.conn = None
+
     def connect(self):
+        if self.conn is not None:
+            return
         try:
-            self.pool = psycopg2.connect(
-                host=settings.db_host,
-                port=settings.db_port,
-                database=settings.db_name,
-                user=settings.db_user,
-                password=settings.db_password,
-                cursor_factory=RealDictCursor
-            )
-            logger.info("Database connected successfully")
+            if self._explicit_pool is None and self.read_only:
+                self._connect_for_read()
+            else:
+                self.conn = self._pool.acquire(owner=self._owner)
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             raise
-    
+
+    def _connect_for_read(self):
+        if replica_pool is not None and not replica_router.read_from_primary(self.user):
+            try:
+                self.conn = replica_pool.acquire(owner=self._owner)
+                self._pool = replica_pool
+                replica_router.record(replica=True)
+                return
+            except Exception as e:
+                replica_router.record_fallback()
+                logger.warning(f"Replica unavailable, reading from primary: {e}")
+        self._pool = db_pool
+        self.conn = db_pool.acquire(owner=self._owner)
+        replica_router.record(replica=False)
+
     def execute_query(self, query: str, params: tuple = None, fetch: str = "all"):
+        stmt = statements.lookup(query)
+        prepared = None
+        started = None
         try:
-            if not self.pool:
+            if self.conn is None:
                 self.connect()
-            with self.pool.cursor() as cursor:
-                cursor.execute(query, params)
+            prepared = getattr(self.conn, "prepared", None)
+            with self.conn.cursor() as cursor:
+                started = time.perf_counter()
+                if stmt is not None and prepared is not None:
+                    hit = stmt["name"] in prepared
+                    if not hit:
+                        cursor.execute(stmt["prepare"])
+                        prepared.add(stmt["name"])
+                    statements.record(stmt, hit=hit)
+                    cursor.execute(stmt["execute"], params)
+                else:
+                    cursor.execute(query, params)
                 
                 if fetch == "one":
                     result = cursor.fetchone()
@@ -193,21 +864,843 @@ class Database:
                 elif fetch == "none":
                     result = None
                 
-                self.pool.commit()
+                self.conn.commit()
+                if fetch == "all":
+                    rows = len(result)
+                elif fetch == "one":
+                    rows = int(result is not None)
+                else:
+                    rows = cursor.rowcount
+                query_stats.record(query, (time.perf_counter() - started) * 1000, rows=rows)
+                if self.user and not self.read_only and not _is_read_query(query):
+                    replica_router.note_write(self.user)
                 return result
         except Exception as e:
-            if self.pool:
-                self.pool.rollback()
+            if stmt is not None and prepared is not None:
+                # Keep the per-connection bookkeeping in sync with the server
+                if isinstance(e, psycopg2.errors.InvalidSqlStatementName):
+                    prepared.discard(stmt["name"])
+                elif isinstance(e, psycopg2.errors.DuplicatePreparedStatement):
+                    prepared.add(stmt["name"])
+            rolled_back = False
+            if self.conn is not None and not self.conn.closed:
+                self.conn.rollback()
+                rolled_back = True
+            if started is not None:
+                query_stats.record(
+                    query, (time.perf_counter() - started) * 1000, error=True, rollback=rolled_back
+                )
             logger.error(f"Database query error: {e}")
             raise
     
     def __del__(self):
-        if self.pool:
-            self.pool.close()
+        conn = getattr(self, "conn", None)
+        if conn is not None:
+            try:
+                self._pool.release(conn, leaked=True)
+            except Exception:
+                pass
     
     def close(self):
-        if self.pool:
-            self.pool.close()
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            self._pool.release(conn)
+
+
+# psycopg2 is synchronous: every call goes through a bounded thread pool so a
+# slow query only occupies one worker thread instead of the whole event loop.
+_db_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    global _db_executor
+    if _db_executor is None:
+        _db_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.db_executor_workers),
+            thread_name_prefix="db",
+        )
+    return _db_executor
+
+
+def _shutdown_db_executor() -> None:
+    global _db_executor
+    if _db_executor is not None:
+        _db_executor.shutdown(wait=True)
+        _db_executor = None
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполнение блокирующего вызова БД (connect/execute_query) вне event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+SQL_LEADERBOARD_APPLY_BATCH = (
+    "UPDATE leaderboard AS l "
+    "SET points = l.points + v.points, wins = l.wins + v.wins, losses = l.losses + v.losses "
+    "FROM (VALUES {values}) AS v(user_id, points, wins, losses) "
+    "WHERE l.user_id = v.user_id "
+    "RETURNING l.user_id, l.points, l.wins, l.losses"
+)
+
+
+class LeaderboardWriter:
+    """Write-behind буфер изменений лидерборда от завершённых боёв.
+
+    Результаты копятся flush_ms миллисекунд и применяются одним
+    UPDATE ... FROM (VALUES ...). Несколько результатов одного игрока
+    в пачке схлопываются в одну строку VALUES, а каждый вызывающий получает
+    состояние строки сразу после своего результата. Пачки применяются
+    строго по очереди, поэтому порядок изменений одного игрока сохраняется.
+    """
+
+    def __init__(self, flush_ms: int = 5, max_batch: int = 500):
+        self.flush_interval = max(0, int(flush_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._pending: List[Tuple[int, int, int, int, asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop = None
+
+    async def submit(self, user_id: int, points: int = 0, wins: int = 0, losses: int = 0) -> Optional[Dict[str, int]]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A previous event loop (tests, reload) may have died with work queued
+            self._loop = loop
+            self._pending = []
+            self._flusher = None
+        fut = loop.create_future()
+        self._pending.append((int(user_id), int(points), int(wins), int(losses), fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = loop.create_task(self._run())
+        return await fut
+
+    async def drain(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            await self._flusher
+
+    async def _run(self) -> None:
+        while self._pending:
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.flush_interval)
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            await self._apply(batch)
+
+    async def _apply(self, batch) -> None:
+        totals: Dict[int, List[int]] = {}
+        for user_id, points, wins, losses, _ in batch:
+            acc = totals.setdefault(user_id, [0, 0, 0])
+            acc[0] += points
+            acc[1] += wins
+            acc[2] += losses
+
+        values = ", ".join(["(%s::int, %s::int, %s::int, %s::int)"] * len(totals))
+        params: List[int] = []
+        for user_id, (points, wins, losses) in totals.items():
+            params.extend((user_id, points, wins, losses))
+
+        db = Database()
+        try:
+            rows = await run_db(
+                db.execute_query, SQL_LEADERBOARD_APPLY_BATCH.format(values=values), tuple(params), fetch="all"
+            )
+        except Exception as e:
+            logger.error(f"Leaderboard batch of {len(batch)} results failed: {e}")
+            for *_, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        _leaderboard_changed()
+        for r in rows or []:
+            rank_index.upsert(r["user_id"], r["points"], r["wins"], r["losses"])
+        state = {
+            int(r["user_id"]): [int(r["points"]), int(r["wins"]), int(r["losses"])]
+            for r in (rows or [])
+        }
+        # Walk backwards: the last result of a user sees the final row, earlier
+        # ones see it with the later deltas peeled off.
+        for user_id, points, wins, losses, fut in reversed(batch):
+            current = state.get(user_id)
+            if fut.done():
+                continue
+            if current is None:
+                fut.set_result(None)
+                continue
+            fut.set_result({"points": current[0], "wins": current[1], "losses": current[2]})
+            current[0] -= points
+            current[1] -= wins
+            current[2] -= losses
+
+
+leaderboard_writer = LeaderboardWriter(settings.leaderboard_flush_ms, settings.leaderboard_batch_max)
+
+
+def _encode_leaderboard_cursor(entry: Dict[str, Any]) -> str:
+    """Непрозрачный курсор keyset-пагинации: позиция (points, wins, user_id)"""
+    raw = f"{int(entry['points'])}:{int(entry['wins'])}:{int(entry['user_id'])}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def _decode_leaderboard_cursor(cursor: str) -> Tuple[int, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        points, wins, user_id = (int(part) for part in raw.split(":"))
+    except Exception:
+        raise ValueError("invalid leaderboard cursor")
+    return points, wins, user_id
+
+
+def _leaderboard_sort_key(entry: Dict[str, Any]) -> Tuple[int, int, int]:
+    return (-int(entry.get("points", 0)), -int(entry.get("wins", 0)), -int(entry.get("user_id", 0)))
+
+
+def _leaderboard_page(entries: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    page = entries[:limit]
+    return {
+        "leaderboard": page,
+        "next": _encode_leaderboard_cursor(page[-1]) if len(page) == limit else None,
+    }
+
+
+# Cache-Control по маршрутам: браузер/CDN переиспользуют ответ max-age секунд,
+# дальше перепроверяют его по ETag (304 без тела и без запроса в БД).
+CACHE_CONTROL = {
+    "leaderboard": "public, max-age=2, stale-while-revalidate=10",
+    "koth": "public, max-age=10, stale-while-revalidate=30",
+    "skills": "public, max-age=300, stale-while-revalidate=3600",
+    "config": "public, max-age=300",
+    "battle_resolved": "private, max-age=86400, immutable",
+    "battle_pending": "no-store",
+}
+
+
+def _strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """If-None-Match (приоритетно) или If-Modified-Since для GET/HEAD"""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    header = request.headers.get("if-none-match")
+    if header is not None:
+        candidates = [c.strip() for c in header.split(",")]
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+    since = request.headers.get("if-modified-since")
+    if since and last_modified is not None:
+        try:
+            return int(last_modified) <= int(parsedate_to_datetime(since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_json_response(
+    request: Request,
+    body: bytes,
+    cache_control: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+) -> Response:
+    """Ответ с валидаторами; на совпавший условный запрос - 304 без тела"""
+    headers = {"ETag": etag or _strong_etag(body), "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    if _not_modified(request, headers["ETag"], last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _json_bytes(payload: Any) -> bytes:
+    return json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+
+
+class JSONSnapshot:
+    """Ответ, заранее сериализованный в JSON-байты, с ETag.
+
+    Пересобирается, только если данные менялись (invalidate) или снимок
+    старше max_age секунд. Одновременные промахи в одном event loop
+    ждут одну и ту же пересборку. С primary_after_invalidate пересборка
+    после invalidate() (и в течение окна read-your-writes) читает primary:
+    реплика может ещё не видеть запись, из-за которой сбросили снимок.
+    """
+
+    def __init__(self, max_age: float = 5.0, primary_after_invalidate: bool = False):
+        self.max_age = float(max_age)
+        self.primary_after_invalidate = primary_after_invalidate
+        self._invalidated_at: Optional[float] = None
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._modified: Optional[float] = None
+        self._built_at = 0.0
+        self._generation = 0
+        self._built_generation = -1
+        self._inflight = None
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "rebuilds": 0, "invalidations": 0}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += 1
+            self._invalidated_at = time.monotonic()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._body = None
+            self._etag = None
+            self._modified = None
+            self._built_generation = -1
+            self._generation += 1
+            self._inflight = None
+            self._invalidated_at = None
+
+    def _fresh(self) -> bool:
+        return (
+            self._body is not None
+            and self._built_generation == self._generation
+            and time.monotonic() - self._built_at < self.max_age
+        )
+
+    async def get(self, loader) -> Tuple[bytes, str, float]:
+        """(тело, ETag, время последнего изменения содержимого)"""
+        with self._lock:
+            if self._fresh():
+                self._counters["hits"] += 1
+                return self._body, self._etag, self._modified
+            inflight = self._inflight
+
+        loop = asyncio.get_running_loop()
+        if inflight is not None and inflight[0] is loop and not inflight[1].done():
+            return await asyncio.shield(inflight[1])
+
+        fut = loop.create_future()
+        self._inflight = (loop, fut)
+        try:
+            result = await self._rebuild(loader)
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # waiters re-raise it; don't log as "never retrieved"
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._inflight is not None and self._inflight[1] is fut:
+                self._inflight = None
+
+    def _read_primary(self) -> bool:
+        if not self.primary_after_invalidate or self._invalidated_at is None:
+            return False
+        # Not rebuilt since the invalidation, or still within the replica lag window
+        return (
+            self._invalidated_at >= self._built_at
+            or time.monotonic() - self._invalidated_at < replica_router.window
+        )
+
+    async def _payload(self, loader, primary: bool = False) -> Any:
+        return await (loader(primary=True) if primary else loader())
+
+    async def _rebuild(self, loader) -> Tuple[bytes, str, float]:
+        with self._lock:
+            generation = self._generation
+            primary = self._read_primary()
+        body = _json_bytes(await self._payload(loader, primary))
+        etag = _strong_etag(body)
+        with self._lock:
+            self._counters["rebuilds"] += 1
+            # An identical rebuild keeps its Last-Modified
+            modified = self._modified if etag == self._etag and self._modified else time.time()
+            if generation >= self._built_generation:
+                self._body, self._etag, self._modified = body, etag, modified
+                self._built_at = time.monotonic()
+                self._built_generation = generation
+        return body, etag, modified
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "fresh": self._fresh(),
+                "age_s": round(time.monotonic() - self._built_at, 3) if self._body is not None else None,
+                "bytes": len(self._body) if self._body is not None else 0,
+            }
+
+
+class LeaderboardSnapshot(JSONSnapshot):
+    """Первая страница лидерборда (топ limit игроков)"""
+
+    def __init__(self, limit: int = 100, max_age: float = 5.0):
+        super().__init__(max_age, primary_after_invalidate=True)
+        self.limit = max(1, int(limit))
+
+    async def _payload(self, loader, primary: bool = False) -> Dict[str, Any]:
+        rows = await (loader(self.limit, primary=True) if primary else loader(self.limit))
+        entries = [dict(e) for e in (rows or [])]
+        # Defense-in-depth: enforce contract even if DB returns unsorted data
+        entries.sort(key=_leaderboard_sort_key)
+        return _leaderboard_page(entries, self.limit)
+
+
+leaderboard_snapshot = LeaderboardSnapshot(settings.leaderboard_size, settings.leaderboard_snapshot_max_age)
+
+
+class _RankNode:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        # width[i] - сколько позиций перескакивает ссылка next[i]
+        self.width = [0] * level
+
+
+class RankIndex:
+    """Индексируемый skip list игроков в порядке лидерборда.
+
+    Ключ (-points, -wins, -user_id): больше очков -> выше, при равенстве
+    больше побед, затем больший user_id. Позиция игрока, выборка соседей
+    и изменение очков - O(log n) в среднем.
+    """
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._scores: Dict[int, Tuple[int, int, int]] = {}
+        self._touched: set = set()
+        self._loading = False
+        self._inflight = None
+        self.loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._head = _RankNode(None, self.MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._scores.clear()
+
+    @staticmethod
+    def _key(user_id: int, points: int, wins: int) -> Tuple[int, int, int]:
+        return (-points, -wins, -user_id)
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _insert(self, key) -> None:
+        update = [self._head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = rank[i + 1] if i + 1 < self._level else 0
+            while x.next[i] is not None and x.next[i].key < key:
+                rank[i] += x.width[i]
+                x = x.next[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.width[i] = self._size
+            self._level = level
+
+        node = _RankNode(key, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def _delete(self, key) -> bool:
+        update = [self._head] * self.MAX_LEVEL
+        x = self._head
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key < key:
+                x = x.next[i]
+            update[i] = x
+        x = x.next[0]
+        if x is None or x.key != key:
+            return False
+        for i in range(self._level):
+            if update[i].next[i] is x:
+                update[i].width[i] += x.width[i] - 1
+                update[i].next[i] = x.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+        return True
+
+    def _rank(self, key) -> Optional[int]:
+        x = self._head
+        traversed = 0
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and x.next[i].key <= key:
+                traversed += x.width[i]
+                x = x.next[i]
+            if x.key == key:
+                return traversed
+        return None
+
+    def _node_at(self, rank: int) -> Optional[_RankNode]:
+        x = self._head
+        traversed = 0
+        for i in reversed(range(self._level)):
+            while x.next[i] is not None and traversed + x.width[i] <= rank:
+                traversed += x.width[i]
+                x = x.next[i]
+            if traversed == rank:
+                return x
+        return None
+
+    def _entry(self, node: _RankNode, rank: int) -> Dict[str, int]:
+        user_id = -node.key[2]
+        points, wins, losses = self._scores[user_id]
+        return {"rank": rank, "user_id": user_id, "points": points, "wins": wins, "losses": losses}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, user_id: int) -> bool:
+        return int(user_id) in self._scores
+
+    def upsert(self, user_id: int, points: int, wins: int, losses: int = 0) -> None:
+        user_id, points, wins, losses = int(user_id), int(points), int(wins), int(losses)
+        with self._lock:
+            if self._loading:
+                self._touched.add(user_id)
+            old = self._scores.get(user_id)
+            if old is not None:
+                if old[:2] == (points, wins):
+                    self._scores[user_id] = (points, wins, losses)
+                    return
+                self._delete(self._key(user_id, old[0], old[1]))
+            self._insert(self._key(user_id, points, wins))
+            self._scores[user_id] = (points, wins, losses)
+
+    def upsert_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Пачка upsert под одной блокировкой (из потока: на event loop это долго)"""
+        with self._lock:
+            for r in rows:
+                self.upsert(r["user_id"], r["points"], r["wins"], r["losses"])
+
+    def remove(self, user_id: int) -> bool:
+        user_id = int(user_id)
+        with self._lock:
+            if self._loading:
+                self._touched.add(user_id)
+            old = self._scores.pop(user_id, None)
+            if old is None:
+                return False
+            return self._delete(self._key(user_id, old[0], old[1]))
+
+    def rank_of(self, user_id: int) -> Optional[Dict[str, int]]:
+        """Позиция игрока (с 1) и его счёт"""
+        user_id = int(user_id)
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            rank = self._rank(self._key(user_id, score[0], score[1]))
+            return {"rank": rank, "user_id": user_id, "points": score[0], "wins": score[1], "losses": score[2]}
+
+    def page(self, start_rank: int, count: int) -> List[Dict[str, int]]:
+        """count игроков начиная с позиции start_rank (с 1)"""
+        with self._lock:
+            start_rank = max(1, int(start_rank))
+            node = self._node_at(start_rank)
+            out = []
+            rank = start_rank
+            while node is not None and len(out) < count:
+                out.append(self._entry(node, rank))
+                node = node.next[0]
+                rank += 1
+            return out
+
+    def around(self, user_id: int, radius: int) -> List[Dict[str, int]]:
+        with self._lock:
+            me = self.rank_of(user_id)
+            if me is None:
+                return []
+            start = max(1, me["rank"] - radius)
+            return self.page(start, me["rank"] - start + radius + 1)
+
+    def _build(self, scores: Dict[int, Tuple[int, int, int]]) -> None:
+        """Построение за O(n) из уже отсортированных ключей (без вставок по одному)"""
+        self._reset()
+        last = [self._head] * self.MAX_LEVEL
+        last_pos = [0] * self.MAX_LEVEL
+        keys = sorted(self._key(uid, p, w) for uid, (p, w, _) in scores.items())
+        for pos, key in enumerate(keys, start=1):
+            level = self._random_level()
+            node = _RankNode(key, level)
+            for i in range(level):
+                last[i].next[i] = node
+                last[i].width[i] = pos - last_pos[i]
+                last[i] = node
+                last_pos[i] = pos
+            self._level = max(self._level, level)
+        for i in range(self.MAX_LEVEL):
+            last[i].width[i] = len(keys) - last_pos[i]
+        self._size = len(keys)
+        self._scores.update(scores)
+
+    async def ensure_loaded(self, load_page, page_size: int, force: bool = False) -> None:
+        """Однократная загрузка всей таблицы страницами по user_id.
+
+        Индекс строится в отдельном потоке и подменяет текущий целиком;
+        изменения, пришедшие во время загрузки, затем применяются поверх.
+        force=True - пересинхронизация: до подмены читатели видят прежний индекс.
+        """
+        if self.loaded and not force:
+            return
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight
+        if inflight is not None and inflight[0] is loop and not inflight[1].done():
+            return await asyncio.shield(inflight[1])
+
+        fut = loop.create_future()
+        self._inflight = (loop, fut)
+        with self._lock:
+            self._loading = True
+            self._touched = set()
+        try:
+            scores: Dict[int, Tuple[int, int, int]] = {}
+            after = 0
+            while True:
+                rows = await load_page(after, page_size)
+                if not rows:
+                    break
+                for r in rows:
+                    scores[int(r["user_id"])] = (
+                        int(r.get("points") or 0), int(r.get("wins") or 0), int(r.get("losses") or 0)
+                    )
+                after = int(rows[-1]["user_id"])
+                if len(rows) < page_size:
+                    break
+
+            fresh = RankIndex()
+            await loop.run_in_executor(None, fresh._build, scores)
+            with self._lock:
+                live, touched = self._scores, self._touched
+                self._head, self._level, self._size = fresh._head, fresh._level, fresh._size
+                self._scores = fresh._scores
+                self._loading = False
+                for user_id in touched:
+                    if user_id in live:
+                        self.upsert(user_id, *live[user_id])
+                    else:
+                        self.remove(user_id)
+                self.loaded = True
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()
+            raise
+        else:
+            fut.set_result(None)
+        finally:
+            with self._lock:
+                self._loading = False
+                self._touched = set()
+            if self._inflight is not None and self._inflight[1] is fut:
+                self._inflight = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self.loaded = False
+            self._loading = False
+            self._touched = set()
+            self._inflight = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"players": self._size, "levels": self._level, "loaded": self.loaded}
+
+
+rank_index = RankIndex()
+
+
+class _StreamSubscriber:
+    __slots__ = ("queue",)
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+
+class LeaderboardBroadcaster:
+    """Рассылка живого топа лидерборда подписчикам SSE.
+
+    При подключении - полный снимок, дальше только изменения: изменения
+    за тик схлопываются, топ перечитывается один раз, и один заранее
+    закодированный кадр раздаётся всем подписчикам. Подписчик, чья очередь
+    переполнена, отключается и при переподключении получит свежий снимок.
+    """
+
+    def __init__(self, top_n: int, tick_ms: int, queue_size: int, max_subscribers: int):
+        self.top_n = max(1, int(top_n))
+        self.tick = max(0, int(tick_ms)) / 1000.0
+        self.queue_size = max(1, int(queue_size))
+        self.max_subscribers = max(1, int(max_subscribers))
+        self._subscribers: set = set()
+        self._top: List[Dict[str, Any]] = []
+        self._seq = 0
+        self._snapshot_frame: Optional[bytes] = None
+        self._dirty = False
+        self._ticker: Optional[asyncio.Task] = None
+        self._loop = None
+        self._counters = {"refreshes": 0, "diffs": 0, "dropped": 0}
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    @staticmethod
+    def _frame(event: str, seq: int, payload: Dict[str, Any]) -> bytes:
+        data = json.dumps(jsonable_encoder(payload), separators=(",", ":"))
+        return f"id: {seq}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+    @staticmethod
+    def _diff(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+        before = {int(e["user_id"]): (rank, e) for rank, e in enumerate(old, start=1)}
+        changed = []
+        for rank, e in enumerate(new, start=1):
+            user_id = int(e["user_id"])
+            prev = before.pop(user_id, None)
+            if prev is None:
+                changed.append({
+                    "u": user_id, "r": rank, "p": e["points"], "w": e["wins"], "l": e["losses"],
+                    "n": e.get("username"), "a": e.get("wallet_address"),
+                })
+                continue
+            prev_rank, prev_e = prev
+            delta = {"u": user_id, "r": rank}
+            for short, field in (("p", "points"), ("w", "wins"), ("l", "losses"), ("n", "username")):
+                if prev_e.get(field) != e.get(field):
+                    delta[short] = e.get(field)
+            if len(delta) > 2 or prev_rank != rank:
+                changed.append(delta)
+        return changed, sorted(before)
+
+    async def _refresh(self, loader) -> None:
+        # Refreshes follow a primary commit; a lagging replica would return the
+        # old top, produce an empty diff and swallow the update
+        entries = [dict(e) for e in (await loader(self.top_n, primary=True) or [])]
+        entries.sort(key=_leaderboard_sort_key)
+        top = [
+            {k: e.get(k) for k in ("user_id", "points", "wins", "losses", "username", "wallet_address")}
+            for e in entries[:self.top_n]
+        ]
+        self._counters["refreshes"] += 1
+        changed, removed = self._diff(self._top, top)
+        initial = self._snapshot_frame is None
+        if not initial and not changed and not removed:
+            return
+        self._top = top
+        self._seq += 1
+        self._snapshot_frame = self._frame("snapshot", self._seq, {"seq": self._seq, "leaderboard": top})
+        if not initial:
+            self._counters["diffs"] += 1
+            self._publish(self._frame("diff", self._seq, {"seq": self._seq, "changed": changed, "removed": removed}))
+
+    def _publish(self, frame: bytes) -> None:
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: _StreamSubscriber) -> None:
+        self._subscribers.discard(sub)
+        self._counters["dropped"] += 1
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    async def subscribe(self, loader) -> _StreamSubscriber:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Subscribers and the ticker belong to one event loop
+            self._loop = loop
+            self._subscribers = set()
+            self._ticker = None
+        if self._snapshot_frame is None or (self._dirty and not self._ticker_running()):
+            self._dirty = False
+            await self._refresh(loader)
+        sub = _StreamSubscriber(self.queue_size)
+        sub.queue.put_nowait(self._snapshot_frame)
+        self._subscribers.add(sub)
+        if not self._ticker_running():
+            self._ticker = loop.create_task(self._run(loader))
+        return sub
+
+    def unsubscribe(self, sub: _StreamSubscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def _ticker_running(self) -> bool:
+        return self._ticker is not None and not self._ticker.done()
+
+    async def _run(self, loader) -> None:
+        while self._subscribers:
+            await asyncio.sleep(self.tick)
+            if not self._dirty:
+                continue
+            self._dirty = False
+            try:
+                await self._refresh(loader)
+            except Exception as e:
+                self._dirty = True
+                logger.error(f"Leaderboard stream refresh failed: {e}")
+
+    def reset(self) -> None:
+        if self._ticker_running():
+            self._ticker.cancel()
+        self._ticker = None
+        self._loop = None
+        self._subscribers = set()
+        self._top = []
+        self._snapshot_frame = None
+        self._dirty = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "subscribers": len(self._subscribers), "seq": self._seq}
+
+
+leaderboard_broadcaster = LeaderboardBroadcaster(
+    settings.leaderboard_size,
+    settings.leaderboard_stream_tick_ms,
+    settings.leaderboard_stream_queue_size,
+    settings.leaderboard_stream_max_subscribers,
+)
+
+
+koth_snapshot = JSONSnapshot(settings.koth_cache_seconds, primary_after_invalidate=True)
+
+
+LEADERBOARD_NOTIFY_CHANNEL = "leaderboard_changed"
+
+
+def _leaderboard_changed() -> None:
+    """Очки изменились: сбросить снимки и разбудить рассылку"""
+    leaderboard_snapshot.invalidate()
+    koth_snapshot.invalidate()
+    leaderboard_broadcaster.mark_dirty()
 
 # Утилиты безопасности
 class SecurityUtils:
@@ -283,71 +1776,435 @@ class SecurityUtils:
         )
 
 
-async def _helius_get_assets_by_owner(owner: str) -> Dict[str, Any]:
-    api_key = settings.helius_api_key
-    if not api_key:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Helius API key not configured")
+# Исходящие RPC (Helius, Solana) идут через долгоживущие httpx-клиенты:
+# по одному на хост, со своим пулом keep-alive соединений, поэтому TLS
+# рукопожатие платится один раз, а не на каждый вызов.
+class UpstreamStats:
+    """Латентность исходящих вызовов по «хост метод»"""
 
-    url = f"https://mainnet.helius-rpc.com/?api-key={api_key}"
-    payload = {
-        "jsonrpc": "2.0",
-        "id": "scan",
-        "method": "getAssetsByOwner",
-        "params": {
-            "ownerAddress": owner,
-            "page": 1,
-            "limit": 100,
-        },
-    }
+    BUCKETS_MS = QueryStats.BUCKETS_MS
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.post(url, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-    return data
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, host: str, method: str, elapsed_ms: float, error: bool = False) -> None:
+        bucket = next((i for i, bound in enumerate(self.BUCKETS_MS) if elapsed_ms <= bound), len(self.BUCKETS_MS))
+        with self._lock:
+            entry = self._stats.setdefault(f"{host} {method}", {
+                "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "buckets": [0] * (len(self.BUCKETS_MS) + 1),
+            })
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["buckets"][bucket] += 1
+
+    def _percentile(self, buckets: List[int], q: float) -> Optional[float]:
+        target, seen = q * sum(buckets), 0
+        for i, count in enumerate(buckets):
+            seen += count
+            if count and seen >= target:
+                return float(self.BUCKETS_MS[i]) if i < len(self.BUCKETS_MS) else None
+        return None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(k, {**v, "buckets": list(v["buckets"])}) for k, v in self._stats.items()]
+        items.sort(key=lambda kv: kv[1]["total_ms"], reverse=True)
+        return [
+            {
+                "call": key,
+                "calls": e["calls"],
+                "errors": e["errors"],
+                "mean_ms": round(e["total_ms"] / e["calls"], 3) if e["calls"] else 0,
+                "max_ms": round(e["max_ms"], 3),
+                "p50_ms": self._percentile(e["buckets"], 0.5),
+                "p95_ms": self._percentile(e["buckets"], 0.95),
+            }
+            for key, e in items
+        ]
 
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
 
-async def _solana_get_token_balance(wallet_address: str, mint: str) -> float:
-    rpc = settings.solana_rpc
-    if not rpc:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SOLANA_RPC not configured")
 
-    payload = {
-        "jsonrpc": "2.0",
-        "id": "bal",
-        "method": "getTokenAccountsByOwner",
-        "params": [
-            wallet_address,
-            {"mint": mint},
-            {"encoding": "jsonParsed"},
-        ],
-    }
+class SingleFlight:
+    """Одновременные вызовы с одинаковым ключом разделяют один вызов.
 
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.post(rpc, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
+    Вызов выполняется отдельной задачей, а участники ждут её через shield:
+    отмена одного запроса (клиент закрыл вкладку) не отменяет вызов для
+    остальных. Результат и ошибка общие для всех; результат только для чтения.
+    """
 
-    result = data.get("result") or {}
-    value = result.get("value") or []
-    if not value:
-        return 0.0
+    def __init__(self):
+        self._inflight: Dict[str, Any] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: str, fn, group: str = "default") -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            counters = self._stats.setdefault(group, {"calls": 0, "executions": 0, "merged": 0})
+            counters["calls"] += 1
+            task = self._inflight.get(key)
+            if task is None or task.done() or task.get_loop() is not loop:
+                counters["executions"] += 1
+                task = loop.create_task(fn())
+                self._inflight[key] = task
+                task.add_done_callback(functools.partial(self._forget, key))
+            else:
+                counters["merged"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task) -> None:
+        with self._lock:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved by the callers; don't log it again
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inflight": len(self._inflight),
+                "groups": {g: {**c, "saved": c["merged"]} for g, c in self._stats.items()},
+            }
 
-    try:
-        info = value[0]["account"]["data"]["parsed"]["info"]
-        token_amount = info["tokenAmount"]
-        ui_amount = token_amount.get("uiAmount")
-        if ui_amount is None:
-            ui_amount = float(token_amount.get("uiAmountString") or 0)
-        return float(ui_amount or 0)
-    except Exception:
-        return 0.0
+    def reset(self) -> None:
+        with self._lock:
+            self._inflight.clear()
+            self._stats.clear()
 
 
-def _compute_attack_bonus(nft_count: int) -> int:
-    if nft_count >= 3:
-        return 20
-    if nft_count == 2:
+class OutboundHTTP:
+    """Общие httpx.AsyncClient по хостам, привязанные к event loop.
+
+    В проде клиенты создаются в lifespan и закрываются при остановке; без
+    lifespan (тесты, скрипты) создаются при первом вызове в текущем loop.
+    """
+
+    def __init__(self, stats: UpstreamStats, flights: Optional[SingleFlight] = None):
+        self.stats = stats
+        self.flights = flights if flights is not None else SingleFlight()
+        self._loop = None
+        self._clients: Dict[str, Any] = {}
+
+    @staticmethod
+    def http2_enabled() -> bool:
+        return settings.http_http2 and h2 is not None
+
+    def _new_client(self):
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                connect=settings.http_connect_timeout,
+                read=settings.http_read_timeout,
+                write=settings.http_read_timeout,
+                pool=settings.http_pool_timeout,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections_per_host,
+                max_keepalive_connections=settings.http_max_keepalive_per_host,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            http2=self.http2_enabled(),
+        )
+
+    def client(self, url: str):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Clients are bound to the loop that opened their connections
+            self._clients = {}
+            self._loop = loop
+        host = urllib.parse.urlsplit(url).netloc
+        client = self._clients.get(host)
+        if client is None:
+            client = self._clients[host] = self._new_client()
+        return client
+
+    async def rpc(self, url: str, method: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON-RPC POST; одинаковые одновременные вызовы (те же URL, метод и
+        params) объединяются в один"""
+        key = json.dumps([url, method, payload.get("params")], sort_keys=True, separators=(",", ":"))
+        return await self.flights.do(key, functools.partial(self._post, url, method, payload), group=method)
+
+    async def rpc_batch(self, url: str, method: str, payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """JSON-RPC batch: все payloads одним POST, ответы в порядке payloads.
+
+        ValueError, если узел не поддерживает batch: ответ - не массив или
+        4xx на сам POST (кроме 429 - это лимит, а не отказ от batch).
+        """
+        try:
+            data = await self._post(url, f"{method}[batch]", payloads)
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
+            if 400 <= code < 500 and code != 429:
+                raise ValueError(
+                    f"JSON-RPC batch refused by {urllib.parse.urlsplit(url).hostname} ({code})"
+                ) from e
+            raise
+        if not isinstance(data, list):
+            raise ValueError(f"JSON-RPC batch not supported by {urllib.parse.urlsplit(url).hostname}")
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        missing = {"error": {"code": -32603, "message": "No response in batch"}}
+        return [by_id.get(p["id"], missing) for p in payloads]
+
+    async def _post(self, url: str, method: str, payload: Any) -> Any:
+        host = urllib.parse.urlsplit(url).hostname or "?"
+        started = time.perf_counter()
+        error = True
+        try:
+            resp = await self.client(url).post(url, json=payload)
+            resp.raise_for_status()
+            data = resp.json()
+            error = False
+            return data
+        finally:
+            self.stats.record(host, method, (time.perf_counter() - started) * 1000.0, error)
+
+    def open(self, urls: List[str]) -> None:
+        for url in urls:
+            if url:
+                self.client(url)
+
+    async def aclose(self) -> None:
+        clients, self._clients, self._loop = list(self._clients.values()), {}, None
+        for client in clients:
+            await client.aclose()
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2_enabled(),
+            "hosts": sorted(self._clients),
+            "calls": self.stats.snapshot(),
+            "singleflight": self.flights.stats(),
+        }
+
+
+upstream_stats = UpstreamStats()
+rpc_flights = SingleFlight()
+outbound_http = OutboundHTTP(upstream_stats, rpc_flights)
+
+
+async def _helius_get_assets_by_owner(
+    owner: str, page: int = 1, limit: int = 1000, collection: str = ""
+) -> Dict[str, Any]:
+    """Одна страница ассетов кошелька из Helius DAS.
+
+    С collection - searchAssets с фильтром grouping на стороне сервера,
+    без - getAssetsByOwner.
+    """
+    api_key = settings.helius_api_key
+    if not api_key:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Helius API key not configured")
+
+    url = f"{settings.helius_rpc_url}?api-key={api_key}"
+    params: Dict[str, Any] = {"ownerAddress": owner, "page": page, "limit": limit}
+    method = "getAssetsByOwner"
+    if collection:
+        method = "searchAssets"
+        params["grouping"] = ["collection", collection]
+    payload = {"jsonrpc": "2.0", "id": "scan", "method": method, "params": params}
+    return await outbound_http.rpc(url, method, payload)
+
+
+def _in_collection(asset: Dict[str, Any], collection: str) -> bool:
+    grouping = asset.get("grouping") or []
+    return isinstance(grouping, list) and any(
+        isinstance(g, dict) and g.get("group_key") == "collection" and g.get("group_value") == collection
+        for g in grouping
+    )
+
+
+async def _iter_wallet_assets(owner: str, collection: str, want: int):
+    """Ассеты кошелька постранично: следующая страница запрашивается,
+    только когда потребитель дочитал предыдущую.
+
+    С коллекцией сначала пробует серверный фильтр (страница размером want).
+    Если DAS его не поддерживает (ошибка или чужие ассеты в ответе) -
+    обычные страницы getAssetsByOwner по helius_scan_page_size.
+    """
+    server_filter = bool(collection)
+    page = 1
+    while page <= settings.helius_scan_max_pages:
+        limit = max(1, want) if server_filter or not collection else settings.helius_scan_page_size
+        try:
+            data = await _helius_get_assets_by_owner(
+                owner, page=page, limit=limit, collection=collection if server_filter else ""
+            )
+        except httpx.HTTPStatusError:
+            if not server_filter:
+                raise
+            data = {"error": "searchAssets unavailable"}
+        items = [it for it in ((data.get("result") or {}).get("items") or []) if isinstance(it, dict)]
+        if server_filter and (data.get("error") or not all(_in_collection(it, collection) for it in items)):
+            logger.info("DAS searchAssets grouping filter unavailable, paging getAssetsByOwner")
+            server_filter = False
+            page = 1
+            continue
+        for it in items:
+            yield it
+        if len(items) < limit:
+            return
+        page += 1
+    logger.warning(f"Wallet scan for {owner} stopped after {settings.helius_scan_max_pages} pages")
+
+
+def _token_accounts_balance(data: Dict[str, Any]) -> Optional[float]:
+    """Сумма по всем токен-аккаунтам из ответа getTokenAccountsByOwner.
+
+    None - если узел вернул ошибку; суммируются целые amount, чтобы не копить
+    погрешность float.
+    """
+    if data.get("error") is not None:
+        return None
+    raw, decimals, ui = 0, None, 0.0
+    for acc in (data.get("result") or {}).get("value") or []:
+        try:
+            token_amount = acc["account"]["data"]["parsed"]["info"]["tokenAmount"]
+        except (KeyError, TypeError):
+            continue
+        try:
+            raw += int(token_amount["amount"])
+            decimals = int(token_amount["decimals"])
+        except (KeyError, TypeError, ValueError):
+            ui_amount = token_amount.get("uiAmount")
+            if ui_amount is None:
+                ui_amount = float(token_amount.get("uiAmountString") or 0)
+            ui += float(ui_amount or 0)
+    return ui + (raw / 10 ** decimals if decimals is not None else float(raw))
+
+
+def _token_accounts_payload(request_id: Any, wallet_address: str, mint: str) -> Dict[str, Any]:
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": "getTokenAccountsByOwner",
+        "params": [
+            wallet_address,
+            {"mint": mint},
+            {"encoding": "jsonParsed"},
+        ],
+    }
+
+
+async def _solana_get_token_balance(wallet_address: str, mint: str) -> float:
+    rpc = settings.solana_rpc
+    if not rpc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SOLANA_RPC not configured")
+
+    payload = _token_accounts_payload("bal", wallet_address, mint)
+    data = await outbound_http.rpc(rpc, "getTokenAccountsByOwner", payload)
+    return _token_accounts_balance(data) or 0.0
+
+
+async def _solana_get_token_balances(wallets: List[str], mint: str) -> Dict[str, Optional[float]]:
+    """Балансы mint для многих кошельков через JSON-RPC batch.
+
+    Кошельки режутся на батчи по SOLANA_RPC_BATCH_SIZE, одновременно в полёте
+    не больше SOLANA_RPC_BATCH_CONCURRENCY батчей. Если узел не принимает
+    batch, батч добирается одиночными вызовами. None - баланс не получен.
+    """
+    rpc = settings.solana_rpc
+    if not rpc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="SOLANA_RPC not configured")
+
+    unique = list(dict.fromkeys(wallets))
+    size = max(1, settings.solana_rpc_batch_size)
+    gate = asyncio.Semaphore(max(1, settings.solana_rpc_batch_concurrency))
+    balances: Dict[str, Optional[float]] = {}
+
+    async def one(wallet: str) -> Optional[float]:
+        try:
+            data = await outbound_http.rpc(rpc, "getTokenAccountsByOwner", _token_accounts_payload("bal", wallet, mint))
+        except Exception as e:
+            logger.warning(f"Token balance for {wallet} failed: {e}")
+            return None
+        return _token_accounts_balance(data)
+
+    async def run(chunk: List[str]) -> None:
+        async with gate:
+            payloads = [_token_accounts_payload(i, w, mint) for i, w in enumerate(chunk)]
+            try:
+                replies = await outbound_http.rpc_batch(rpc, "getTokenAccountsByOwner", payloads)
+            except ValueError as e:
+                logger.warning(f"{e}; falling back to single calls")
+                for wallet in chunk:
+                    balances[wallet] = await one(wallet)
+                return
+            except Exception as e:
+                logger.warning(f"Token balance batch of {len(chunk)} failed: {e}")
+                replies = [{"error": str(e)}] * len(chunk)
+            for wallet, reply in zip(chunk, replies):
+                balances[wallet] = _token_accounts_balance(reply)
+
+    await asyncio.gather(*(run(unique[i:i + size]) for i in range(0, len(unique), size)))
+    return {w: balances.get(w) for w in unique}
+
+
+NFT_RARITIES = ("Common", "Rare", "Epic", "Legendary")
+
+SQL_USER_NFTS_UPSERT = (
+    "INSERT INTO user_nfts (user_id, mint_address, name, image_url, rarity) "
+    "VALUES {values} "
+    "ON CONFLICT (user_id, mint_address) "
+    "DO UPDATE SET name = EXCLUDED.name, image_url = EXCLUDED.image_url, rarity = EXCLUDED.rarity"
+)
+
+
+async def _upsert_user_nfts(db, user_id: int, nfts: List[Dict[str, Any]]) -> int:
+    """Один многострочный upsert в user_nfts.
+
+    Повторы одного mint внутри пачки схлопываются (побеждает последний),
+    иначе ON CONFLICT попытался бы обновить одну строку дважды.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    for nft in nfts:
+        rows[nft["mint_address"]] = nft
+    if not rows:
+        return 0
+
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    params: List[Any] = []
+    for mint, nft in rows.items():
+        params.extend((user_id, mint, nft["name"], nft["image_url"], nft["rarity"]))
+    await run_db(db.execute_query, SQL_USER_NFTS_UPSERT.format(values=values), tuple(params), fetch="none")
+    return len(rows)
+
+
+def _nft_data_row(nft_data: NFTData) -> Dict[str, Any]:
+    return {
+        "mint_address": nft_data.mintAddress,
+        "name": nft_data.name,
+        "image_url": nft_data.imageUrl,
+        "rarity": nft_data.rarity,
+    }
+
+
+def _scan_nft_rows(nfts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Распарсенные ассеты Helius -> строки user_nfts (с обрезкой под схему)"""
+    rows = []
+    for nft in nfts:
+        mint = nft.get("id")
+        if not isinstance(mint, str) or not mint or len(mint) > 44:
+            continue
+        rarity = nft.get("rarity")
+        image = nft.get("image")
+        rows.append({
+            "mint_address": mint,
+            "name": str(nft.get("name") or "")[:200],
+            "image_url": image[:500] if isinstance(image, str) else None,
+            "rarity": rarity if rarity in NFT_RARITIES else "Common",
+        })
+    return rows
+
+
+def _compute_attack_bonus(nft_count: int) -> int:
+    if nft_count >= 3:
+        return 20
+    if nft_count == 2:
         return 15
     if nft_count == 1:
         return 10
@@ -398,11 +2255,7 @@ async def _solana_get_transaction(signature: str) -> Dict[str, Any]:
         ],
     }
 
-    async with httpx.AsyncClient(timeout=25.0) as client:
-        resp = await client.post(rpc, json=payload)
-        resp.raise_for_status()
-        data = resp.json()
-    return data
+    return await outbound_http.rpc(rpc, "getTransaction", payload)
 
 
 def _tx_has_valid_burn(tx: Dict[str, Any], wallet: str) -> bool:
@@ -505,16 +2358,11 @@ async def _resolve_battle(app: FastAPI, battle_id: str) -> None:
     roll = int.from_bytes(_hmac_sha256(settings.nft_stats_salt.encode("utf-8"), seed), "big") % 10_000
     player_wins = roll >= 7000
 
-    db = Database()
-    db.connect()
     if player_wins:
         payout = int(bet) * 2 + 100
-        update_q = "UPDATE leaderboard SET points = points + %s, wins = wins + 1 WHERE user_id = %s RETURNING points, wins, losses"
-        row = db.execute_query(update_q, (payout, user_id), fetch="one")
+        row = await leaderboard_writer.submit(user_id, points=payout, wins=1)
     else:
-        update_q = "UPDATE leaderboard SET losses = losses + 1 WHERE user_id = %s RETURNING points, wins, losses"
-        row = db.execute_query(update_q, (user_id,), fetch="one")
-    db.close()
+        row = await leaderboard_writer.submit(user_id, losses=1)
 
     battle["status"] = BattleStatus.resolved
     battle["result"] = {
@@ -524,6 +2372,455 @@ async def _resolve_battle(app: FastAPI, battle_id: str) -> None:
         "wins": int(row.get("wins", 0)) if row else None,
         "losses": int(row.get("losses", 0)) if row else None,
     }
+    await _publish_battle(battle)
+
+# Кэш в два уровня. Локальный LRU+TTL отвечает без сети; общий уровень
+# (любой сервер с протоколом Redis) делает значения видимыми всем воркерам.
+# Значения хранятся как JSON. Недоступный общий уровень не роняет запросы:
+# кэш на cache_timeout секунд деградирует до локального.
+class CacheBackendError(Exception):
+    """Ошибка или недоступность общего уровня кэша"""
+
+
+class LocalCache:
+    """LRU с TTL на запись; потокобезопасный"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str, ttl: float) -> int:
+        """Счётчик; TTL ставится при создании и не продлевается"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                entry = (now + ttl, 0)
+            entry = (entry[0], int(entry[1]) + 1)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry[1]
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RESPClient:
+    """Минимальный asyncio-клиент протокола Redis (RESP2).
+
+    Небольшой пул соединений на event loop: команды одного соединения идут
+    строго по очереди, пачки отправляются pipeline'ом за один round trip.
+    timeout покрывает и ожидание свободного соединения, так что при очереди
+    вызывающий быстро откатывается на локальный уровень.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5, pool_size: int = 4):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported cache URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = urllib.parse.unquote(parsed.password) if parsed.password else None
+        self.username = urllib.parse.unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = float(timeout)
+        self.pool_size = max(1, int(pool_size))
+        self._loop = None
+        self._idle: List[Tuple[Any, Any]] = []
+        self._slots = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    async def _read_reply(self, reader):
+        line = await reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheBackendError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            return CacheBackendError(rest.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = await reader.readexactly(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            if size < 0:
+                return None
+            return [await self._read_reply(reader) for _ in range(size)]
+        raise CacheBackendError(f"Unexpected reply: {line[:32]!r}")
+
+    async def _connect(self) -> Tuple[Any, Any]:
+        conn = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password is not None:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        try:
+            for reply in await self._roundtrip(conn, setup) if setup else []:
+                if isinstance(reply, CacheBackendError):
+                    raise reply
+        except BaseException:
+            self._close(conn)
+            raise
+        return conn
+
+    async def _roundtrip(self, conn, commands) -> list:
+        reader, writer = conn
+        writer.write(b"".join(self._encode(c) for c in commands))
+        await writer.drain()
+        return [await self._read_reply(reader) for _ in commands]
+
+    async def _run(self, commands) -> list:
+        idle = self._idle
+        async with self._slots:
+            conn = idle.pop() if idle else await self._connect()
+            ok = False
+            try:
+                replies = await self._roundtrip(conn, commands)
+                ok = True
+                return replies
+            finally:
+                if ok:
+                    idle.append(conn)
+                else:
+                    # A half-read reply leaves the stream out of sync: never reuse it
+                    self._close(conn)
+
+    async def pipeline(self, commands) -> list:
+        """Ответы по порядку; ошибка отдельной команды возвращается как CacheBackendError"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._drop()
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.pool_size)
+        try:
+            return await asyncio.wait_for(self._run(commands), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, CacheBackendError) as e:
+            if isinstance(e, CacheBackendError):
+                raise
+            raise CacheBackendError(str(e) or type(e).__name__) from e
+
+    async def execute(self, *args):
+        reply = (await self.pipeline([args]))[0]
+        if isinstance(reply, CacheBackendError):
+            raise reply
+        return reply
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn[1].close()
+        except Exception:
+            pass
+
+    def _drop(self) -> None:
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    async def close(self) -> None:
+        self._drop()
+
+
+class TieredCache:
+    """Локальный LRU+TTL перед необязательным общим уровнем.
+
+    get_or_set защищает от stampede: внутри процесса одновременные промахи
+    ждут одну загрузку, между воркерами загрузку выполняет держатель
+    короткой блокировки (SET NX PX), остальные ждут его результат.
+    """
+
+    def __init__(
+        self,
+        shared: Optional[RESPClient] = None,
+        prefix: str = "wb",
+        local_max_entries: int = 10000,
+        local_ttl: float = 2.0,
+        lock_ttl_ms: int = 5000,
+        retry_after: float = 5.0,
+    ):
+        self.shared = shared
+        self.prefix = prefix
+        self.local = LocalCache(local_max_entries)
+        self.local_ttl = float(local_ttl)
+        self.lock_ttl_ms = int(lock_ttl_ms)
+        self.retry_after = float(retry_after)
+        self._down_until = 0.0
+        self._inflight: Dict[str, Tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "local_hits": 0, "shared_hits": 0, "misses": 0, "loads": 0,
+            "lock_waits": 0, "shared_errors": 0,
+        }
+
+    def namespace(self, name: str) -> "CacheNamespace":
+        return CacheNamespace(self, name)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def _local_ttl(self, ttl: float) -> float:
+        # With a shared tier the local copy is only a short-lived read-through
+        return min(ttl, self.local_ttl) if self.shared is not None else ttl
+
+    async def _shared(self, commands) -> Optional[list]:
+        """Пачка команд общему уровню; None, если он выключен или недоступен"""
+        if self.shared is None or time.monotonic() < self._down_until:
+            return None
+        try:
+            return await self.shared.pipeline(commands)
+        except CacheBackendError as e:
+            self._count("shared_errors")
+            self._down_until = time.monotonic() + self.retry_after
+            logger.warning(f"Shared cache unavailable, using local tier only: {e}")
+            return None
+
+    @staticmethod
+    def _decode(raw) -> Tuple[bool, Any]:
+        if raw is None or isinstance(raw, CacheBackendError):
+            return False, None
+        try:
+            return True, json.loads(raw)
+        except ValueError:
+            return False, None
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found: Dict[str, Any] = {}
+        missing = []
+        for key in keys:
+            hit, value = self.local.get(key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        self._count("local_hits", len(found))
+        if missing:
+            replies = await self._shared([("MGET", *missing)])
+            for key, raw in zip(missing, replies[0] if replies and isinstance(replies[0], list) else []):
+                hit, value = self._decode(raw)
+                if hit:
+                    found[key] = value
+                    self.local.set(key, value, self.local_ttl)
+                    self._count("shared_hits")
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    async def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        for key, value in items.items():
+            self.local.set(key, value, self._local_ttl(ttl))
+        if items:
+            ttl_ms = max(1, int(ttl * 1000))
+            await self._shared([
+                ("SET", key, json.dumps(value, separators=(",", ":")), "PX", ttl_ms)
+                for key, value in items.items()
+            ])
+
+    async def delete_many(self, keys: List[str]) -> None:
+        for key in keys:
+            self.local.delete(key)
+        if keys:
+            await self._shared([("DEL", *keys)])
+
+    async def incr(self, key: str, ttl: float) -> int:
+        """Общий счётчик (фиксированное окно ttl); без общего уровня - локальный"""
+        ttl_ms = max(1, int(ttl * 1000))
+        replies = await self._shared([("INCR", key), ("PEXPIRE", key, ttl_ms, "NX")])
+        if replies and isinstance(replies[0], int):
+            if isinstance(replies[1], CacheBackendError):
+                # Servers before 7.0 have no PEXPIRE NX: only the first hit sets the TTL
+                if replies[0] == 1:
+                    await self._shared([("PEXPIRE", key, ttl_ms)])
+            return replies[0]
+        return self.local.incr(key, ttl)
+
+    async def get_or_set(self, key: str, loader, ttl: float) -> Any:
+        hit, value = self.local.get(key)
+        if hit:
+            self._count("local_hits")
+            return value
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            inflight = self._inflight.get(key)
+            if inflight is None or inflight[0] is not loop or inflight[1].done():
+                fut = loop.create_future()
+                self._inflight[key] = (loop, fut)
+                inflight = None
+        if inflight is not None:
+            return await asyncio.shield(inflight[1])
+
+        try:
+            value = await self._fill(key, loader, ttl)
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()  # waiters re-raise it; don't log as "never retrieved"
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                if self._inflight.get(key, (None, None))[1] is fut:
+                    del self._inflight[key]
+
+    async def _fill(self, key: str, loader, ttl: float) -> Any:
+        lock_key = f"{key}:lock"
+        token = secrets.token_hex(8)
+        replies = await self._shared([("GET", key), ("SET", lock_key, token, "NX", "PX", self.lock_ttl_ms)])
+        if replies is not None:
+            hit, value = self._decode(replies[0])
+            if hit:
+                self._count("shared_hits")
+                if replies[1] == "OK":
+                    await self._shared([("DEL", lock_key)])
+                self.local.set(key, value, self.local_ttl)
+                return value
+            if replies[1] != "OK":
+                # Another worker is loading it: wait for its result, bounded by the lock TTL
+                self._count("lock_waits")
+                deadline = time.monotonic() + self.lock_ttl_ms / 1000.0
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    polled = await self._shared([("GET", key)])
+                    if polled is None:
+                        break
+                    hit, value = self._decode(polled[0])
+                    if hit:
+                        self._count("shared_hits")
+                        self.local.set(key, value, self.local_ttl)
+                        return value
+                token = None
+
+        self._count("misses")
+        self._count("loads")
+        try:
+            value = await loader()
+            await self.set_many({key: value}, ttl)
+            return value
+        finally:
+            if replies is not None and token is not None:
+                await self._shared([
+                    ("EVAL", SHARED_UNLOCK_SCRIPT, 1, lock_key, token),
+                ])
+
+    def clear(self) -> None:
+        """Сбросить локальный уровень (общий остаётся нетронутым)"""
+        self.local.clear()
+        with self._lock:
+            self._inflight.clear()
+            self._down_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                "local_entries": len(self.local),
+                "shared": self.shared is not None,
+                "shared_down": time.monotonic() < self._down_until,
+            }
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+
+# Снимает блокировку, только если она всё ещё наша (а не перехвачена по TTL)
+SHARED_UNLOCK_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+)
+
+
+class CacheNamespace:
+    """Ключи одного потребителя: <prefix>:<namespace>:<key>"""
+
+    def __init__(self, cache: TieredCache, name: str):
+        self.cache = cache
+        self.name = name
+
+    def key(self, key: str) -> str:
+        return self.cache._key(self.name, key)
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        full = self.key(key)
+        return (await self.cache.get_many([full])).get(full, default)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        found = await self.cache.get_many([self.key(k) for k in keys])
+        return {k: found[self.key(k)] for k in keys if self.key(k) in found}
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.cache.set_many({self.key(key): value}, ttl)
+
+    async def set_many(self, items: Dict[str, Any], ttl: float) -> None:
+        await self.cache.set_many({self.key(k): v for k, v in items.items()}, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        await self.cache.delete_many([self.key(k) for k in keys])
+
+    async def incr(self, key: str, ttl: float) -> int:
+        return await self.cache.incr(self.key(key), ttl)
+
+    async def get_or_set(self, key: str, loader, ttl: float) -> Any:
+        return await self.cache.get_or_set(self.key(key), loader, ttl)
+
+
+shared_cache = TieredCache(
+    RESPClient(settings.cache_url, settings.cache_timeout, settings.cache_pool_size) if settings.cache_url else None,
+    prefix=settings.cache_prefix,
+    local_max_entries=settings.cache_local_max_entries,
+    local_ttl=settings.cache_local_ttl,
+    lock_ttl_ms=settings.cache_lock_ttl_ms,
+)
+
 
 # Rate limiting
 class RateLimiter:
@@ -554,7 +2851,29 @@ class RateLimiter:
         self.requests[client_id].append(now)
         return True
 
+    async def check(self, client_id: str) -> bool:
+        """С общим кэшем - фиксированное окно, единое для всех воркеров"""
+        if shared_cache.shared is None:
+            return self.is_allowed(client_id)
+        window = settings.rate_limit_window
+        bucket = int(time.time() // window)
+        hits = await rate_limit_cache.incr(f"{client_id}:{bucket}", window)
+        return hits <= settings.rate_limit_requests
+
 rate_limiter = RateLimiter()
+rate_limit_cache = shared_cache.namespace("ratelimit")
+
+# Публичная часть битвы в общем кэше: статус отвечает любой воркер,
+# а не только тот, что запустил битву
+BATTLE_SHARED_TTL = 3600.0
+battle_cache = shared_cache.namespace("battle")
+
+
+async def _publish_battle(battle: Dict[str, Any]) -> None:
+    if shared_cache.shared is None:
+        return
+    public = {k: battle[k] for k in ("battle_id", "status", "wait_seconds", "resolve_at", "result")}
+    await battle_cache.set(battle["battle_id"], jsonable_encoder(public), BATTLE_SHARED_TTL)
 
 # Middleware для rate limiting
 async def rate_limit_middleware(request: Request, call_next):
@@ -564,7 +2883,7 @@ async def rate_limit_middleware(request: Request, call_next):
 
     client_ip = request.client.host
     
-    if not rate_limiter.is_allowed(client_ip):
+    if not await rate_limiter.check(client_ip):
         return JSONResponse(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             content={"detail": "Too many requests"}
@@ -573,17 +2892,546 @@ async def rate_limit_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
+# Tokens issued with this claim carry a userId that came straight from the
+# users table, so it can be trusted without a wallet -> id lookup.
+IDENTITY_CLAIM_VERSION = 1
+
+
+class IdentityCache:
+    """Ограниченный LRU wallet -> user_id для токенов без доверенного userId.
+
+    Удалённые пользователи попадают в tombstones, чтобы их id из ещё живых
+    токенов больше не принимался без проверки в БД. Другие воркеры узнают об
+    удалении через NOTIFY users_deleted. Tombstones - best-effort: они живут
+    в памяти процесса (не больше max_size), поэтому после рестарта или
+    пропущенного уведомления токен удалённого пользователя снова принимается
+    до истечения срока, и его запись упадёт на внешних ключах.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max(1, int(max_size))
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self._deleted: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, wallet: str) -> Optional[int]:
+        with self._lock:
+            user_id = self._ids.get(wallet)
+            if user_id is not None and user_id in self._deleted:
+                del self._ids[wallet]
+                user_id = None
+            if user_id is None:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(wallet)
+            self.hits += 1
+            return user_id
+
+    def put(self, wallet: str, user_id: int) -> None:
+        with self._lock:
+            self._ids[wallet] = int(user_id)
+            self._ids.move_to_end(wallet)
+            self._deleted.pop(int(user_id), None)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def is_deleted(self, user_id: int) -> bool:
+        with self._lock:
+            return user_id in self._deleted
+
+    def invalidate(self, wallet: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if wallet is not None:
+                cached = self._ids.pop(wallet, None)
+                if user_id is None:
+                    user_id = cached
+            if user_id is not None:
+                self._deleted[int(user_id)] = None
+                while len(self._deleted) > self.max_size:
+                    self._deleted.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._deleted.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "max_size": self.max_size,
+                "tombstones": len(self._deleted),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+identity_cache = IdentityCache(settings.identity_cache_size)
+
+USERS_DELETED_NOTIFY_CHANNEL = "users_deleted"
+
+
+async def _on_users_deleted(payloads: Optional[List[str]]) -> None:
+    # payloads=None (listener reconnect): missed deletions can't be recovered
+    for payload in payloads or []:
+        for user_id in payload.split(","):
+            if user_id.isdigit():
+                identity_cache.invalidate(user_id=int(user_id))
+
 # JWT Bearer
 security = HTTPBearer(auto_error=False)
 
+async def _pool_leak_watchdog(pool: ConnectionPool) -> None:
+    """Периодически логирует соединения, которые держат дольше leak_timeout"""
+    interval = max(1.0, pool.leak_timeout / 2)
+    while True:
+        await asyncio.sleep(interval)
+        for leak in pool.find_leaks():
+            logger.warning(
+                f"DB connection held for {leak['held_s']:.1f}s by {leak['owner'] or 'unknown'} (possible leak)"
+            )
+
+
+# Сжатие ответов: br или gzip по Accept-Encoding, только для текстовых типов
+# и тел от compression_min_size байт. Ответы со strong ETag (снимки,
+# конфиг) сжимаются один раз и дальше берутся из памяти по ETag.
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml", "application/xml")
+
+
+def _negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Лучшая поддерживаемая кодировка из Accept-Encoding (br при равном q)"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    best, best_q = None, 0.0
+    for name in (("br", "gzip") if brotli is not None else ("gzip",)):
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def _compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.compression_brotli_quality if level is None else level)
+    # mtime=0: identical input gives identical bytes
+    return gzip.compress(body, compresslevel=settings.compression_gzip_level if level is None else level, mtime=0)
+
+
+def _weak_etag(etag: Optional[str]) -> Optional[str]:
+    # Another representation of the same resource: a weak validator still revalidates it
+    if not etag or etag.startswith("W/"):
+        return etag
+    return f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """ASGI middleware: сжатие ответов целиком или потоком (кроме SSE)"""
+
+    def __init__(self, app, minimum_size: int = 1024, memo: Optional[LocalCache] = None):
+        self.app = app
+        self.minimum_size = int(minimum_size)
+        self._memo = memo if memo is not None else LocalCache(256)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough or start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or start["status"] in (204, 206, 304)
+                    or content_type.startswith("text/event-stream")
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    if content_type.startswith(COMPRESSIBLE_TYPES):
+                        headers.add_vary_header("Accept-Encoding")
+                    etag = headers.get("etag")
+                    if start["status"] == 304 and etag and _weak_etag(etag) in if_none_match:
+                        # Revalidating a compressed copy: echo the validator it was given
+                        headers["ETag"] = _weak_etag(etag)
+                    await send(start)
+                    await send(message)
+                    return
+
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag:
+                    headers["ETag"] = _weak_etag(etag)
+
+                if not more:
+                    # FileResponse ETags are derived from mtime and size, so two files can
+                    # share one; the path keeps their compressed copies apart.
+                    memo_key = (
+                        f"{encoding}:{scope.get('path', '')}:{etag}"
+                        if etag and not etag.startswith("W/") else None
+                    )
+                    hit, compressed = self._memo.get(memo_key) if memo_key else (False, None)
+                    if not hit:
+                        compressed = _compress(body, encoding)
+                        if memo_key:
+                            self._memo.set(memo_key, compressed, 3600.0)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+                del headers["Content-Length"]
+                compressor = (
+                    brotli.Compressor(quality=settings.compression_brotli_quality) if encoding == "br"
+                    else zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+                )
+                await send(start)
+
+            if encoding == "br":
+                chunk = compressor.process(body) + (compressor.flush() if more else compressor.finish())
+            else:
+                chunk = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH if more else zlib.Z_FINISH)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles, отдающий заранее сжатые варианты текстовых файлов.
+
+    precompress() сжимает всё при старте (максимальным уровнем, это делается
+    один раз); изменённый на диске файл пережимается один раз при первом
+    запросе. Варианты, экономящие меньше min_saving, не хранятся
+    (например, PNG уже сжат).
+    """
+
+    SUFFIXES = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml", ".map", ".ico")
+
+    def __init__(self, *args, minimum_size: int = 1024, min_saving: float = 0.05, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.minimum_size = int(minimum_size)
+        self.min_saving = float(min_saving)
+        self._variants: Dict[str, Tuple[Any, Dict[str, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def _compressed(self, key: str, version: Any, read) -> Dict[str, bytes]:
+        """Сжатые варианты key; пересчитываются, только если сменилась version"""
+        with self._lock:
+            entry = self._variants.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+        variants: Dict[str, bytes] = {}
+        if key.endswith(self.SUFFIXES):
+            raw = read()
+            for encoding, level in (("gzip", 9), ("br", 11)):
+                if len(raw) < self.minimum_size or (encoding == "br" and brotli is None):
+                    continue
+                packed = _compress(raw, encoding, level)
+                if len(packed) <= len(raw) * (1.0 - self.min_saving):
+                    variants[encoding] = packed
+        with self._lock:
+            self._variants[key] = (version, variants)
+        return variants
+
+    def _build(self, full_path: str, stat_result: os.stat_result) -> Dict[str, bytes]:
+        def read() -> bytes:
+            with open(full_path, "rb") as f:
+                return f.read()
+
+        return self._compressed(full_path, (stat_result.st_mtime_ns, stat_result.st_size), read)
+
+    def precompress(self) -> int:
+        """Сжать все подходящие файлы; возвращает число файлов с вариантами"""
+        count = 0
+        for directory in self.all_directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    full_path = os.path.realpath(os.path.join(root, name))
+                    if self._build(full_path, os.stat(full_path)):
+                        count += 1
+        return count
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        encoding = _negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        variant = self._build(str(full_path), stat_result).get(encoding) if encoding else None
+        if variant is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        plain = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope["method"])
+        headers = {
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+            "ETag": _weak_etag(plain.headers["etag"]),
+            "Last-Modified": plain.headers["last-modified"],
+        }
+        if self.is_not_modified(Headers(headers=headers), Headers(scope=scope)):
+            return NotModifiedResponse(MutableHeaders(headers))
+        return Response(content=variant, status_code=status_code, headers=headers, media_type=plain.media_type)
+
+
+class Asset(NamedTuple):
+    """Файл фронтенда под адресом с хэшем содержимого"""
+
+    path: str
+    url: str
+    etag: str
+    body: Optional[bytes]  # None: served from disk unchanged
+
+
+class AssetManifest:
+    """Отпечатки файлов фронтенда и страницы со ссылками на них.
+
+    Имя получает хэш содержимого: js/game.js -> js/game.<hash>.js. Ссылки
+    переписываются по зависимостям: картинки, затем url() в CSS и пути в
+    строках JS, затем src/href в страницах - поэтому хэш CSS/JS учитывает
+    уже переписанные ссылки.
+    """
+
+    FINGERPRINTED = (".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".ico", ".woff", ".woff2")
+    PAGES = ("index.html", "app.html", "arena.html")
+    HASH_LENGTH = 12
+
+    _HTML_REF = re.compile(r"""(\b(?:src|href)=["'])([^"'#?]+)""")
+    _CSS_REF = re.compile(r"""(url\(\s*["']?)([^"')#?]+)""")
+    _JS_REF = re.compile(r"""(["'`])([\w./-]+\.\w+)(?=["'`])""")
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+        self.assets: Dict[str, Asset] = {}
+        self.by_url: Dict[str, Asset] = {}
+        self.pages: Dict[str, Asset] = {}
+        self.built_at = time.time()
+        self.signature = self.scan()
+
+    def scan(self) -> Tuple[Tuple[str, int, int], ...]:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full = os.path.join(root, name)
+                st = os.stat(full)
+                entries.append((os.path.relpath(full, self.directory).replace(os.sep, "/"), st.st_mtime_ns, st.st_size))
+        return tuple(sorted(entries))
+
+    def _read(self, rel: str) -> bytes:
+        with open(os.path.join(self.directory, rel), "rb") as f:
+            return f.read()
+
+    def _add(self, rel: str, raw: bytes, rewritten: Optional[bytes]) -> None:
+        digest = hashlib.sha256(rewritten if rewritten is not None else raw).hexdigest()
+        stem, ext = os.path.splitext(rel)
+        asset = Asset(rel, f"{stem}.{digest[:self.HASH_LENGTH]}{ext}", f'"{digest[:32]}"', rewritten)
+        self.assets[rel] = asset
+        self.by_url[asset.url] = asset
+
+    def _rewrite(self, text: str, pattern, base: str) -> str:
+        def swap(m):
+            ref = m.group(2)
+            if "//" in ref or ref.startswith(("data:", "/")):
+                return m.group(0)
+            target = os.path.normpath(os.path.join(base, ref)).replace(os.sep, "/")
+            asset = self.assets.get(target)
+            if asset is None:
+                return m.group(0)
+            return m.group(1) + ref[: len(ref) - len(os.path.basename(ref))] + os.path.basename(asset.url)
+
+        return pattern.sub(swap, text)
+
+    def build(self) -> "AssetManifest":
+        files = [rel for rel, _, _ in self.signature]
+        for rel in files:
+            if rel.endswith(self.FINGERPRINTED) and not rel.endswith((".css", ".js")):
+                self._add(rel, self._read(rel), None)
+        for suffix, pattern in ((".css", self._CSS_REF), (".js", self._JS_REF)):
+            for rel in files:
+                if not rel.endswith(suffix):
+                    continue
+                raw = self._read(rel)
+                # url() in CSS is relative to the stylesheet; paths in JS strings to the page
+                base = os.path.dirname(rel) if suffix == ".css" else ""
+                rewritten = self._rewrite(raw.decode("utf-8"), pattern, base).encode("utf-8")
+                self._add(rel, raw, rewritten if rewritten != raw else None)
+        for rel in self.PAGES:
+            if rel in files:
+                body = self._rewrite(self._read(rel).decode("utf-8"), self._HTML_REF, os.path.dirname(rel))
+                body = body.encode("utf-8")
+                self.pages[rel] = Asset(rel, rel, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        return self
+
+    def url_for(self, rel: str) -> str:
+        asset = self.assets.get(rel)
+        return "/" + (asset.url if asset else rel)
+
+
+class FingerprintedStaticFiles(PrecompressedStaticFiles):
+    """Статика с манифестом: адреса с хэшем кэшируются навсегда (immutable),
+    страницы со ссылками на них перепроверяются по ETag при каждом визите.
+
+    Манифест строится при старте и перестраивается, если файлы на диске
+    изменились (проверка не чаще раза в recheck_seconds).
+    """
+
+    IMMUTABLE = "public, max-age=31536000, immutable"
+    PAGE = "no-cache"
+
+    def __init__(self, *args, recheck_seconds: float = 2.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recheck_seconds = float(recheck_seconds)
+        self._manifest: Optional[AssetManifest] = None
+        self._checked_at = 0.0
+        self._manifest_lock = threading.Lock()
+
+    def manifest(self) -> AssetManifest:
+        with self._manifest_lock:
+            now = time.monotonic()
+            if self._manifest is not None and now - self._checked_at < self.recheck_seconds:
+                return self._manifest
+            self._checked_at = now
+            if self._manifest is None or self._manifest.scan() != self._manifest.signature:
+                self._manifest = AssetManifest(str(self.directory)).build()
+            return self._manifest
+
+    def precompress(self) -> int:
+        manifest = self.manifest()
+        count = super().precompress()
+        for asset in list(manifest.assets.values()) + list(manifest.pages.values()):
+            if asset.body is not None and self._compressed(asset.url, asset.etag, lambda a=asset: a.body):
+                count += 1
+        return count
+
+    def _memory_response(self, asset: Asset, scope, cache_control: str, modified: float) -> Response:
+        headers = {
+            "ETag": asset.etag,
+            "Cache-Control": cache_control,
+            "Last-Modified": formatdate(modified, usegmt=True),
+        }
+        body = asset.body
+        encoding = _negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        variant = self._compressed(asset.url, asset.etag, lambda: asset.body).get(encoding) if encoding else None
+        if asset.path.endswith(self.SUFFIXES):
+            headers["Vary"] = "Accept-Encoding"
+        if variant is not None:
+            body = variant
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = _weak_etag(asset.etag)
+        if self.is_not_modified(Headers(headers=headers), Headers(scope=scope)):
+            return NotModifiedResponse(MutableHeaders(headers))
+        return Response(content=body, headers=headers, media_type=guess_type(asset.path)[0])
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            manifest = await asyncio.to_thread(self.manifest)
+            rel = "index.html" if path in ("", ".") else path.replace(os.sep, "/")
+            page = manifest.pages.get(rel)
+            if page is not None:
+                return self._memory_response(page, scope, self.PAGE, manifest.built_at)
+            asset = manifest.by_url.get(rel)
+            if asset is not None:
+                if asset.body is not None:
+                    return self._memory_response(asset, scope, self.IMMUTABLE, manifest.built_at)
+                response = await super().get_response(asset.path, scope)
+                response.headers["Cache-Control"] = self.IMMUTABLE
+                return response
+        return await super().get_response(path, scope)
+
+
+compression_memo = LocalCache(256)
+static_files = FingerprintedStaticFiles(directory="frontend", html=True, minimum_size=settings.compression_min_size)
+
+
+async def _precompress_static() -> None:
+    try:
+        count = await asyncio.to_thread(static_files.precompress)
+        logger.info(f"Precompressed {count} static files")
+    except Exception as e:
+        # Files are then compressed on their first request instead
+        logger.warning(f"Static precompression failed: {e}")
+
+
 # FastAPI приложение с lifespan
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("WORLDBINDER API starting...")
+    db_pool.open()
+    app.state.db_pool = db_pool
+    if replica_pool is not None:
+        replica_pool.open()
+    leak_watchdog = asyncio.create_task(_pool_leak_watchdog(db_pool))
+    rank_loader = asyncio.create_task(_warm_rank_index())
+    koth_scheduler = asyncio.create_task(_koth_scheduler()) if settings.koth_reset_enabled else None
+    await _warm_skill_registry()
+    await _precompress_static()
+    outbound_http.open([settings.helius_rpc_url, settings.solana_rpc])
+    rank_resync = (
+        asyncio.create_task(_rank_index_resync_loop()) if settings.rank_index_resync_seconds > 0 else None
+    )
+    listeners: Dict[str, Any] = {}
+    if settings.skills_listen_enabled:
+        listeners[SKILLS_NOTIFY_CHANNEL] = _on_skills_changed
+    if settings.leaderboard_listen_enabled:
+        listeners[LEADERBOARD_NOTIFY_CHANNEL] = leaderboard_sync.handle
+    if settings.identity_listen_enabled:
+        listeners[USERS_DELETED_NOTIFY_CHANNEL] = _on_users_deleted
+    listener_stop = threading.Event()
+    if listeners:
+        threading.Thread(
+            target=_listen_notifications,
+            args=(asyncio.get_running_loop(), listener_stop, listeners),
+            name="db-listener",
+            daemon=True,
+        ).start()
     yield
     # Shutdown
     logger.info("WORLDBINDER API shutting down...")
+    leak_watchdog.cancel()
+    rank_loader.cancel()
+    if koth_scheduler is not None:
+        koth_scheduler.cancel()
+    if rank_resync is not None:
+        rank_resync.cancel()
+    listener_stop.set()
+    await shared_cache.close()
+    await outbound_http.aclose()
+    await leaderboard_writer.drain()
+    _shutdown_db_executor()
+    db_pool.close()
+    if replica_pool is not None:
+        replica_pool.close()
 
 app = FastAPI(
     title="WORLDBINDER API",
@@ -594,7 +3442,19 @@ app = FastAPI(
 
 app.state.battles = {}
 
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    logger.warning(f"DB pool exhausted on {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database busy, retry later"},
+        headers={"Retry-After": str(max(1, int(settings.db_pool_acquire_timeout)))},
+    )
+
 # Middleware
+# Innermost: sees route responses before BaseHTTPMiddleware re-streams them
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_size, memo=compression_memo)
 app.middleware("http")(rate_limit_middleware)
 app.add_middleware(
     CORSMiddleware,
@@ -617,10 +3477,49 @@ def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depen
     # Normalize keys for downstream endpoints
     if "walletAddress" in payload and "wallet_address" not in payload:
         payload["wallet_address"] = payload["walletAddress"]
-    if "userId" in payload and "user_id" not in payload:
-        payload["user_id"] = payload["userId"]
+    payload["user_id"] = _identity_from_claims(payload)
     return payload
 
+
+def _identity_from_claims(payload: dict) -> Optional[int]:
+    """user_id без обращения к БД: из подписанного токена или из LRU"""
+    user_id = payload.get("userId")
+    if (
+        payload.get("uidv") == IDENTITY_CLAIM_VERSION
+        and isinstance(user_id, int)
+        and user_id > 0
+        and not identity_cache.is_deleted(user_id)
+    ):
+        return user_id
+    wallet = payload.get("wallet_address")
+    if not wallet:
+        return None
+    return identity_cache.get(wallet)
+
+
+async def resolve_user_id(current_user: dict, db) -> Optional[int]:
+    """user_id текущего пользователя; в БД идём только для старых токенов при промахе LRU"""
+    if current_user.get("user_id"):
+        return int(current_user["user_id"])
+    wallet = current_user["wallet_address"]
+    row = await run_db(db.execute_query, SQL_USER_ID_BY_WALLET, (wallet,), fetch="one")
+    if not row:
+        return None
+    user_id = int(row["id"])
+    identity_cache.put(wallet, user_id)
+    current_user["user_id"] = user_id
+    return user_id
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Доступ к служебным эндпоинтам по статическому ADMIN_TOKEN"""
+    if not settings.admin_token:
+        # Admin API is disabled unless a token is configured
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return True
+
 # API Роуты (должны быть перед монтированием статики)
 @app.get("/api")
 async def root_api():
@@ -631,10 +3530,11 @@ async def root_api():
 async def health_check():
     """Проверка здоровья системы"""
     try:
-        # Проверка подключения к базе данных
+        # Проверка подключения к базе данных (соединение берётся из пула)
         db = Database()
-        db.connect()
-        if db:
+        try:
+            await run_db(db.connect)
+        finally:
             db.close()
         return {
             "status": "healthy",
@@ -710,36 +3610,20 @@ async def verify_signature(auth_data: PhantomAuthRequest, request: Request, resp
             )
         
         # Поиск или создание пользователя
-        user_query = """
-            INSERT INTO users (wallet_address, created_at, last_login) 
-            VALUES (%s, %s, %s) 
-            ON CONFLICT (wallet_address) 
-            DO UPDATE SET last_login = %s
-            RETURNING id, wallet_address, username, avatar_url, created_at, last_login
-        """
-        
         user = None
         db = None
         try:
-            db = Database()
-            user = db.execute_query(
-                user_query, 
-                (auth_data.publicKey, datetime.utcnow(), datetime.utcnow(), datetime.utcnow()),
+            db = Database(user=auth_data.publicKey)
+            now = datetime.utcnow()
+            user = await run_db(
+                db.execute_query,
+                SQL_USER_LOGIN,
+                (auth_data.publicKey, now, now),
                 fetch="one"
             )
-
-            # Если новый пользователь - инициализация токенов и лидерборда
-            if user['created_at'] == user['last_login']:
-                # Начальные токены
-                db.execute_query(
-                    "INSERT INTO user_tokens (user_id, balance) VALUES (%s, 100000)",
-                    (user['id'],)
-                )
-                # Запись в лидерборд
-                db.execute_query(
-                    "INSERT INTO leaderboard (user_id) VALUES (%s)",
-                    (user['id'],)
-                )
+            if user.get('is_new'):
+                logger.info(f"New user registered: {auth_data.publicKey}")
+                rank_index.upsert(user['id'], 0, 0, 0)
 
         except psycopg2.OperationalError as e:
             # In unit-test / local environment without DB we still want auth flow to be testable
@@ -752,12 +3636,20 @@ async def verify_signature(auth_data: PhantomAuthRequest, request: Request, resp
                 "created_at": datetime.utcnow(),
                 "last_login": datetime.utcnow(),
             }
+        finally:
+            if db:
+                db.close()
         
         # Создание JWT токена
-        token = SecurityUtils.create_jwt_token({
+        claims = {
             "userId": user['id'],
             "walletAddress": user['wallet_address']
-        })
+        }
+        if user['id']:
+            # Persisted user: downstream endpoints may trust userId as-is
+            claims["uidv"] = IDENTITY_CLAIM_VERSION
+            identity_cache.put(user['wallet_address'], user['id'])
+        token = SecurityUtils.create_jwt_token(claims)
 
         # Set HttpOnly cookie so direct navigation to protected HTML pages can be guarded server-side
         response.set_cookie(
@@ -771,9 +3663,6 @@ async def verify_signature(auth_data: PhantomAuthRequest, request: Request, resp
         )
         
         logger.info(f"User {auth_data.publicKey} authenticated successfully")
-
-        if db:
-            db.close()
         
         return {
             "token": token,
@@ -785,7 +3674,7 @@ async def verify_signature(auth_data: PhantomAuthRequest, request: Request, resp
             }
         }
 
-    except HTTPException:
+    except (HTTPException, PoolTimeout):
         raise
     except Exception as e:
         logger.error(f"Authentication error: {e}")
@@ -833,25 +3722,32 @@ def _is_html_access_allowed(request: Request) -> bool:
     return False
 
 
+async def _static_page(request: Request, name: str) -> Response:
+    """Страница фронтенда через static_files: ссылки на ассеты с хэшем, предсжатие и 304"""
+    return await static_files.get_response(name, request.scope)
+
+
 @app.get("/app.html")
 async def protected_app_html(request: Request):
     if not _is_html_access_allowed(request):
         return RedirectResponse(url="/index.html", status_code=status.HTTP_307_TEMPORARY_REDIRECT)
-    return FileResponse("frontend/app.html")
+    return await _static_page(request, "app.html")
 
 
 @app.get("/arena.html")
 async def protected_arena_html(request: Request):
     if not _is_html_access_allowed(request):
         return RedirectResponse(url="/index.html", status_code=status.HTTP_307_TEMPORARY_REDIRECT)
-    return FileResponse("frontend/arena.html")
+    return await _static_page(request, "arena.html")
 
 @app.get("/api/user/profile", response_model=UserResponse)
 async def get_profile(current_user: dict = Depends(get_current_user)):
     """Получение профиля пользователя"""
+    db = None
+    wallet = current_user["wallet_address"]
     try:
-        db = Database()
-        db.connect()
+        db = Database(read_only=True, user=wallet)
+        await run_db(db.connect)
         
         # Получение данных пользователя
         user_query = """
@@ -859,18 +3755,22 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
             FROM users 
             WHERE wallet_address = %s
         """
-        user_result = db.execute_query(user_query, (current_user["wallet_address"],), fetch="one")
+        user_result = await run_db(db.execute_query, user_query, (wallet,), fetch="one")
         
         if not user_result:
-            # Создание нового пользователя
+            # Создание нового пользователя (запись - только на primary)
+            db.close()
+            db = Database(user=wallet)
             insert_query = """
                 INSERT INTO users (wallet_address, created_at, last_login)
                 VALUES (%s, %s, %s)
+                ON CONFLICT (wallet_address) DO UPDATE SET wallet_address = EXCLUDED.wallet_address
                 RETURNING id, wallet_address, username, avatar_url, created_at, last_login
             """
-            user_result = db.execute_query(
+            user_result = await run_db(
+                db.execute_query,
                 insert_query, 
-                (current_user["wallet_address"], datetime.utcnow(), datetime.utcnow()),
+                (wallet, datetime.utcnow(), datetime.utcnow()),
                 fetch="one"
             )
 
@@ -880,8 +3780,6 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
                 detail="User not found"
             )
         
-        db.close()
-        
         return UserResponse(
             id=user_result["id"],
             wallet_address=user_result["wallet_address"],
@@ -905,6 +3803,9 @@ async def get_profile(current_user: dict = Depends(get_current_user)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get profile"
         )
+    finally:
+        if db:
+            db.close()
 
 
 @app.post("/api/nft/stats", response_model=NFTStatsResponse)
@@ -913,71 +3814,196 @@ async def get_nft_stats(payload: NFTStatsRequest, current_user: dict = Depends(g
     return NFTStatsResponse(mintAddress=payload.mintAddress, rarity=payload.rarity, stats=stats)
 
 
-@app.post("/api/wallet/scan")
-async def wallet_scan(payload: WalletScanRequest, current_user: dict = Depends(get_current_user)):
-    data = await _helius_get_assets_by_owner(payload.walletAddress)
-    items = (((data.get("result") or {}).get("items")) or [])
-    collection = settings.collection_address
+WALLET_SCAN_MAX_NFTS = 3
 
-    filtered = []
-    for it in items:
-        if not isinstance(it, dict):
-            continue
-        if collection:
-            grouping = it.get("grouping") or []
-            ok = False
-            if isinstance(grouping, list):
-                for g in grouping:
-                    if isinstance(g, dict) and g.get("group_key") == "collection" and g.get("group_value") == collection:
-                        ok = True
-                        break
-            if not ok:
+
+async def _fetch_wallet_scan(owner: str, collection: str) -> List[Dict[str, Any]]:
+    """До WALLET_SCAN_MAX_NFTS NFT коллекции в формате игры; дальше не листает"""
+    found: List[Dict[str, Any]] = []
+    assets = _iter_wallet_assets(owner, collection, WALLET_SCAN_MAX_NFTS)
+    try:
+        async for asset in assets:
+            if collection and not _in_collection(asset, collection):
                 continue
-        filtered.append(it)
+            found.append(_parse_helius_asset(asset))
+            if len(found) >= WALLET_SCAN_MAX_NFTS:
+                break
+    finally:
+        await assets.aclose()
+    return found
 
-    filtered = filtered[:3]
-    nfts = [_parse_helius_asset(a) for a in filtered]
-    attack_bonus = _compute_attack_bonus(len(nfts))
-    return {"nfts": nfts, "attackBonus": attack_bonus}
 
+class WalletScanCache:
+    """Результаты скана по (коллекция, кошелёк) в shared_cache.
 
-@app.post("/api/wallet/token-balance")
-async def token_balance(payload: TokenBalanceRequest, current_user: dict = Depends(get_current_user)):
-    if not settings.token_mint:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="TOKEN_MINT not configured")
+    Свежий результат отдаётся без Helius; устаревший (в пределах stale
+    окна) отдаётся сразу, а обновление идёт в фоне, по одному на ключ.
+    Пустой результат считается свежим дольше: кошельки без NFT коллекции
+    составляют большинство и почти никогда не меняются.
+    """
 
-    bal = await _solana_get_token_balance(payload.walletAddress, settings.token_mint)
-    return {"mint": settings.token_mint, "balance": bal}
+    def __init__(self, namespace: CacheNamespace, fresh_seconds: float, stale_seconds: float, empty_seconds: float):
+        self.namespace = namespace
+        self.fresh_seconds = float(fresh_seconds)
+        self.stale_seconds = float(stale_seconds)
+        self.empty_seconds = float(empty_seconds)
+        self._refreshing: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._counters = {"fresh": 0, "stale": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "invalidations": 0}
 
+    @staticmethod
+    def key(owner: str, collection: str) -> str:
+        return f"{collection or '*'}:{owner}"
 
-@app.post("/api/skills/upgrade")
-async def skills_upgrade(payload: SkillsUpgradeRequest, current_user: dict = Depends(get_current_user)):
-    wallet = current_user.get("wallet_address")
-    tx = await _solana_get_transaction(payload.txSignature)
-    if not _tx_has_valid_burn(tx, wallet):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid burn transaction")
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
 
-    db = None
-    try:
-        db = Database()
-        db.connect()
-        user_id_row = db.execute_query(
-            "SELECT id FROM users WHERE wallet_address = %s",
-            (wallet,),
-            fetch="one",
-        )
-        if not user_id_row:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        user_id = int(user_id_row["id"])
+    def _fresh_for(self, nfts: List[Dict[str, Any]]) -> float:
+        return self.empty_seconds if not nfts else self.fresh_seconds
 
-        up_q = (
-            "INSERT INTO user_skill_levels (user_id, skill_key, level) "
-            "VALUES (%s, %s, 1) "
-            "ON CONFLICT (user_id, skill_key) DO UPDATE SET level = user_skill_levels.level + 1 "
-            "RETURNING level"
+    async def _envelope(self, loader) -> Dict[str, Any]:
+        return {"nfts": await loader(), "fetched_at": time.time()}
+
+    async def _store(self, key: str, loader) -> List[Dict[str, Any]]:
+        entry = await self._envelope(loader)
+        await self.namespace.set(key, entry, self._fresh_for(entry["nfts"]) + self.stale_seconds)
+        return entry["nfts"]
+
+    async def _refresh(self, key: str, loader) -> None:
+        try:
+            await self._store(key, loader)
+            self._count("refreshes")
+        except Exception as e:
+            # The stale copy stays until its window closes; the next hit retries
+            self._count("refresh_errors")
+            logger.warning(f"Background wallet scan refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.pop(key, None)
+
+    async def get(self, owner: str, collection: str, loader) -> Tuple[List[Dict[str, Any]], str]:
+        """(nfts, "fresh" | "stale" | "miss")"""
+        key = self.key(owner, collection)
+        entry = await self.namespace.get(key)
+        if entry is not None:
+            age = time.time() - float(entry.get("fetched_at") or 0)
+            fresh_for = self._fresh_for(entry["nfts"])
+            if age < fresh_for:
+                self._count("fresh")
+                return entry["nfts"], "fresh"
+            if age < fresh_for + self.stale_seconds:
+                self._count("stale")
+                loop = asyncio.get_running_loop()
+                with self._lock:
+                    running = self._refreshing.get(key)
+                    if running is None or running.done() or running.get_loop() is not loop:
+                        self._refreshing[key] = loop.create_task(self._refresh(key, loader))
+                return entry["nfts"], "stale"
+            # Outlived its stale window but not yet expired: get_or_set must not return it
+            await self.namespace.delete(key)
+        self._count("misses")
+        # Concurrent misses (in this process or on other workers) share one Helius scan
+        entry = await self.namespace.get_or_set(
+            key,
+            functools.partial(self._envelope, loader),
+            max(self.fresh_seconds, self.empty_seconds) + self.stale_seconds,
         )
-        row = db.execute_query(up_q, (user_id, payload.skillKey), fetch="one")
-        new_level = int((row or {}).get("level") or 1)
+        return entry["nfts"], "miss"
+
+    async def invalidate(self, owner: str, collection: str) -> None:
+        self._count("invalidations")
+        await self.namespace.delete(self.key(owner, collection))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._refreshing.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "refreshing": len(self._refreshing)}
+
+
+wallet_scan_cache = WalletScanCache(
+    shared_cache.namespace("scan"),
+    settings.scan_cache_fresh_seconds,
+    settings.scan_cache_stale_seconds,
+    settings.scan_cache_empty_seconds,
+)
+
+
+@app.post("/api/wallet/scan")
+async def wallet_scan(payload: WalletScanRequest, response: Response, current_user: dict = Depends(get_current_user)):
+    owner = payload.walletAddress
+    collection = settings.collection_address
+    own_wallet = owner == current_user.get("wallet_address")
+
+    # Only the owner may force a rescan: it always costs Helius credits
+    if payload.refresh and own_wallet:
+        await wallet_scan_cache.invalidate(owner, collection)
+    nfts, state = await wallet_scan_cache.get(
+        owner, collection, functools.partial(_fetch_wallet_scan, owner, collection)
+    )
+    # Persist only the caller's own holdings, cache hit or not: the entry may
+    # have been filled by someone else's scan; scanning another wallet is read-only
+    if nfts and own_wallet:
+        await _persist_scanned_nfts(current_user, nfts)
+    response.headers["X-Cache"] = state.upper()
+    return {"nfts": nfts, "attackBonus": _compute_attack_bonus(len(nfts))}
+
+
+async def _persist_scanned_nfts(current_user: dict, nfts: List[Dict[str, Any]]) -> None:
+    db = Database(user=current_user.get("wallet_address"))
+    try:
+        user_id = await resolve_user_id(current_user, db)
+        if user_id is not None:
+            await _upsert_user_nfts(db, user_id, _scan_nft_rows(nfts))
+    except Exception as e:
+        # The scan result is still valid for the client even if we could not cache it
+        logger.warning(f"Failed to persist wallet scan for {current_user.get('wallet_address')}: {e}")
+    finally:
+        db.close()
+
+
+@app.post("/api/wallet/token-balance")
+async def token_balance(payload: TokenBalanceRequest, current_user: dict = Depends(get_current_user)):
+    if not settings.token_mint:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="TOKEN_MINT not configured")
+
+    bal = await _solana_get_token_balance(payload.walletAddress, settings.token_mint)
+    return {"mint": settings.token_mint, "balance": bal}
+
+
+@app.post("/api/skills/upgrade")
+async def skills_upgrade(payload: SkillsUpgradeRequest, current_user: dict = Depends(get_current_user)):
+    rule = skill_registry.rule(payload.skillKey)
+    if rule is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown skill")
+    wallet = current_user.get("wallet_address")
+    tx = await _solana_get_transaction(payload.txSignature)
+    if not _tx_has_valid_burn(tx, wallet):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid burn transaction")
+
+    db = None
+    try:
+        db = Database(user=wallet)
+        await run_db(db.connect)
+        user_id = await resolve_user_id(current_user, db)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+        up_q = (
+            "INSERT INTO user_skill_levels (user_id, skill_key, level) "
+            "VALUES (%s, %s, 1) "
+            "ON CONFLICT (user_id, skill_key) DO UPDATE SET level = user_skill_levels.level + 1 "
+            "WHERE user_skill_levels.level < %s "
+            "RETURNING level"
+        )
+        row = await run_db(db.execute_query, up_q, (user_id, payload.skillKey, rule.max_level), fetch="one")
+        if not row:
+            # The conflict row is already at max_level: nothing was updated
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Skill is already at max level")
+        new_level = int(row["level"])
         return {"skillKey": payload.skillKey, "level": new_level}
     except psycopg2.OperationalError:
         return {"skillKey": payload.skillKey, "level": 1}
@@ -988,33 +4014,24 @@ async def skills_upgrade(payload: SkillsUpgradeRequest, current_user: dict = Dep
 
 @app.post("/api/battle/start", response_model=BattleStartResponse)
 async def battle_start(payload: BattleStartRequest, current_user: dict = Depends(get_current_user)):
-    db = Database()
-    db.connect()
-
-    user_id_row = db.execute_query(
-        "SELECT id FROM users WHERE wallet_address = %s",
-        (current_user["wallet_address"],),
-        fetch="one",
-    )
-    if not user_id_row:
-        db.close()
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    db = Database(user=current_user["wallet_address"])
+    try:
+        await run_db(db.connect)
 
-    user_id = int(user_id_row["id"])
+        user_id = await resolve_user_id(current_user, db)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
-    # Atomic bet debit: prevents double-spend / localStorage abuse
-    debit_q = (
-        "UPDATE leaderboard "
-        "SET points = points - %s "
-        "WHERE user_id = %s AND points >= %s "
-        "RETURNING points, wins, losses"
-    )
-    debited = db.execute_query(debit_q, (payload.bet, user_id, payload.bet), fetch="one")
-    if not debited:
+        # Atomic bet debit: prevents double-spend / localStorage abuse
+        debited = await run_db(
+            db.execute_query, SQL_LEADERBOARD_DEBIT, (payload.bet, user_id, payload.bet), fetch="one"
+        )
+        if not debited:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient points")
+        _leaderboard_changed()
+        rank_index.upsert(user_id, debited["points"], debited["wins"], debited["losses"])
+    finally:
         db.close()
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient points")
-
-    db.close()
 
     wait_seconds = 50 + secrets.randbelow(21)
     battle_id = secrets.token_urlsafe(16)
@@ -1033,23 +4050,37 @@ async def battle_start(payload: BattleStartRequest, current_user: dict = Depends
         "result": None,
     }
 
+    await _publish_battle(app.state.battles[battle_id])
     asyncio.create_task(_resolve_battle(app, battle_id))
     return BattleStartResponse(battle_id=battle_id, status=BattleStatus.pending, wait_seconds=int(wait_seconds))
 
 
 @app.get("/api/battle/{battle_id}", response_model=BattleStatusResponse)
-async def battle_status(battle_id: str, current_user: dict = Depends(get_current_user)):
+async def battle_status(battle_id: str, request: Request, current_user: dict = Depends(get_current_user)):
     battle = app.state.battles.get(battle_id)
+    if not battle and shared_cache.shared is not None:
+        # Started by another worker
+        found = await battle_cache.get(battle_id)
+        battle = dict(found) if found else None
     if not battle:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Battle not found")
 
-    return BattleStatusResponse(
+    if battle.get("response") is not None:
+        body, etag = battle["response"]
+        return cached_json_response(request, body, CACHE_CONTROL["battle_resolved"], etag)
+
+    body = _json_bytes(BattleStatusResponse(
         battle_id=battle_id,
         status=battle["status"],
         wait_seconds=int(battle["wait_seconds"]),
         resolve_at=float(battle["resolve_at"]),
         result=battle.get("result"),
-    )
+    ))
+    if battle["status"] == BattleStatus.resolved:
+        # A resolved battle never changes again: encode it once
+        battle["response"] = (body, _strong_etag(body))
+        return cached_json_response(request, body, CACHE_CONTROL["battle_resolved"], battle["response"][1])
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": CACHE_CONTROL["battle_pending"]})
 
 @app.patch("/api/user/profile", response_model=UserResponse)
 async def update_profile(
@@ -1057,9 +4088,10 @@ async def update_profile(
     current_user: dict = Depends(get_current_user)
 ):
     """Обновление профиля пользователя"""
+    db = None
     try:
-        db = Database()
-        db.connect()
+        db = Database(user=current_user["wallet_address"])
+        await run_db(db.connect)
         
         update_query = """
             UPDATE users 
@@ -1068,14 +4100,13 @@ async def update_profile(
             RETURNING id, wallet_address, username, avatar_url, created_at, last_login
         """
         
-        result = db.execute_query(
+        result = await run_db(
+            db.execute_query,
             update_query,
             (profile_data.username, profile_data.avatarUrl, datetime.utcnow(), current_user["wallet_address"]),
             fetch="one"
         )
         
-        db.close()
-        
         return UserResponse(
             id=result["id"],
             wallet_address=result["wallet_address"],
@@ -1091,6 +4122,9 @@ async def update_profile(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update profile"
         )
+    finally:
+        if db:
+            db.close()
 
 @app.post("/api/user/nfts")
 async def add_nft(
@@ -1098,35 +4132,22 @@ async def add_nft(
     current_user: dict = Depends(get_current_user)
 ):
     """Добавление NFT пользователю"""
+    db = None
     try:
-        db = Database()
-        db.connect()
+        db = Database(user=current_user["wallet_address"])
+        await run_db(db.connect)
         
         # Получение ID пользователя
-        user_query = "SELECT id FROM users WHERE wallet_address = %s"
-        user_result = db.execute_query(user_query, (current_user["wallet_address"],), fetch="one")
+        user_id = await resolve_user_id(current_user, db)
         
-        if not user_result:
+        if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
         
         # Добавление NFT
-        nft_query = """
-            INSERT INTO user_nfts (user_id, mint_address, name, image_url, rarity)
-            VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (user_id, mint_address) 
-            DO UPDATE SET name = EXCLUDED.name, image_url = EXCLUDED.image_url, rarity = EXCLUDED.rarity
-            RETURNING id
-        """
-        
-        db.execute_query(
-            nft_query,
-            (user_result["id"], nft_data.mintAddress, nft_data.name, nft_data.imageUrl, nft_data.rarity)
-        )
-        
-        db.close()
+        await _upsert_user_nfts(db, user_id, [_nft_data_row(nft_data)])
         
         return {"message": "NFT added successfully"}
         
@@ -1138,75 +4159,925 @@ async def add_nft(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to add NFT"
         )
+    finally:
+        if db:
+            db.close()
+
+@app.post("/api/user/nfts/bulk")
+async def add_nfts_bulk(
+    payload: NFTBulkRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Добавление пачки NFT пользователю одним запросом"""
+    db = None
+    try:
+        db = Database(user=current_user["wallet_address"])
+        await run_db(db.connect)
+
+        user_id = await resolve_user_id(current_user, db)
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+
+        saved = await _upsert_user_nfts(db, user_id, [_nft_data_row(n) for n in payload.nfts])
+        return {"message": "NFTs added successfully", "count": saved}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"NFT bulk add error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to add NFTs"
+        )
+    finally:
+        if db:
+            db.close()
+
+
+class SkillRule(NamedTuple):
+    """Правила масштабирования скилла из ТЗ (раздел «Формула урона»)"""
+
+    key: str
+    name: str
+    type: str
+    base_damage: int
+    base_cooldown: float
+    max_level: int
+
+    def damage(self, level: int) -> int:
+        if self.type != "damage":
+            return 0
+        return self.base_damage + max(0, level - 1) * SKILL_DAMAGE_PER_LEVEL
+
+    def cooldown(self, level: int) -> float:
+        return max(SKILL_MIN_COOLDOWN, self.base_cooldown - max(0, level - 1) * SKILL_COOLDOWN_PER_LEVEL)
+
+    def public(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "baseDamage": self.base_damage,
+            "baseCooldown": self.base_cooldown,
+            "maxLevel": self.max_level,
+        }
+
+
+SKILL_DAMAGE_PER_LEVEL = 2
+SKILL_COOLDOWN_PER_LEVEL = 0.5
+SKILL_MIN_COOLDOWN = 0.5
+# Канал NOTIFY; триггер на skills (миграция 0006) шлёт его на любое изменение
+SKILLS_NOTIFY_CHANNEL = "skills_changed"
+
+SKILL_RULES: Dict[str, SkillRule] = {
+    rule.key: rule
+    for rule in (
+        SkillRule("bladeStrike", "Blade Strike", "damage", 18, 1.3, 5),
+        SkillRule("energyBurst", "Energy Burst", "damage", 55, 3.4, 5),
+        SkillRule("meteorRain", "Meteor Rain", "damage", 83, 8.0, 3),
+        SkillRule("defense", "Defense", "shield", 0, 8.0, 5),
+        SkillRule("healing", "Healing", "heal", 0, 11.0, 5),
+    )
+}
+
+
+class SkillCatalogue(NamedTuple):
+    """Неизменяемый снимок: строки таблицы skills + правила по skillKey"""
+
+    version: int
+    skills: Optional[Tuple[Dict[str, Any], ...]]
+    rules: Any
+    loaded_at: float
+
+
+class SkillRegistry:
+    """Каталог скиллов в памяти процесса.
+
+    Загружается при старте (или при первом запросе), перезагружается целиком
+    по команде админа или по NOTIFY skills_changed; читатели всегда видят
+    либо старый, либо новый снимок целиком.
+    """
+
+    def __init__(self, rules: Dict[str, SkillRule]):
+        self._rules = MappingProxyType(dict(rules))
+        self._catalogue = SkillCatalogue(0, None, self._rules, 0.0)
+        self._lock = threading.Lock()
+        self._counters = {"reloads": 0, "failures": 0}
+
+    @property
+    def catalogue(self) -> SkillCatalogue:
+        return self._catalogue
+
+    def rule(self, skill_key: str) -> Optional[SkillRule]:
+        """Правило по skillKey; без обращения к БД"""
+        return self._catalogue.rules.get(skill_key)
+
+    async def get(self) -> SkillCatalogue:
+        catalogue = self._catalogue
+        if catalogue.skills is None:
+            catalogue = await self.reload()
+        return catalogue
+
+    async def reload(self) -> SkillCatalogue:
+        try:
+            rows = await _load_skill_rows()
+        except Exception:
+            with self._lock:
+                self._counters["failures"] += 1
+            raise
+        skills = tuple(MappingProxyType(dict(r)) for r in rows)
+        with self._lock:
+            self._counters["reloads"] += 1
+            self._catalogue = SkillCatalogue(self._catalogue.version + 1, skills, self._rules, time.time())
+        skills_snapshot.invalidate()
+        return self._catalogue
+
+    def clear(self) -> None:
+        with self._lock:
+            self._catalogue = SkillCatalogue(0, None, self._rules, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        catalogue = self._catalogue
+        with self._lock:
+            return {
+                **self._counters,
+                "version": catalogue.version,
+                "loaded": catalogue.skills is not None,
+                "skills": len(catalogue.skills or ()),
+                "rules": len(catalogue.rules),
+                "loaded_at": catalogue.loaded_at or None,
+            }
+
+
+async def _load_skill_rows() -> List[Dict[str, Any]]:
+    # Primary: reloads follow a commit (NOTIFY, admin reload) and the registry
+    # never expires, so rows from a lagging replica would stick until the next edit
+    db = Database()
+    try:
+        await run_db(db.connect)
+        return await run_db(
+            db.execute_query, "SELECT * FROM skills ORDER BY required_level, name", fetch="all"
+        ) or []
+    finally:
+        db.close()
+
+
+skill_registry = SkillRegistry(SKILL_RULES)
+skills_snapshot = JSONSnapshot(settings.skills_cache_seconds)
+
+
+async def _load_skills() -> Dict[str, Any]:
+    catalogue = await skill_registry.get()
+    return {
+        "skills": [dict(skill) for skill in catalogue.skills],
+        "rules": {key: rule.public() for key, rule in catalogue.rules.items()},
+    }
+
+
+async def _on_skills_changed(payloads: Optional[List[str]]) -> None:
+    # A burst of edits (or a reconnect) collapses into one reload
+    await skill_registry.reload()
+
+
+def _listen_notifications(loop: asyncio.AbstractEventLoop, stop: threading.Event, handlers: Dict[str, Any]) -> None:
+    """LISTEN на отдельном соединении; уведомления каждого канала за один
+    poll передаются его обработчику списком payload.
+
+    После переподключения обработчики получают None: пока соединения не было,
+    уведомления могли потеряться.
+    """
+    reconnect = False
+    while not stop.is_set():
+        conn = None
+        try:
+            conn = _connect_primary()
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for channel in handlers:
+                    cur.execute(f"LISTEN {channel}")
+            if reconnect:
+                for handler in handlers.values():
+                    asyncio.run_coroutine_threadsafe(handler(None), loop)
+            reconnect = True
+            while not stop.is_set():
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+                batch: Dict[str, List[str]] = {}
+                for notify in conn.notifies:
+                    batch.setdefault(notify.channel, []).append(notify.payload)
+                conn.notifies.clear()
+                for channel, payloads in batch.items():
+                    if channel in handlers:
+                        asyncio.run_coroutine_threadsafe(handlers[channel](payloads), loop)
+        except Exception as e:
+            logger.warning(f"Notification listener error: {e}")
+            stop.wait(5.0)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+async def _warm_skill_registry() -> None:
+    try:
+        catalogue = await skill_registry.reload()
+        logger.info(f"Skill registry loaded: {len(catalogue.skills)} skills")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Loaded lazily on the first /api/skills request instead
+        logger.warning(f"Skill registry warm-up failed: {e}")
+
 
 @app.get("/api/skills")
-async def get_skills():
+async def get_skills(request: Request):
     """Получение доступных скиллов"""
     try:
-        db = Database()
-        db.connect()
-        
-        skills_query = "SELECT * FROM skills ORDER BY required_level, name"
-        skills = db.execute_query(skills_query, fetch="all")
-        
-        db.close()
-        
-        return {"skills": [dict(skill) for skill in skills]}
-        
+        body, etag, modified = await skills_snapshot.get(_load_skills)
     except Exception as e:
         logger.error(f"Skills error: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get skills"
         )
+    return cached_json_response(request, body, CACHE_CONTROL["skills"], etag, modified)
+
+async def _load_leaderboard(
+    limit: int, after: Optional[Tuple[int, int, int]] = None, primary: bool = False
+) -> List[Dict[str, Any]]:
+    # Keyset: the row comparison and ORDER BY match
+    # idx_leaderboard_keyset (points DESC, wins DESC, user_id DESC), so any page
+    # is one index range scan regardless of depth.
+    # primary=True bypasses the replica right after a write invalidated a snapshot.
+    where = "WHERE (l.points, l.wins, l.user_id) < (%s, %s, %s)" if after else ""
+    params = (*after, limit) if after else (limit,)
+    db = Database(read_only=not primary)
+    try:
+        await run_db(db.connect)
+        rows = await run_db(
+            db.execute_query,
+            f"""
+            SELECT l.id, l.user_id, l.points, l.wins, l.losses, l.rank, l.updated_at,
+                   u.username, u.wallet_address
+            FROM leaderboard l
+            JOIN users u ON l.user_id = u.id
+            {where}
+            ORDER BY l.points DESC, l.wins DESC, l.user_id DESC
+            LIMIT %s
+            """,
+            params,
+            fetch="all",
+        )
+        return [dict(r) for r in (rows or [])]
+    finally:
+        db.close()
 
-@app.get("/api/leaderboard")
-async def get_leaderboard():
-    """Получение таблицы лидеров"""
-    db = None
+
+# King of the Hill: в полночь UTC итоги дня архивируются, очки обнуляются.
+# Снимок - один set-based INSERT; уникальный period_date делает сброс
+# идемпотентным (в том числе между несколькими инстансами).
+SQL_KOTH_SNAPSHOT = """
+    WITH r AS MATERIALIZED (
+        SELECT ROW_NUMBER() OVER (ORDER BY points DESC, wins DESC, user_id DESC) AS rank,
+               user_id, points, wins, losses
+        FROM leaderboard
+    ), p AS (
+        INSERT INTO koth_periods (period_date, players, winners)
+        SELECT %s::date,
+               (SELECT count(*) FROM r),
+               COALESCE((
+                   SELECT jsonb_agg(jsonb_build_object(
+                       'rank', r.rank, 'user_id', r.user_id, 'points', r.points, 'wins', r.wins,
+                       'username', u.username, 'wallet_address', u.wallet_address
+                   ) ORDER BY r.rank)
+                   FROM r LEFT JOIN users u ON u.id = r.user_id
+                   WHERE r.rank <= 3
+               ), '[]'::jsonb)
+        ON CONFLICT (period_date) DO NOTHING
+        RETURNING id, players
+    ), s AS (
+        INSERT INTO koth_standings (period_id, rank, user_id, points, wins, losses)
+        SELECT p.id, r.rank, r.user_id, r.points, r.wins, r.losses
+        FROM p CROSS JOIN r
+    )
+    SELECT id, players FROM p
+"""
+
+# Обнуление короткими пачками: каждая пачка держит блокировки строк
+# миллисекунды, а строки, занятые живым списанием ставки, пропускаются и
+# берутся следующей пачкой. Вычитается снятое значение, поэтому очки,
+# заработанные после снимка, сохраняются.
+SQL_KOTH_ZERO_BATCH = """
+    WITH batch AS (
+        SELECT s.user_id, s.points
+        FROM koth_standings s
+        JOIN leaderboard l ON l.user_id = s.user_id
+        WHERE s.period_id = %s AND NOT s.applied
+        ORDER BY s.user_id
+        LIMIT %s
+        FOR UPDATE OF s, l SKIP LOCKED
+    ), z AS (
+        UPDATE leaderboard l
+        SET points = GREATEST(l.points - b.points, 0)
+        FROM batch b
+        WHERE l.user_id = b.user_id
+        RETURNING l.user_id, l.points, l.wins, l.losses
+    ), a AS (
+        UPDATE koth_standings s
+        SET applied = TRUE
+        FROM z
+        WHERE s.period_id = %s AND s.user_id = z.user_id
+    )
+    SELECT user_id, points, wins, losses FROM z
+"""
+
+SQL_KOTH_PENDING = """
+    SELECT count(*) AS n
+    FROM koth_standings s
+    JOIN leaderboard l ON l.user_id = s.user_id
+    WHERE s.period_id = %s AND NOT s.applied
+"""
+
+
+def _next_koth_reset(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.utcnow()
+    return datetime(now.year, now.month, now.day) + timedelta(days=1)
+
+
+async def _koth_zero(db, period_id: int) -> int:
+    zeroed = 0
+    idle_rounds = 0
+    while True:
+        rows = await run_db(
+            db.execute_query,
+            SQL_KOTH_ZERO_BATCH,
+            (period_id, settings.koth_zero_batch_size, period_id),
+            fetch="all",
+        ) or []
+        zeroed += len(rows)
+        if rows:
+            # Off the event loop: a full reset is hundreds of batches
+            await asyncio.to_thread(rank_index.upsert_many, rows)
+            # Keep /leaderboard in step with the rank index while zeroing is under way
+            _leaderboard_changed()
+            idle_rounds = 0
+            continue
+        pending = await run_db(db.execute_query, SQL_KOTH_PENDING, (period_id,), fetch="one")
+        if not pending or not int(pending["n"]):
+            return zeroed
+        # Only rows locked by live debits are left; let them commit
+        idle_rounds += 1
+        if idle_rounds > 100:
+            raise RuntimeError(f"KOTH period {period_id}: {pending['n']} rows still locked")
+        await asyncio.sleep(0.05)
+
+
+async def koth_reset(period_date) -> Dict[str, Any]:
+    """Архивирует итоги дня period_date и обнуляет очки; повторный вызов
+    только доводит до конца незавершённое обнуление.
+    """
+    db = Database()
     try:
-        db = Database()
-        db.connect()
-        
-        leaderboard_query = """
-            SELECT l.*, u.username, u.wallet_address 
-            FROM leaderboard l 
-            JOIN users u ON l.user_id = u.id 
-            ORDER BY l.points DESC, l.wins DESC 
-            LIMIT 100
-        """
-        leaderboard = db.execute_query(leaderboard_query, fetch="all")
+        await run_db(db.connect)
+        created = await run_db(db.execute_query, SQL_KOTH_SNAPSHOT, (period_date,), fetch="one")
+        period = await run_db(
+            db.execute_query,
+            "SELECT id, players, status FROM koth_periods WHERE period_date = %s",
+            (period_date,),
+            fetch="one",
+        )
+        if not period:
+            raise RuntimeError(f"KOTH period {period_date} was not recorded")
+        zeroed = 0
+        if period["status"] != "completed":
+            zeroed = await _koth_zero(db, int(period["id"]))
+            await run_db(
+                db.execute_query,
+                "UPDATE koth_periods SET status = 'completed', completed_at = NOW() WHERE id = %s",
+                (period["id"],),
+                fetch="none",
+            )
+    finally:
+        db.close()
 
-        entries = [dict(entry) for entry in (leaderboard or [])]
-        # Defense-in-depth: enforce contract even if DB returns unsorted data
-        entries.sort(key=lambda e: (-int(e.get("points", 0)), -int(e.get("wins", 0))))
-        entries = entries[:100]
+    _leaderboard_changed()
+    logger.info(f"KOTH reset for {period_date}: {period['players']} players, {zeroed} zeroed")
+    return {
+        "period": str(period_date),
+        "created": created is not None,
+        "players": int(period["players"] or 0),
+        "zeroed": zeroed,
+    }
 
-        return {"leaderboard": entries}
-        
+
+async def _koth_resume_pending() -> None:
+    db = Database()
+    try:
+        await run_db(db.connect)
+        rows = await run_db(
+            db.execute_query,
+            "SELECT period_date FROM koth_periods WHERE status <> 'completed' ORDER BY period_date",
+            fetch="all",
+        ) or []
+    finally:
+        db.close()
+    for r in rows:
+        await koth_reset(r["period_date"])
+
+
+async def _koth_scheduler() -> None:
+    try:
+        await _koth_resume_pending()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"KOTH resume failed: {e}")
+    while True:
+        next_reset = _next_koth_reset()
+        await asyncio.sleep(max(0.0, (next_reset - datetime.utcnow()).total_seconds()))
+        try:
+            await koth_reset((next_reset - timedelta(days=1)).date())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"KOTH reset failed: {e}")
+
+
+async def _load_koth(primary: bool = False) -> Dict[str, Any]:
+    top = await _load_leaderboard(3, primary=primary)
+    top.sort(key=_leaderboard_sort_key)
+    db = Database(read_only=not primary)
+    try:
+        await run_db(db.connect)
+        last = await run_db(
+            db.execute_query,
+            "SELECT period_date, players, winners, status, reset_at FROM koth_periods "
+            "ORDER BY period_date DESC LIMIT 1",
+            fetch="one",
+        )
+    finally:
+        db.close()
+    return {
+        "top": [{"rank": i, **e} for i, e in enumerate(top[:3], start=1)],
+        "nextReset": _next_koth_reset().isoformat() + "Z",
+        "lastReset": {
+            "period": str(last["period_date"]),
+            "players": last["players"],
+            "winners": last["winners"] or [],
+            "status": last["status"],
+        } if last else None,
+    }
+
+
+@app.get("/api/leaderboard")
+async def get_leaderboard(request: Request, after: Optional[str] = None, limit: Optional[int] = None):
+    """Получение таблицы лидеров.
+
+    Без параметров - первая страница из снимка в памяти; дальше по курсору
+    next: ?after=<next>&limit=N.
+    """
+    if limit is not None and not 1 <= limit <= 500:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="limit must be between 1 and 500")
+    position = None
+    if after is not None:
+        try:
+            position = _decode_leaderboard_cursor(after)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    if position is not None or (limit is not None and limit != leaderboard_snapshot.limit):
+        page_size = limit or leaderboard_snapshot.limit
+        try:
+            entries = await _load_leaderboard(page_size, position)
+        except Exception as e:
+            logger.error(f"Leaderboard page error: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to get leaderboard"
+            )
+        return cached_json_response(
+            request, _json_bytes(_leaderboard_page(entries, page_size)), CACHE_CONTROL["leaderboard"]
+        )
+
+    try:
+        body, etag, modified = await leaderboard_snapshot.get(_load_leaderboard)
     except Exception as e:
         logger.error(f"Leaderboard error: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to get leaderboard"
         )
+    return cached_json_response(request, body, CACHE_CONTROL["leaderboard"], etag, modified)
+
+async def _load_rank_page(after_user_id: int, limit: int, primary: bool = False) -> List[Dict[str, Any]]:
+    db = Database(read_only=not primary)
+    try:
+        await run_db(db.connect)
+        return await run_db(
+            db.execute_query,
+            "SELECT user_id, points, wins, losses FROM leaderboard "
+            "WHERE user_id > %s ORDER BY user_id LIMIT %s",
+            (after_user_id, limit),
+            fetch="all",
+        ) or []
     finally:
-        if db:
+        db.close()
+
+
+async def _ensure_rank_index() -> None:
+    await rank_index.ensure_loaded(_load_rank_page, settings.rank_index_page_size)
+
+
+async def _patch_rank_index(user_ids: List[int]) -> None:
+    """Перечитать с primary счёт игроков, изменённых другим воркером"""
+    db = Database()
+    try:
+        await run_db(db.connect)
+        rows = await run_db(
+            db.execute_query,
+            "SELECT user_id, points, wins, losses FROM leaderboard WHERE user_id = ANY(%s)",
+            (user_ids,),
+            fetch="all",
+        ) or []
+    finally:
+        db.close()
+    found = set()
+    for r in rows:
+        rank_index.upsert(r["user_id"], r["points"], r["wins"], r["losses"])
+        found.add(int(r["user_id"]))
+    for user_id in user_ids:
+        if user_id not in found:
+            rank_index.remove(user_id)
+
+
+class LeaderboardSync:
+    """Изменения лидерборда, сделанные другими воркерами (NOTIFY leaderboard_changed).
+
+    Полезная нагрузка - "<application_name>:<user_id,...>" или "<...>:*" для
+    массовых изменений (сброс KOTH). Свои записи уже применены локально и
+    пропускаются; на чужие сбрасываются снимки и будится рассылка, а индекс
+    рангов точечно дочитывает изменившихся игроков или пересинхронизируется
+    целиком.
+    """
+
+    def __init__(self, origin: str):
+        self.origin = origin
+        self._resync: Optional[asyncio.Task] = None
+        self._again = False
+        self._counters = {"remote": 0, "own": 0, "patched": 0, "resyncs": 0, "errors": 0}
+
+    async def handle(self, payloads: Optional[List[str]]) -> None:
+        """payloads=None - слушатель переподключился и мог пропустить уведомления"""
+        user_ids: set = set()
+        everything = payloads is None
+        for payload in payloads or []:
+            origin, _, ids = payload.rpartition(":")
+            if origin == self.origin:
+                self._counters["own"] += 1
+                continue
+            self._counters["remote"] += 1
+            if ids == "*":
+                everything = True
+            else:
+                user_ids.update(int(i) for i in ids.split(",") if i.isdigit())
+        if not everything and not user_ids:
+            return
+
+        _leaderboard_changed()
+        if not rank_index.loaded:
+            return  # the lazy first load reads the current table anyway
+        if everything:
+            self.request_resync()
+            return
+        try:
+            await _patch_rank_index(sorted(user_ids))
+            self._counters["patched"] += len(user_ids)
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.warning(f"Rank index patch failed, resyncing: {e}")
+            self.request_resync()
+
+    def request_resync(self) -> None:
+        loop = asyncio.get_running_loop()
+        running = self._resync
+        if running is not None and not running.done() and running.get_loop() is loop:
+            # Changes that arrive mid-load may be missed by it: load once more afterwards
+            self._again = True
+            return
+        self._resync = loop.create_task(self._run_resync())
+
+    async def _run_resync(self) -> None:
+        while True:
+            self._again = False
+            try:
+                await rank_index.ensure_loaded(
+                    functools.partial(_load_rank_page, primary=True), settings.rank_index_page_size, force=True
+                )
+                self._counters["resyncs"] += 1
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.warning(f"Rank index resync failed: {e}")
+                return
+            if not self._again:
+                return
+
+    def reset(self) -> None:
+        if self._resync is not None and not self._resync.done():
+            self._resync.cancel()
+        self._resync = None
+        self._again = False
+        self._counters = {k: 0 for k in self._counters}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "resyncing": self._resync is not None and not self._resync.done()}
+
+
+leaderboard_sync = LeaderboardSync(WORKER_ID)
+
+
+async def _rank_index_resync_loop() -> None:
+    """Страховка от потерянных уведомлений: периодическая полная пересинхронизация"""
+    while True:
+        await asyncio.sleep(settings.rank_index_resync_seconds)
+        if rank_index.loaded:
+            leaderboard_sync.request_resync()
+
+
+async def _warm_rank_index() -> None:
+    try:
+        await _ensure_rank_index()
+        logger.info(f"Rank index loaded: {len(rank_index)} players")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # Loaded lazily on the first rank request instead
+        logger.warning(f"Rank index warm-up failed: {e}")
+
+
+async def _ranked_user(user_id: int) -> Optional[Dict[str, int]]:
+    """Позиция игрока; игрока, ещё не попавшего в индекс, подгружает из БД"""
+    await _ensure_rank_index()
+    me = rank_index.rank_of(user_id)
+    if me is not None:
+        return me
+    db = Database(read_only=True)
+    try:
+        await run_db(db.connect)
+        row = await run_db(
+            db.execute_query,
+            "SELECT user_id, points, wins, losses FROM leaderboard WHERE user_id = %s",
+            (user_id,),
+            fetch="one",
+        )
+    finally:
+        db.close()
+    if not row:
+        return None
+    rank_index.upsert(row["user_id"], row["points"], row["wins"], row["losses"])
+    return rank_index.rank_of(user_id)
+
+
+@app.get("/api/leaderboard/stream")
+async def leaderboard_stream(request: Request):
+    """Живой топ лидерборда (SSE): событие snapshot, затем diff"""
+    if leaderboard_broadcaster.full():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many subscribers")
+    try:
+        sub = await leaderboard_broadcaster.subscribe(_load_leaderboard)
+    except Exception as e:
+        logger.error(f"Leaderboard stream error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get leaderboard"
+        )
+
+    heartbeat = settings.leaderboard_stream_heartbeat_s
+
+    async def frames():
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield b": ping\n\n"
+                    continue
+                if frame is None:
+                    break  # dropped as too slow; the client reconnects for a fresh snapshot
+                yield frame
+        finally:
+            leaderboard_broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/leaderboard/koth")
+async def get_koth(request: Request):
+    """King of the Hill: текущий топ 3, время сброса и победители прошлого дня"""
+    try:
+        body, etag, modified = await koth_snapshot.get(_load_koth)
+    except Exception as e:
+        logger.error(f"KOTH error: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get KOTH"
+        )
+    return cached_json_response(request, body, CACHE_CONTROL["koth"], etag, modified)
+
+
+@app.get("/api/leaderboard/me")
+async def get_my_rank(current_user: dict = Depends(get_current_user)):
+    """Место текущего игрока в таблице лидеров"""
+    db = Database(read_only=True, user=current_user["wallet_address"])
+    try:
+        await run_db(db.connect)
+        user_id = await resolve_user_id(current_user, db)
+    finally:
+        db.close()
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    me = await _ranked_user(user_id)
+    if me is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Player is not ranked")
+    return {**me, "total": len(rank_index)}
+
+
+@app.get("/api/leaderboard/around/{user}")
+async def get_rank_neighbours(user: str, radius: int = 5):
+    """Игроки вокруг заданного (по user_id или адресу кошелька)"""
+    if not 1 <= radius <= 50:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="radius must be between 1 and 50")
+
+    # Wallet addresses are 32+ base58 chars and may themselves be all digits
+    if user.isdigit() and len(user) < 32:
+        user_id = int(user)
+    else:
+        db = Database(read_only=True)
+        try:
+            await run_db(db.connect)
+            row = await run_db(db.execute_query, SQL_USER_ID_BY_WALLET, (user,), fetch="one")
+        finally:
             db.close()
+        user_id = int(row["id"]) if row else None
+
+    # No connection is held here: loading the rank index takes pool connections of its own
+    me = await _ranked_user(user_id) if user_id is not None else None
+    if me is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Player is not ranked")
+
+    entries = rank_index.around(user_id, radius)
+    ids = [e["user_id"] for e in entries]
+    db = Database(read_only=True)
+    try:
+        await run_db(db.connect)
+        names = await run_db(
+            db.execute_query,
+            "SELECT id, username, wallet_address FROM users WHERE id = ANY(%s)",
+            (ids,),
+            fetch="all",
+        )
+    finally:
+        db.close()
+
+    by_id = {int(n["id"]): n for n in (names or [])}
+    for e in entries:
+        n = by_id.get(e["user_id"]) or {}
+        e["username"] = n.get("username")
+        e["wallet_address"] = n.get("wallet_address")
+    return {"rank": me["rank"], "total": len(rank_index), "entries": entries}
+
+
+@app.get("/api/admin/db/pool")
+async def admin_db_pool_stats(_: bool = Depends(require_admin)):
+    """Статистика пула соединений с БД"""
+    return {
+        "pool": db_pool.stats(),
+        "leaks": db_pool.find_leaks(),
+        "replica_pool": replica_pool.stats() if replica_pool is not None else None,
+        "routing": replica_router.stats(),
+    }
+
+
+@app.delete("/api/admin/users/{wallet_address}")
+async def admin_delete_user(wallet_address: str, _: bool = Depends(require_admin)):
+    """Удаление пользователя (каскадом) со сбросом кэша идентичности"""
+    db = Database()
+    try:
+        row = await run_db(
+            db.execute_query,
+            "DELETE FROM users WHERE wallet_address = %s RETURNING id",
+            (wallet_address,),
+            fetch="one",
+        )
+    finally:
+        db.close()
+    identity_cache.invalidate(wallet=wallet_address, user_id=int(row["id"]) if row else None)
+    _leaderboard_changed()
+    if row:
+        rank_index.remove(int(row["id"]))
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return {"deleted": int(row["id"])}
+
+
+@app.post("/api/admin/skills/reload")
+async def admin_skills_reload(_: bool = Depends(require_admin)):
+    """Перечитать каталог скиллов из БД без рестарта"""
+    try:
+        await skill_registry.reload()
+    except Exception as e:
+        logger.error(f"Skills reload failed: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Skills reload failed")
+    return skill_registry.stats()
+
+
+@app.get("/api/admin/cache")
+async def admin_cache_stats(_: bool = Depends(require_admin)):
+    """Попадания по уровням кэша, загрузки и ошибки общего уровня"""
+    return {"cache": shared_cache.stats()}
+
+
+@app.get("/api/admin/http")
+async def admin_http_stats(_: bool = Depends(require_admin)):
+    """Исходящие RPC: HTTP/2, открытые хосты, латентность по методам"""
+    return outbound_http.info()
+
+
+@app.post("/api/admin/scan-cache/invalidate")
+async def admin_scan_cache_invalidate(wallet: str, _: bool = Depends(require_admin)):
+    """Сбросить кэш скана кошелька (например, после минта или трансфера)"""
+    await wallet_scan_cache.invalidate(wallet, settings.collection_address)
+    return {"invalidated": wallet, "stats": wallet_scan_cache.stats()}
+
+
+@app.post("/api/admin/token-balances")
+async def admin_token_balances(payload: TokenBalancesRequest, _: bool = Depends(require_admin)):
+    """Балансы TOKEN_MINT для многих кошельков (JSON-RPC batch)"""
+    if not settings.token_mint:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="TOKEN_MINT not configured")
+    balances = await _solana_get_token_balances(payload.wallets, settings.token_mint)
+    return {
+        "mint": settings.token_mint,
+        "balances": balances,
+        "failed": sorted(w for w, b in balances.items() if b is None),
+    }
+
+
+@app.post("/api/admin/koth/reset")
+async def admin_koth_reset(period: Optional[str] = None, _: bool = Depends(require_admin)):
+    """Ручной запуск (или доведение) сброса KOTH за день period (YYYY-MM-DD, по умолчанию вчера UTC)"""
+    try:
+        period_date = datetime.strptime(period, "%Y-%m-%d").date() if period else (
+            datetime.utcnow() - timedelta(days=1)
+        ).date()
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="period must be YYYY-MM-DD")
+    return await koth_reset(period_date)
+
+
+@app.get("/api/admin/db/statements")
+async def admin_db_statement_stats(_: bool = Depends(require_admin)):
+    """Попадания/промахи по подготовленным запросам"""
+    return {"prepared": statements.stats()}
+
+
+@app.get("/api/admin/db/queries")
+async def admin_db_query_stats(
+    sort: str = "total_ms",
+    limit: int = 50,
+    _: bool = Depends(require_admin),
+):
+    """Латентность, строки и ошибки по нормализованным запросам + медленные запросы"""
+    if sort not in ("total_ms", "calls", "mean_ms", "max_ms", "errors", "rows"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sort key")
+    return {
+        "slow_query_ms": query_stats.slow_ms,
+        "queries": query_stats.snapshot(sort=sort, limit=max(1, min(limit, 500))),
+        "slow": query_stats.slow_queries(),
+    }
 
 # Конфигурация для фронтенда (перед монтированием статики)
 @app.get("/api/config")
-async def get_frontend_config():
+async def get_frontend_config(request: Request):
     """Отдача конфигурации для фронтенда"""
-    return {
+    body = _json_bytes({
         "DEBUG_MODE": settings.debug_mode,
         "API_BASE_URL": "/api",
         "TOKEN_MINT": settings.token_mint,
         "SOLANA_RPC": settings.solana_rpc,
-    }
+    })
+    return cached_json_response(request, body, CACHE_CONTROL["config"])
 
 # Подключение статики фронтенда (после всех API роутов)
-app.mount("/", StaticFiles(directory="frontend", html=True), name="static")
+app.mount("/", static_files, name="static")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,69 @@
+"""
+Окружение alembic: подключение к той же БД, что и у приложения.
+"""
+
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+from sqlalchemy.engine import URL
+
+from main import settings
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+# Схема описана сырым SQL в ревизиях, автогенерации по моделям нет
+target_metadata = None
+
+
+def _database_url():
+    url = config.get_main_option("sqlalchemy.url")
+    if url:
+        return url
+    return URL.create(
+        "postgresql+psycopg2",
+        username=settings.db_user,
+        password=settings.db_password,
+        host=settings.db_host,
+        port=settings.db_port,
+        database=settings.db_name,
+    )
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=_database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    engine = create_engine(
+        _database_url(),
+        poolclass=pool.NullPool,
+        connect_args={"connect_timeout": settings.db_connect_timeout},
+    )
+    with engine.connect() as connection:
+        # Каждая ревизия в своей транзакции: ревизии с CREATE INDEX CONCURRENTLY
+        # выходят из неё через autocommit_block, не держа открытыми соседние DDL.
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+    engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
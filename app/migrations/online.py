@@ -0,0 +1,36 @@
+"""
+Хелперы для онлайн-миграций: индексы строятся без блокировки записи.
+"""
+
+from alembic import context, op
+from sqlalchemy import text
+
+
+def _index_is_invalid(name: str) -> bool:
+    if context.is_offline_mode():
+        return False
+    row = op.get_bind().execute(
+        text(
+            "SELECT NOT i.indisvalid FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+        ),
+        {"name": name},
+    ).scalar()
+    return bool(row)
+
+
+def create_index_concurrently(name: str, table: str, definition: str) -> None:
+    """CREATE INDEX CONCURRENTLY вне транзакции ревизии.
+
+    Прерванная сборка оставляет INVALID-индекс, который IF NOT EXISTS
+    молча пропустил бы, поэтому такой индекс сначала удаляется.
+    """
+    with op.get_context().autocommit_block():
+        if _index_is_invalid(name):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}")
+
+
+def drop_index_concurrently(name: str) -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
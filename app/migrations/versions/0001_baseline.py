@@ -0,0 +1,143 @@
+"""Базовая схема (соответствует db/init.sql)
+
+Ревизия идемпотентна: на базе, уже созданной через init.sql, она ничего
+не меняет и только ставит отметку версии.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            wallet_address VARCHAR(44) UNIQUE NOT NULL,
+            username VARCHAR(20),
+            avatar_url TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            last_login TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_nfts (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            mint_address VARCHAR(44) NOT NULL,
+            name VARCHAR(200),
+            image_url VARCHAR(500),
+            rarity VARCHAR(50),
+            level INTEGER DEFAULT 1,
+            experience INTEGER DEFAULT 0,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            UNIQUE(user_id, mint_address)
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS skills (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            description TEXT,
+            cost_tokens INTEGER DEFAULT 50000,
+            required_level INTEGER DEFAULT 1,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_skills (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            nft_id INTEGER REFERENCES user_nfts(id) ON DELETE CASCADE,
+            skill_id INTEGER REFERENCES skills(id) ON DELETE CASCADE,
+            level INTEGER DEFAULT 1,
+            unlocked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            UNIQUE(user_id, nft_id, skill_id)
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_tokens (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE UNIQUE,
+            balance BIGINT DEFAULT 0,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS game_sessions (
+            id SERIAL PRIMARY KEY,
+            player1_id INTEGER REFERENCES users(id),
+            player2_id INTEGER REFERENCES users(id),
+            player1_nft_id INTEGER REFERENCES user_nfts(id),
+            player2_nft_id INTEGER REFERENCES user_nfts(id),
+            winner_id INTEGER REFERENCES users(id),
+            status VARCHAR(20) DEFAULT 'waiting',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            completed_at TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE UNIQUE,
+            wins INTEGER DEFAULT 0,
+            losses INTEGER DEFAULT 0,
+            points INTEGER DEFAULT 0,
+            rank INTEGER,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """
+    )
+
+    op.execute("CREATE INDEX IF NOT EXISTS idx_users_wallet ON users(wallet_address)")
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username) "
+        "WHERE username IS NOT NULL"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS idx_user_nfts_user_id ON user_nfts(user_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_user_tokens_user_id ON user_tokens(user_id)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_leaderboard_points ON leaderboard(points DESC)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_game_sessions_status ON game_sessions(status)")
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION update_updated_at_column()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.updated_at = NOW();
+            RETURN NEW;
+        END;
+        $$ language 'plpgsql'
+        """
+    )
+    for table in ("users", "user_tokens", "leaderboard"):
+        op.execute(
+            f"CREATE OR REPLACE TRIGGER update_{table}_updated_at BEFORE UPDATE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()"
+        )
+
+
+def downgrade() -> None:
+    # Базовую схему не откатываем: это удалило бы все данные
+    pass
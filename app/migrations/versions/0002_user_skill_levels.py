@@ -0,0 +1,38 @@
+"""Таблица уровней навыков user_skill_levels
+
+В неё пишет /api/skills/upgrade (INSERT ... ON CONFLICT (user_id, skill_key)),
+но init.sql её никогда не создавал.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_skill_levels (
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            skill_key VARCHAR(64) NOT NULL,
+            level INTEGER NOT NULL DEFAULT 1 CHECK (level >= 1),
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            PRIMARY KEY (user_id, skill_key)
+        )
+        """
+    )
+    op.execute(
+        "CREATE OR REPLACE TRIGGER update_user_skill_levels_updated_at BEFORE UPDATE ON user_skill_levels "
+        "FOR EACH ROW EXECUTE FUNCTION update_updated_at_column()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS user_skill_levels")
@@ -0,0 +1,31 @@
+"""Покрывающий индекс для сортировки лидерборда
+
+ORDER BY points DESC, wins DESC читается index-only scan'ом, user_id и losses
+берутся из INCLUDE. Старый idx_leaderboard_points становится лишним.
+Оба изменения выполняются CONCURRENTLY, без блокировки записи в leaderboard.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index_concurrently(
+        "idx_leaderboard_rank_covering",
+        "leaderboard",
+        "(points DESC, wins DESC) INCLUDE (user_id, losses)",
+    )
+    drop_index_concurrently("idx_leaderboard_points")
+
+
+def downgrade() -> None:
+    create_index_concurrently("idx_leaderboard_points", "leaderboard", "(points DESC)")
+    drop_index_concurrently("idx_leaderboard_rank_covering")
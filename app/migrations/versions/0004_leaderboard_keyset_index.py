@@ -0,0 +1,63 @@
+"""Индекс для keyset-пагинации лидерборда
+
+Курсор ?after= сравнивает строки (points, wins, user_id) < (...) и сортирует
+по всем трём колонкам DESC. Индекс с тем же порядком ключей отдаёт любую
+страницу одним range scan'ом и заменяет покрывающий индекс из 0003.
+
+Сравнение строк не работает с NULL, поэтому points/wins становятся NOT NULL.
+Это делается онлайн: CHECK NOT VALID -> VALIDATE (не блокирует запись) ->
+SET NOT NULL (использует проверенный CHECK вместо полного скана под
+эксклюзивной блокировкой).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE leaderboard SET points = COALESCE(points, 0), wins = COALESCE(wins, 0), "
+        "losses = COALESCE(losses, 0) WHERE points IS NULL OR wins IS NULL OR losses IS NULL"
+    )
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE leaderboard DROP CONSTRAINT IF EXISTS leaderboard_sort_not_null")
+        op.execute(
+            "ALTER TABLE leaderboard ADD CONSTRAINT leaderboard_sort_not_null "
+            "CHECK (points IS NOT NULL AND wins IS NOT NULL AND losses IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE leaderboard VALIDATE CONSTRAINT leaderboard_sort_not_null")
+        op.execute(
+            "ALTER TABLE leaderboard ALTER COLUMN points SET NOT NULL, "
+            "ALTER COLUMN wins SET NOT NULL, ALTER COLUMN losses SET NOT NULL"
+        )
+        op.execute("ALTER TABLE leaderboard DROP CONSTRAINT leaderboard_sort_not_null")
+
+    create_index_concurrently(
+        "idx_leaderboard_keyset",
+        "leaderboard",
+        "(points DESC, wins DESC, user_id DESC) INCLUDE (losses)",
+    )
+    drop_index_concurrently("idx_leaderboard_rank_covering")
+
+
+def downgrade() -> None:
+    create_index_concurrently(
+        "idx_leaderboard_rank_covering",
+        "leaderboard",
+        "(points DESC, wins DESC) INCLUDE (user_id, losses)",
+    )
+    drop_index_concurrently("idx_leaderboard_keyset")
+    op.execute(
+        "ALTER TABLE leaderboard ALTER COLUMN points DROP NOT NULL, "
+        "ALTER COLUMN wins DROP NOT NULL, ALTER COLUMN losses DROP NOT NULL"
+    )
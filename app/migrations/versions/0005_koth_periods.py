@@ -0,0 +1,54 @@
+"""Архив King of the Hill: итоги каждого дня и полные standings
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS koth_periods (
+            id BIGSERIAL PRIMARY KEY,
+            period_date DATE NOT NULL UNIQUE,
+            players INTEGER NOT NULL DEFAULT 0,
+            winners JSONB NOT NULL DEFAULT '[]'::jsonb,
+            status VARCHAR(16) NOT NULL DEFAULT 'snapshotted',
+            reset_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            completed_at TIMESTAMP WITH TIME ZONE
+        )
+        """
+    )
+    # user_id без внешнего ключа: архив переживает удаление пользователя
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS koth_standings (
+            period_id BIGINT NOT NULL REFERENCES koth_periods(id) ON DELETE CASCADE,
+            rank INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            losses INTEGER NOT NULL,
+            applied BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (period_id, rank)
+        )
+        """
+    )
+    # Очередь обнуления: только ещё не применённые строки, в порядке пачек
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_koth_standings_pending "
+        "ON koth_standings (period_id, user_id) WHERE NOT applied"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS koth_standings")
+    op.execute("DROP TABLE IF EXISTS koth_periods")
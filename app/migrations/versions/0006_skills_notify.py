@@ -0,0 +1,37 @@
+"""NOTIFY skills_changed на любое изменение каталога скиллов
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_skills_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('skills_changed', TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # FOR EACH STATEMENT: одна массовая правка - одно уведомление
+    op.execute("DROP TRIGGER IF EXISTS skills_changed ON skills")
+    op.execute(
+        "CREATE TRIGGER skills_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON skills "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_skills_changed()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS skills_changed ON skills")
+    op.execute("DROP FUNCTION IF EXISTS notify_skills_changed()")
@@ -0,0 +1,64 @@
+"""NOTIFY leaderboard_changed: другие воркеры сбрасывают снимки и индекс рангов
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+EVENTS = (("insert", "INSERT", "NEW"), ("update", "UPDATE", "NEW"), ("delete", "DELETE", "OLD"))
+
+
+def upgrade() -> None:
+    # Полезная нагрузка "<application_name>:<user_id,...>": воркер узнаёт свои
+    # записи по application_name; '*' - изменено слишком много строк для NOTIFY
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_leaderboard_changed() RETURNS trigger AS $$
+        DECLARE
+            ids text := '*';
+        BEGIN
+            IF TG_OP <> 'TRUNCATE' THEN
+                SELECT string_agg(DISTINCT user_id::text, ',') INTO ids FROM changed_rows;
+                IF ids IS NULL THEN
+                    RETURN NULL;
+                END IF;
+                IF length(ids) > 7000 THEN
+                    ids := '*';
+                END IF;
+            END IF;
+            PERFORM pg_notify(
+                'leaderboard_changed',
+                coalesce(current_setting('application_name', true), '') || ':' || ids
+            );
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # FOR EACH STATEMENT с таблицами переходов: одна пачка - одно уведомление
+    for name, event, rows in EVENTS:
+        op.execute(f"DROP TRIGGER IF EXISTS leaderboard_changed_{name} ON leaderboard")
+        op.execute(
+            f"CREATE TRIGGER leaderboard_changed_{name} AFTER {event} ON leaderboard "
+            f"REFERENCING {rows} TABLE AS changed_rows "
+            "FOR EACH STATEMENT EXECUTE FUNCTION notify_leaderboard_changed()"
+        )
+    op.execute("DROP TRIGGER IF EXISTS leaderboard_changed_truncate ON leaderboard")
+    op.execute(
+        "CREATE TRIGGER leaderboard_changed_truncate AFTER TRUNCATE ON leaderboard "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_leaderboard_changed()"
+    )
+
+
+def downgrade() -> None:
+    for name, _, _ in EVENTS:
+        op.execute(f"DROP TRIGGER IF EXISTS leaderboard_changed_{name} ON leaderboard")
+    op.execute("DROP TRIGGER IF EXISTS leaderboard_changed_truncate ON leaderboard")
+    op.execute("DROP FUNCTION IF EXISTS notify_leaderboard_changed()")
@@ -0,0 +1,46 @@
+"""NOTIFY users_deleted: все воркеры ставят tombstone удалённым пользователям
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # id пачками по 500, чтобы полезная нагрузка не упёрлась в лимит NOTIFY (8000 байт)
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION notify_users_deleted() RETURNS trigger AS $$
+        DECLARE
+            ids text;
+        BEGIN
+            FOR ids IN
+                SELECT string_agg(id::text, ',')
+                FROM (SELECT id, (row_number() OVER () - 1) / 500 AS chunk FROM deleted_rows) d
+                GROUP BY chunk
+            LOOP
+                PERFORM pg_notify('users_deleted', ids);
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute("DROP TRIGGER IF EXISTS users_deleted ON users")
+    op.execute(
+        "CREATE TRIGGER users_deleted AFTER DELETE ON users "
+        "REFERENCING OLD TABLE AS deleted_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION notify_users_deleted()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_deleted ON users")
+    op.execute("DROP FUNCTION IF EXISTS notify_users_deleted()")
@@ -21,3 +21,43 @@ def _disable_rate_limiting():
         yield
     finally:
         app.state.testing = prev
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_caches():
+    """Process-level caches must not leak state between tests."""
+    try:
+        import main
+    except Exception:
+        yield
+        return
+
+    main.identity_cache.clear()
+    main.query_stats.reset()
+    main.leaderboard_snapshot.clear()
+    main.rank_index.clear()
+    main.leaderboard_broadcaster.reset()
+    main.koth_snapshot.clear()
+    main.skills_snapshot.clear()
+    main.skill_registry.clear()
+    main.shared_cache.clear()
+    main.compression_memo.clear()
+    main.upstream_stats.reset()
+    main.rpc_flights.reset()
+    main.wallet_scan_cache.clear()
+    main.leaderboard_sync.reset()
+    yield
+    main.identity_cache.clear()
+    main.query_stats.reset()
+    main.leaderboard_snapshot.clear()
+    main.rank_index.clear()
+    main.leaderboard_broadcaster.reset()
+    main.koth_snapshot.clear()
+    main.skills_snapshot.clear()
+    main.skill_registry.clear()
+    main.shared_cache.clear()
+    main.compression_memo.clear()
+    main.upstream_stats.reset()
+    main.rpc_flights.reset()
+    main.wallet_scan_cache.clear()
+    main.leaderboard_sync.reset()
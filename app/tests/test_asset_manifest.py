@@ -0,0 +1,85 @@
+import gzip
+import re
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _refs(html: str):
+    return re.findall(r'(?:src|href)="([^"]+)"', html)
+
+
+def test_pages_reference_fingerprinted_assets():
+    c = TestClient(main.app)
+    resp = c.get("/")
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == "no-cache"
+
+    refs = [r for r in _refs(resp.text) if "//" not in r]
+    assert "css/style.css" not in refs
+    assert any(re.fullmatch(r"css/style\.[0-9a-f]{12}\.css", r) for r in refs)
+    assert any(re.fullmatch(r"js/landing\.[0-9a-f]{12}\.js", r) for r in refs)
+
+    again = c.get("/", headers={"If-None-Match": resp.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_protected_page_is_rewritten_too():
+    token = main.SecurityUtils.create_jwt_token({"userId": 1, "walletAddress": "11111111111111111111111111111112"})
+    resp = TestClient(main.app).get("/app.html", headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200
+    assert re.search(r'src="assets/frame\.[0-9a-f]{12}\.png"', resp.text)
+    assert re.search(r'src="js/game\.[0-9a-f]{12}\.js"', resp.text)
+
+
+def test_hashed_urls_are_immutable():
+    c = TestClient(main.app)
+    manifest = main.static_files.manifest()
+
+    frame = c.get(manifest.url_for("assets/frame.png"))
+    assert frame.status_code == 200
+    assert frame.headers["cache-control"] == main.FingerprintedStaticFiles.IMMUTABLE
+    assert frame.content == c.get("/assets/frame.png").content
+
+    # game.js is rewritten to point at the hashed frame.png and served from memory
+    game = c.get(manifest.url_for("js/game.js"))
+    assert game.headers["cache-control"] == main.FingerprintedStaticFiles.IMMUTABLE
+    assert manifest.url_for("assets/frame.png").lstrip("/") in game.text
+
+    assert c.get("/js/game.000000000000.js").status_code == 404
+    # Unhashed URLs keep the default revalidating behaviour
+    assert "immutable" not in c.get("/js/game.js").headers.get("cache-control", "")
+
+
+def test_in_memory_assets_are_precompressed():
+    c = TestClient(main.app)
+    url = main.static_files.manifest().url_for("js/game.js")
+    with c.stream("GET", url, headers={"Accept-Encoding": "gzip"}) as resp:
+        raw = b"".join(resp.iter_raw())
+        assert resp.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw) == main.static_files.manifest().assets["js/game.js"].body
+
+
+def test_hash_follows_content_and_dependencies(tmp_path):
+    (tmp_path / "img").mkdir()
+    (tmp_path / "css").mkdir()
+    (tmp_path / "img" / "bg.png").write_bytes(b"one")
+    (tmp_path / "css" / "site.css").write_text("body { background: url('../img/bg.png'); }")
+    (tmp_path / "index.html").write_text(
+        '<link href="css/site.css"><img src="img/bg.png"><script src="https://cdn.example/x.js"></script>'
+    )
+
+    first = main.AssetManifest(str(tmp_path)).build()
+    css = first.assets["css/site.css"]
+    assert re.search(rb"\.\./img/bg\.[0-9a-f]{12}\.png", css.body)
+    page = first.pages["index.html"].body.decode()
+    assert f'href="{css.url}"' in page
+    assert 'src="https://cdn.example/x.js"' in page
+
+    (tmp_path / "img" / "bg.png").write_bytes(b"two")
+    second = main.AssetManifest(str(tmp_path)).build()
+    assert second.assets["img/bg.png"].url != first.assets["img/bg.png"].url
+    # The stylesheet embeds the image URL, so its own hash changes as well
+    assert second.assets["css/site.css"].url != css.url
+    assert second.pages["index.html"].etag != first.pages["index.html"].etag
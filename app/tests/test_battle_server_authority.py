@@ -35,6 +35,19 @@ class _BattleDB:
             row["points"] -= bet
             return {"points": row["points"], "wins": row["wins"], "losses": row["losses"]}
 
+        if q.startswith("update leaderboard as l") and "from (values" in q:
+            rows = []
+            for i in range(0, len(params), 4):
+                uid, points, wins, losses = (int(x) for x in params[i:i + 4])
+                row = self.leaderboard.get(uid)
+                if not row:
+                    continue
+                row["points"] += points
+                row["wins"] += wins
+                row["losses"] += losses
+                rows.append({"user_id": uid, **row})
+            return rows
+
         if q.startswith("update leaderboard") and "set points = points +" in q and "wins = wins + 1" in q:
             payout = int(params[0])
             uid = int(params[1])
@@ -71,7 +84,7 @@ def test_nft_stats_deterministic_with_salt(monkeypatch):
 def test_battle_start_rejects_insufficient_points(monkeypatch):
     db = _BattleDB()
     db.leaderboard[db.user_id]["points"] = 10
-    monkeypatch.setattr(main, "Database", lambda: db)
+    monkeypatch.setattr(main, "Database", lambda **_: db)
 
     c = TestClient(main.app)
     resp = c.post(
@@ -85,7 +98,7 @@ def test_battle_start_rejects_insufficient_points(monkeypatch):
 
 def test_battle_start_debits_and_resolves_updates_leaderboard(monkeypatch):
     db = _BattleDB()
-    monkeypatch.setattr(main, "Database", lambda: db)
+    monkeypatch.setattr(main, "Database", lambda **_: db)
 
     c = TestClient(main.app)
 
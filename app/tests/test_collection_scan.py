@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main
+
+COLLECTION = "Coll111"
+WALLET_SIZE = 10_000
+
+
+def _asset(i, collection):
+    grouping = [{"group_key": "collection", "group_value": collection}] if collection else []
+    return {
+        "id": f"mint{i}",
+        "grouping": grouping,
+        "content": {"metadata": {"name": f"Asset #{i}", "attributes": []}, "links": {}},
+    }
+
+
+class FakeDAS:
+    """Локальный DAS: кошелёк на WALLET_SIZE ассетов, из них ours - в коллекции.
+
+    search: "filter" - searchAssets фильтрует по grouping, "ignore" - игнорирует
+    фильтр и отдаёт всё подряд, "error" - метод не поддерживается.
+    """
+
+    def __init__(self, ours, search="filter"):
+        ours = set(ours)
+        self.assets = [_asset(i, COLLECTION if i in ours else "Other") for i in range(WALLET_SIZE)]
+        self.search = search
+        self.calls = []
+
+    def handler(self, request):
+        body = json.loads(request.content)
+        method, params = body["method"], body["params"]
+        self.calls.append((method, params["page"], params["limit"]))
+        items = self.assets
+        if method == "searchAssets":
+            if self.search == "error":
+                return httpx.Response(200, json={"jsonrpc": "2.0", "id": body["id"], "error": {"code": -32601, "message": "Method not found"}})
+            if self.search == "filter":
+                key, value = params["grouping"]
+                items = [a for a in items if any(g["group_key"] == key and g["group_value"] == value for g in a["grouping"])]
+        start = (params["page"] - 1) * params["limit"]
+        page = items[start:start + params["limit"]]
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": body["id"], "result": {"total": len(page), "items": page}})
+
+    def methods(self):
+        return [c[0] for c in self.calls]
+
+
+@pytest.fixture
+def das(monkeypatch):
+    monkeypatch.setattr(main.settings, "helius_api_key", "k")
+    monkeypatch.setattr(main.settings, "helius_rpc_url", "https://das.local/")
+    server = {}
+
+    def new_client(self):
+        client = real(self)
+        client._transport = httpx.MockTransport(lambda request: server["das"].handler(request))
+        return client
+
+    real = main.OutboundHTTP._new_client
+    monkeypatch.setattr(main.OutboundHTTP, "_new_client", new_client)
+
+    def make(ours, search="filter"):
+        server["das"] = FakeDAS(ours, search)
+        return server["das"]
+
+    return make
+
+
+def _scan(collection=COLLECTION):
+    async def go():
+        try:
+            return await main._fetch_wallet_scan("Owner111", collection)
+        finally:
+            await main.outbound_http.aclose()
+
+    return asyncio.run(go())
+
+
+def test_server_side_filter_takes_single_small_page(das):
+    fake = das(range(9000, 9010))
+
+    nfts = _scan()
+
+    assert [n["id"] for n in nfts] == ["mint9000", "mint9001", "mint9002"]
+    assert fake.calls == [("searchAssets", 1, main.WALLET_SCAN_MAX_NFTS)]
+
+
+def test_fallback_stops_paging_once_three_found(das):
+    fake = das([2500, 2600, 2700, 9500], search="error")
+
+    nfts = _scan()
+
+    assert [n["id"] for n in nfts] == ["mint2500", "mint2600", "mint2700"]
+    page = main.settings.helius_scan_page_size
+    assert fake.calls == [("searchAssets", 1, 3)] + [("getAssetsByOwner", p, page) for p in (1, 2, 3)]
+
+
+def test_filter_ignored_by_server_falls_back_to_client_filter(das):
+    fake = das([10, 20, 30], search="ignore")
+
+    nfts = _scan()
+
+    assert [n["id"] for n in nfts] == ["mint10", "mint20", "mint30"]
+    assert fake.methods() == ["searchAssets", "getAssetsByOwner"]
+
+
+def test_wallet_without_collection_nfts(das):
+    fake = das([])
+    assert _scan() == []
+    assert fake.methods() == ["searchAssets"]
+
+    fake = das([], search="error")
+    assert _scan() == []
+    # 10 полных страниц + короткая, после которой ассетов больше нет
+    assert fake.methods().count("getAssetsByOwner") == WALLET_SIZE // main.settings.helius_scan_page_size + 1
+
+
+def test_max_pages_bounds_scan(das, monkeypatch):
+    monkeypatch.setattr(main.settings, "helius_scan_max_pages", 2)
+    fake = das([], search="error")
+
+    assert _scan() == []
+    assert fake.methods() == ["searchAssets", "getAssetsByOwner", "getAssetsByOwner"]
+
+
+def test_without_collection_takes_first_assets(das):
+    fake = das([])
+
+    nfts = _scan(collection="")
+
+    assert [n["id"] for n in nfts] == ["mint0", "mint1", "mint2"]
+    assert fake.calls == [("getAssetsByOwner", 1, 3)]
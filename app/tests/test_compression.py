@@ -0,0 +1,160 @@
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import main
+from tests.test_leaderboard_snapshot import _CountingDB
+
+
+def _raw(resp):
+    """Body exactly as sent on the wire, before httpx decodes it"""
+    return b"".join(resp.iter_raw())
+
+
+@pytest.fixture
+def many_rows(monkeypatch):
+    rows = [
+        {"user_id": i, "points": 1000 - i, "wins": i, "losses": 0, "username": f"player{i}", "wallet_address": f"w{i}"}
+        for i in range(1, 101)
+    ]
+    monkeypatch.setattr(_CountingDB, "rows", rows)
+    monkeypatch.setattr(main, "Database", _CountingDB)
+
+
+def test_negotiation_honours_q_values(monkeypatch):
+    monkeypatch.setattr(main, "brotli", None)
+    assert main._negotiate_encoding("gzip, deflate") == "gzip"
+    assert main._negotiate_encoding("br") is None
+    assert main._negotiate_encoding("gzip;q=0") is None
+    assert main._negotiate_encoding("*") == "gzip"
+    assert main._negotiate_encoding("identity") is None
+    assert main._negotiate_encoding("") is None
+
+
+def test_brotli_preferred_when_available():
+    pytest.importorskip("brotli")
+    assert main._negotiate_encoding("gzip, br") == "br"
+    assert main._negotiate_encoding("gzip, br;q=0.5") == "gzip"
+
+
+def test_large_json_is_gzipped_and_revalidates(many_rows):
+    c = TestClient(main.app)
+    plain = c.get("/api/leaderboard", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    with c.stream("GET", "/api/leaderboard", headers={"Accept-Encoding": "gzip"}) as resp:
+        raw = _raw(resp)
+        headers = resp.headers
+    assert headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in headers["vary"]
+    assert int(headers["content-length"]) == len(raw) < len(plain.content)
+    assert json.loads(gzip.decompress(raw)) == plain.json()
+    assert headers["etag"] == f'W/{plain.headers["etag"]}'
+
+    again = c.get("/api/leaderboard", headers={"Accept-Encoding": "gzip", "If-None-Match": headers["etag"]})
+    assert again.status_code == 304
+    assert again.headers["etag"] == headers["etag"]
+
+
+def test_snapshot_bodies_are_compressed_once(monkeypatch, many_rows):
+    calls = {"n": 0}
+    real = main._compress
+
+    def counting(body, encoding, level=None):
+        calls["n"] += 1
+        return real(body, encoding, level)
+
+    monkeypatch.setattr(main, "_compress", counting)
+    c = TestClient(main.app)
+    for _ in range(3):
+        assert c.get("/api/leaderboard", headers={"Accept-Encoding": "gzip"}).status_code == 200
+    assert calls["n"] == 1
+
+
+def test_small_responses_are_not_compressed(monkeypatch):
+    c = TestClient(main.app)
+    resp = c.get("/api/config", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in resp.headers
+    assert "Accept-Encoding" in resp.headers["vary"]
+
+
+def _mini_app():
+    async def events(request):
+        async def gen():
+            yield b"data: 1\n\n" * 200
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    async def chunks(request):
+        async def gen():
+            for i in range(50):
+                yield f"line {i}\n".encode() * 20
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    async def png(request):
+        return PlainTextResponse("x" * 5000, media_type="image/png")
+
+    app = Starlette(routes=[Route("/events", events), Route("/chunks", chunks), Route("/png", png)])
+    app.add_middleware(main.CompressionMiddleware, minimum_size=100)
+    return app
+
+
+def test_streams_are_compressed_incrementally_except_sse():
+    c = TestClient(_mini_app())
+    with c.stream("GET", "/chunks", headers={"Accept-Encoding": "gzip"}) as resp:
+        raw = _raw(resp)
+        assert resp.headers["content-encoding"] == "gzip"
+        assert "content-length" not in resp.headers
+    assert gzip.decompress(raw) == b"".join(f"line {i}\n".encode() * 20 for i in range(50))
+
+    events = c.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in events.headers
+    png = c.get("/png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in png.headers
+
+
+def test_memo_separates_paths_sharing_an_etag():
+    # Same mtime-and-size ETag on two different files must not share a compressed copy
+    def page(text):
+        async def endpoint(request):
+            return PlainTextResponse(text * 500, headers={"ETag": '"5f3a-1388"'})
+        return endpoint
+
+    app = Starlette(routes=[Route("/a.txt", page("aaaaaaaaaa")), Route("/b.txt", page("bbbbbbbbbb"))])
+    app.add_middleware(main.CompressionMiddleware, minimum_size=100)
+    c = TestClient(app)
+    assert c.get("/a.txt", headers={"Accept-Encoding": "gzip"}).text == "aaaaaaaaaa" * 500
+    assert c.get("/b.txt", headers={"Accept-Encoding": "gzip"}).text == "bbbbbbbbbb" * 500
+
+
+def test_static_files_served_from_precompressed_variants(monkeypatch):
+    store = main.PrecompressedStaticFiles(directory=str(main.static_files.directory), html=True)
+    assert store.precompress() > 0
+
+    calls = {"n": 0}
+    monkeypatch.setattr(main, "_compress", lambda *a, **k: calls.__setitem__("n", calls["n"] + 1))
+    monkeypatch.setattr(main, "static_files", store)
+    app = Starlette()
+    app.mount("/", store)
+    c = TestClient(app)
+
+    plain = c.get("/css/style.css", headers={"Accept-Encoding": "identity"})
+    for _ in range(3):
+        with c.stream("GET", "/css/style.css", headers={"Accept-Encoding": "gzip"}) as resp:
+            raw = _raw(resp)
+            headers = resp.headers
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-type"].startswith("text/css")
+    assert gzip.decompress(raw) == plain.content
+    assert calls["n"] == 0
+
+    revalidated = c.get("/css/style.css", headers={"Accept-Encoding": "gzip", "If-None-Match": headers["etag"]})
+    assert revalidated.status_code == 304
+
+    # PNG is already deflated: no variant is kept, the file is served as is
+    frame = c.get("/assets/frame.png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in frame.headers
@@ -0,0 +1,101 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from tests.test_battle_server_authority import _BattleDB, _auth_headers
+
+
+class _SkillsDB:
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute_query(self, query, params=None, fetch="all"):
+        type(self).calls += 1
+        return [{"id": 1, "name": "bladeStrike", "required_level": 1}]
+
+
+def test_skills_revalidation_returns_304_without_db(monkeypatch):
+    _SkillsDB.calls = 0
+    monkeypatch.setattr(main, "Database", _SkillsDB)
+    c = TestClient(main.app)
+
+    first = c.get("/api/skills")
+    assert first.status_code == 200
+    assert first.json()["skills"][0]["name"] == "bladeStrike"
+    assert first.headers["cache-control"] == main.CACHE_CONTROL["skills"]
+    assert "last-modified" in first.headers
+
+    again = c.get("/api/skills", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == first.headers["etag"]
+
+    strong = first.headers["etag"].removeprefix("W/")
+    weak = c.get("/api/skills", headers={"If-None-Match": f'"other", W/{strong}'})
+    assert weak.status_code == 304
+
+    since = c.get("/api/skills", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert since.status_code == 304
+    assert _SkillsDB.calls == 1
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(monkeypatch):
+    _SkillsDB.calls = 0
+    monkeypatch.setattr(main, "Database", _SkillsDB)
+    c = TestClient(main.app)
+
+    first = c.get("/api/skills")
+    resp = c.get(
+        "/api/skills",
+        headers={"If-None-Match": '"stale"', "If-Modified-Since": first.headers["last-modified"]},
+    )
+    assert resp.status_code == 200
+
+
+def test_config_etag_follows_settings(monkeypatch):
+    c = TestClient(main.app)
+    monkeypatch.setattr(main.settings, "token_mint", "MintA")
+
+    first = c.get("/api/config")
+    assert first.headers["cache-control"] == main.CACHE_CONTROL["config"]
+    assert c.get("/api/config", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    monkeypatch.setattr(main.settings, "token_mint", "MintB")
+    changed = c.get("/api/config", headers={"If-None-Match": first.headers["etag"]})
+    assert changed.status_code == 200
+    assert changed.json()["TOKEN_MINT"] == "MintB"
+
+
+def test_battle_status_is_immutable_only_once_resolved(monkeypatch):
+    db = _BattleDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    c = TestClient(main.app)
+    headers = _auth_headers(db.wallet)
+
+    battle_id = c.post(
+        "/api/battle/start", headers=headers, json={"mintAddress": "1" * 44, "bet": 100}
+    ).json()["battle_id"]
+
+    pending = c.get(f"/api/battle/{battle_id}", headers=headers)
+    assert pending.headers["cache-control"] == "no-store"
+    assert "etag" not in pending.headers
+
+    main.app.state.battles[battle_id]["resolve_at"] = main.time.time() - 1
+    asyncio.run(main._resolve_battle(main.app, battle_id))
+
+    resolved = c.get(f"/api/battle/{battle_id}", headers=headers)
+    assert resolved.status_code == 200
+    assert resolved.json()["status"] == "resolved"
+    assert resolved.headers["cache-control"] == main.CACHE_CONTROL["battle_resolved"]
+
+    again = c.get(f"/api/battle/{battle_id}", headers={**headers, "If-None-Match": resolved.headers["etag"]})
+    assert again.status_code == 304
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import main
+
+
+def test_run_db_keeps_event_loop_responsive():
+    def slow_query():
+        time.sleep(0.3)
+        return threading.current_thread().name
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.create_task(ticker())
+        thread_name = await main.run_db(slow_query)
+        t.cancel()
+        return thread_name, ticks
+
+    thread_name, ticks = asyncio.run(scenario())
+
+    assert thread_name.startswith("db")
+    # A blocked loop would tick at most once during the 300 ms query
+    assert ticks >= 10
+
+
+def test_run_db_propagates_errors():
+    def broken(query, params=None, fetch="all"):
+        raise main.psycopg2.OperationalError("boom")
+
+    async def scenario():
+        try:
+            await main.run_db(broken, "SELECT 1", fetch="one")
+        except main.psycopg2.OperationalError as e:
+            return str(e)
+        return None
+
+    assert asyncio.run(scenario()) == "boom"
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return main.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def _pool(**kwargs):
+    created = []
+
+    def factory():
+        conn = _FakeConn()
+        created.append(conn)
+        return conn
+
+    opts = {"min_size": 0, "max_size": 2, "acquire_timeout": 0.2, "leak_timeout": 30.0}
+    opts.update(kwargs)
+    return main.ConnectionPool(factory, **opts), created
+
+
+def test_pool_reuses_released_connections():
+    pool, created = _pool()
+
+    c1 = pool.acquire(owner="t")
+    pool.release(c1)
+    c2 = pool.acquire(owner="t")
+    pool.release(c2)
+
+    assert c1 is c2
+    assert len(created) == 1
+    stats = pool.stats()
+    assert stats["acquired"] == 2
+    assert stats["idle"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_pool_open_warms_min_size():
+    pool, created = _pool(min_size=2, max_size=4)
+    pool.open()
+    assert len(created) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_pool_acquire_times_out_when_exhausted():
+    pool, _ = _pool(max_size=1, acquire_timeout=0.05)
+    pool.acquire(owner="holder")
+
+    with pytest.raises(main.PoolTimeout):
+        pool.acquire(owner="waiter")
+
+    # Not an OperationalError: "DB unavailable" fallbacks must not swallow it
+    assert not isinstance(main.PoolTimeout("x"), main.psycopg2.OperationalError)
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_pool_waiter_gets_connection_released_by_other_thread():
+    pool, created = _pool(max_size=1, acquire_timeout=2.0)
+    held = pool.acquire(owner="holder")
+
+    def release_later():
+        time.sleep(0.05)
+        pool.release(held)
+
+    t = threading.Thread(target=release_later)
+    t.start()
+    got = pool.acquire(owner="waiter")
+    t.join()
+
+    assert got is held
+    assert len(created) == 1
+
+
+def test_pool_failed_connect_does_not_consume_slot():
+    calls = {"n": 0}
+
+    def flaky():
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise main.psycopg2.OperationalError("db down")
+        return _FakeConn()
+
+    pool = main.ConnectionPool(flaky, min_size=0, max_size=1, acquire_timeout=0.05)
+    with pytest.raises(main.psycopg2.OperationalError):
+        pool.acquire()
+    assert pool.stats()["size"] == 0
+    assert pool.acquire() is not None
+
+
+def test_unclosed_database_is_returned_as_leak():
+    pool, _ = _pool(leak_timeout=0.0)
+
+    db = main.Database(pool)
+    db.connect()
+    leaks = pool.find_leaks()
+    assert leaks and leaks[0]["owner"] == "test_unclosed_database_is_returned_as_leak"
+
+    del db
+    stats = pool.stats()
+    assert stats["leaked"] == 1
+    assert stats["in_use"] == 0
+    assert stats["idle"] == 1
+
+
+def test_broken_connection_is_discarded_on_release():
+    pool, created = _pool()
+    conn = pool.acquire()
+    conn.closed = 1
+    pool.release(conn)
+
+    assert pool.stats()["discarded"] == 1
+    assert pool.acquire() is not created[0]
+
+
+def test_admin_pool_stats_requires_token(monkeypatch):
+    c = TestClient(main.app)
+
+    monkeypatch.setattr(main.settings, "admin_token", "")
+    assert c.get("/api/admin/db/pool").status_code == 404
+
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    assert c.get("/api/admin/db/pool", headers={"X-Admin-Token": "nope"}).status_code == 403
+
+    resp = c.get("/api/admin/db/pool", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["pool"]["max_size"] == main.db_pool.max_size
+    assert "leaks" in body
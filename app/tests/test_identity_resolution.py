@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+
+WALLET = "11111111111111111111111111111112"
+
+
+class _CountingDB:
+    def __init__(self):
+        self.queries = []
+        self.points = 500
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query: str, params=None, fetch: str = "all"):
+        q = " ".join(query.split()).lower()
+        self.queries.append(q)
+        if q.startswith("select id from users"):
+            return {"id": 1}
+        if q.startswith("update leaderboard") and "points = points -" in q:
+            self.points -= int(params[0])
+            return {"points": self.points, "wins": 0, "losses": 0}
+        if q.startswith("delete from users"):
+            return {"id": 1}
+        return None
+
+
+def _headers(claims):
+    return {"Authorization": f"Bearer {main.SecurityUtils.create_jwt_token(claims)}"}
+
+
+def _start_battle(client, headers):
+    return client.post("/api/battle/start", headers=headers, json={"mintAddress": "1" * 44, "bet": 10})
+
+
+def _lookups(db):
+    return [q for q in db.queries if q.startswith("select id from users")]
+
+
+def test_trusted_user_id_skips_wallet_lookup(monkeypatch):
+    db = _CountingDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    c = TestClient(main.app)
+
+    headers = _headers({"userId": 1, "walletAddress": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION})
+    resp = _start_battle(c, headers)
+
+    assert resp.status_code == 200
+    assert _lookups(db) == []
+    assert len(db.queries) == 1
+
+
+def test_legacy_token_lookup_is_cached(monkeypatch):
+    db = _CountingDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    c = TestClient(main.app)
+
+    headers = _headers({"userId": 1, "walletAddress": WALLET})
+    assert _start_battle(c, headers).status_code == 200
+    assert _start_battle(c, headers).status_code == 200
+
+    assert len(_lookups(db)) == 1
+    assert main.identity_cache.stats()["hits"] >= 1
+
+
+def test_fallback_user_id_zero_is_not_trusted():
+    payload = {"userId": 0, "wallet_address": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION}
+    assert main._identity_from_claims(payload) is None
+
+
+def test_identity_cache_is_bounded():
+    cache = main.IdentityCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_deleted_user_is_no_longer_trusted(monkeypatch):
+    db = _CountingDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    c = TestClient(main.app)
+
+    main.identity_cache.put(WALLET, 1)
+    resp = c.delete(f"/api/admin/users/{WALLET}", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+
+    payload = {"userId": 1, "wallet_address": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION}
+    assert main._identity_from_claims(payload) is None
+    assert main.identity_cache.get(WALLET) is None
+
+
+def test_deletion_on_another_worker_revokes_trust():
+    main.identity_cache.put(WALLET, 7)
+    main.identity_cache.put("other-wallet", 8)
+
+    # NOTIFY users_deleted from the worker that ran the DELETE
+    asyncio.run(main._on_users_deleted(["7,9"]))
+
+    payload = {"userId": 7, "wallet_address": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION}
+    assert main._identity_from_claims(payload) is None
+    assert main.identity_cache.get(WALLET) is None
+    assert main.identity_cache.get("other-wallet") == 8
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from datetime import date, datetime
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _KothDB:
+    """Hand-rolled model of the KOTH tables, driven by the statement shapes."""
+
+    def __init__(self, points):
+        self.board = {uid: {"points": p, "wins": 1, "losses": 0} for uid, p in points.items()}
+        self.periods = {}
+        self.standings = []
+        self.locked = set()
+        self.batches = 0
+        self.queries = []
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query, params=None, fetch="all"):
+        q = " ".join(query.split()).lower()
+        self.queries.append(q)
+        if q.startswith("with r as materialized"):
+            (period,) = params
+            if period in self.periods:
+                return None
+            pid = len(self.periods) + 1
+            ranked = sorted(self.board.items(), key=lambda kv: (-kv[1]["points"], -kv[1]["wins"], -kv[0]))
+            self.periods[period] = {"id": pid, "players": len(ranked), "status": "snapshotted"}
+            self.standings = [
+                {"period_id": pid, "user_id": uid, "points": row["points"], "applied": False}
+                for uid, row in ranked
+            ]
+            return {"id": pid, "players": len(ranked)}
+        if q.startswith("select id, players, status from koth_periods"):
+            return dict(self.periods.get(params[0]) or {}) or None
+        if q.startswith("with batch as"):
+            pid, limit, _ = params
+            self.batches += 1
+            todo = [
+                s for s in sorted(self.standings, key=lambda s: s["user_id"])
+                if s["period_id"] == pid and not s["applied"] and s["user_id"] not in self.locked
+            ][:limit]
+            out = []
+            for s in todo:
+                row = self.board[s["user_id"]]
+                row["points"] = max(row["points"] - s["points"], 0)
+                s["applied"] = True
+                out.append({"user_id": s["user_id"], **row})
+            return out
+        if q.startswith("select count(*) as n from koth_standings"):
+            n = sum(1 for s in self.standings if s["period_id"] == params[0] and not s["applied"])
+            # the live debit holding the lock commits while we wait
+            self.locked.clear()
+            return {"n": n}
+        if q.startswith("update koth_periods set status = 'completed'"):
+            for p in self.periods.values():
+                if p["id"] == params[0]:
+                    p["status"] = "completed"
+            return None
+        if q.startswith("select l.id, l.user_id, l.points"):
+            ranked = sorted(self.board.items(), key=lambda kv: (-kv[1]["points"], -kv[1]["wins"], -kv[0]))
+            return [
+                {"user_id": uid, **row, "username": f"u{uid}", "wallet_address": f"w{uid}"}
+                for uid, row in ranked[: params[-1]]
+            ]
+        if q.startswith("select period_date, players, winners"):
+            if not self.periods:
+                return None
+            period = max(self.periods)
+            return {
+                "period_date": period,
+                "players": self.periods[period]["players"],
+                "winners": [{"rank": 1, "user_id": 3}],
+                "status": self.periods[period]["status"],
+                "reset_at": datetime(2026, 10, 17),
+            }
+        raise AssertionError(f"unexpected query: {q}")
+
+
+def test_reset_snapshots_once_then_zeroes_in_batches(monkeypatch):
+    db = _KothDB({uid: uid * 100 for uid in range(1, 8)})
+    db.locked = {4}
+    monkeypatch.setattr(main, "Database", db)
+    monkeypatch.setattr(main.settings, "koth_zero_batch_size", 3)
+
+    summary = asyncio.run(main.koth_reset(date(2026, 10, 16)))
+
+    assert summary == {"period": "2026-10-16", "created": True, "players": 7, "zeroed": 7}
+    assert all(row["points"] == 0 for row in db.board.values())
+    assert all(s["applied"] for s in db.standings)
+    assert db.periods[date(2026, 10, 16)]["status"] == "completed"
+    # one snapshot statement, never a table-wide UPDATE
+    assert sum(q.startswith("with r as materialized") for q in db.queries) == 1
+    assert not any(q.startswith("update leaderboard set points = 0") for q in db.queries)
+    assert db.batches >= 3
+    assert main.rank_index.rank_of(7)["points"] == 0
+
+
+def test_zeroing_applies_rank_updates_off_loop_and_invalidates_per_batch(monkeypatch):
+    db = _KothDB({uid: uid * 100 for uid in range(1, 8)})
+    monkeypatch.setattr(main, "Database", db)
+    monkeypatch.setattr(main.settings, "koth_zero_batch_size", 3)
+    loop_thread = threading.get_ident()
+    threads = []
+    real = main.rank_index.upsert_many
+
+    def upsert_many(rows):
+        threads.append(threading.get_ident())
+        real(rows)
+
+    monkeypatch.setattr(main.rank_index, "upsert_many", upsert_many)
+    before = main.leaderboard_snapshot.stats()["invalidations"]
+
+    asyncio.run(main.koth_reset(date(2026, 10, 16)))
+
+    assert len(threads) == 3 and loop_thread not in threads
+    # once per batch of 3 + 3 + 1, then once more when the reset completes
+    assert main.leaderboard_snapshot.stats()["invalidations"] == before + 4
+
+
+def test_reset_is_idempotent(monkeypatch):
+    db = _KothDB({1: 50, 2: 70})
+    monkeypatch.setattr(main, "Database", db)
+    asyncio.run(main.koth_reset(date(2026, 10, 16)))
+    db.board[1]["points"] = 40  # earned after the reset
+    batches = db.batches
+
+    again = asyncio.run(main.koth_reset(date(2026, 10, 16)))
+
+    assert again["created"] is False
+    assert again["zeroed"] == 0
+    assert db.batches == batches
+    assert db.board[1]["points"] == 40
+
+
+def test_points_earned_after_snapshot_survive(monkeypatch):
+    db = _KothDB({1: 500})
+    monkeypatch.setattr(main, "Database", db)
+
+    original = db.execute_query
+
+    def with_late_win(query, params=None, fetch="all"):
+        if " ".join(query.split()).lower().startswith("with batch as") and db.batches == 0:
+            db.board[1]["points"] += 200  # a battle resolved between snapshot and zeroing
+        return original(query, params, fetch)
+
+    db.execute_query = with_late_win
+    asyncio.run(main.koth_reset(date(2026, 10, 16)))
+    assert db.board[1]["points"] == 200
+
+
+def test_next_reset_is_next_utc_midnight():
+    assert main._next_koth_reset(datetime(2026, 10, 17, 13, 5)) == datetime(2026, 10, 18)
+    assert main._next_koth_reset(datetime(2026, 12, 31, 23, 59, 59)) == datetime(2027, 1, 1)
+
+
+def test_koth_endpoint_is_cached(monkeypatch):
+    db = _KothDB({1: 10, 2: 30, 3: 20, 4: 5})
+    monkeypatch.setattr(main, "Database", db)
+    c = TestClient(main.app)
+
+    first = c.get("/api/leaderboard/koth")
+    for _ in range(5):
+        c.get("/api/leaderboard/koth")
+
+    assert first.status_code == 200
+    body = first.json()
+    assert [e["user_id"] for e in body["top"]] == [2, 3, 1]
+    assert body["top"][0]["rank"] == 1
+    assert body["nextReset"].endswith("T00:00:00Z")
+    assert body["lastReset"] is None
+    assert len(db.queries) == 2
+    assert c.get("/api/leaderboard/koth", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+def test_admin_reset_validates_period(monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    db = _KothDB({1: 10})
+    monkeypatch.setattr(main, "Database", db)
+    c = TestClient(main.app)
+    h = {"X-Admin-Token": "s3cret"}
+
+    assert c.post("/api/admin/koth/reset?period=yesterday", headers=h).status_code == 400
+    resp = c.post("/api/admin/koth/reset?period=2026-10-16", headers=h)
+    assert resp.status_code == 200
+    assert resp.json()["players"] == 1
+    assert c.get("/api/leaderboard/koth").json()["lastReset"]["period"] == "2026-10-16"
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _table(n=250, seed=3):
+    rng = random.Random(seed)
+    return [
+        {
+            "user_id": uid,
+            "points": rng.randint(0, 20),
+            "wins": rng.randint(0, 3),
+            "losses": 0,
+            "username": f"u{uid}",
+            "wallet_address": f"w{uid}",
+        }
+        for uid in range(1, n + 1)
+    ]
+
+
+class _KeysetDB:
+    table = _table()
+    queries = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query, params=None, fetch="all"):
+        q = " ".join(query.split()).lower()
+        type(self).queries.append((q, params))
+        rows = sorted(self.table, key=lambda r: (r["points"], r["wins"], r["user_id"]), reverse=True)
+        if "where (l.points, l.wins, l.user_id) < (%s, %s, %s)" in q:
+            p, w, u, limit = params
+            rows = [r for r in rows if (r["points"], r["wins"], r["user_id"]) < (p, w, u)]
+        else:
+            (limit,) = params
+        return [dict(r) for r in rows[:limit]]
+
+
+def _client(monkeypatch):
+    _KeysetDB.queries = []
+    monkeypatch.setattr(main, "Database", _KeysetDB)
+    return TestClient(main.app)
+
+
+def test_cursor_walk_covers_table_exactly_once(monkeypatch):
+    c = _client(monkeypatch)
+
+    seen = []
+    body = c.get("/api/leaderboard").json()
+    seen.extend(e["user_id"] for e in body["leaderboard"])
+    while body["next"]:
+        resp = c.get("/api/leaderboard", params={"after": body["next"], "limit": 60})
+        assert resp.status_code == 200
+        body = resp.json()
+        seen.extend(e["user_id"] for e in body["leaderboard"])
+
+    expected = sorted(_KeysetDB.table, key=lambda r: (r["points"], r["wins"], r["user_id"]), reverse=True)
+    assert seen == [r["user_id"] for r in expected]
+
+
+def test_pages_never_use_offset(monkeypatch):
+    c = _client(monkeypatch)
+    first = c.get("/api/leaderboard", params={"limit": 10}).json()
+    c.get("/api/leaderboard", params={"after": first["next"], "limit": 10})
+
+    assert len(_KeysetDB.queries) == 2
+    for q, _ in _KeysetDB.queries:
+        assert "offset" not in q
+        assert "order by l.points desc, l.wins desc, l.user_id desc" in q
+    assert _KeysetDB.queries[1][1][-1] == 10
+
+
+def test_cursor_is_opaque_and_validated(monkeypatch):
+    c = _client(monkeypatch)
+    cursor = main._encode_leaderboard_cursor({"points": 12, "wins": 3, "user_id": 40})
+    assert ":" not in cursor
+    assert main._decode_leaderboard_cursor(cursor) == (12, 3, 40)
+
+    assert c.get("/api/leaderboard", params={"after": "not-a-cursor"}).status_code == 400
+    assert c.get("/api/leaderboard", params={"limit": 0}).status_code == 400
+    assert c.get("/api/leaderboard", params={"limit": 501}).status_code == 400
+
+
+def test_last_page_has_no_next_cursor(monkeypatch):
+    c = _client(monkeypatch)
+    last = sorted(_KeysetDB.table, key=lambda r: (r["points"], r["wins"], r["user_id"]), reverse=True)[-3]
+    body = c.get("/api/leaderboard", params={"after": main._encode_leaderboard_cursor(last), "limit": 10}).json()
+    assert len(body["leaderboard"]) == 2
+    assert body["next"] is None
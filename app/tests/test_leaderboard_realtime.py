@@ -58,6 +58,9 @@ def test_leaderboard_contract_sorting_and_limit(monkeypatch):
     state = _LeaderboardState()
 
     class _FakeDB:
+        def __init__(self, *args, **kwargs):
+            pass
+
         def connect(self):
             return None
 
@@ -114,6 +117,9 @@ def test_leaderboard_realtime_polling_sees_updates(monkeypatch):
     state = _LeaderboardState()
 
     class _FakeDB:
+        def __init__(self, *args, **kwargs):
+            pass
+
         def connect(self):
             return None
 
@@ -132,8 +138,9 @@ def test_leaderboard_realtime_polling_sees_updates(monkeypatch):
     assert r1.status_code == 200
     top1 = r1.json()["leaderboard"][0]["user_id"]
 
-    # Update state as if a battle finished
+    # Update state as if a battle finished (the writer invalidates the snapshot)
     state.update_points(user_id=2, points=999, wins=10)
+    main.leaderboard_snapshot.invalidate()
 
     r2 = c.get("/api/leaderboard")
     assert r2.status_code == 200
@@ -147,6 +154,9 @@ def test_leaderboard_parallel_requests_no_5xx(monkeypatch):
     state = _LeaderboardState()
 
     class _FakeDB:
+        def __init__(self, *args, **kwargs):
+            pass
+
         def connect(self):
             return None
 
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _rows():
+    return [
+        {"user_id": 1, "points": 300, "wins": 3, "losses": 0, "username": "a", "wallet_address": "w1"},
+        {"user_id": 2, "points": 200, "wins": 2, "losses": 1, "username": "b", "wallet_address": "w2"},
+        {"user_id": 3, "points": 100, "wins": 1, "losses": 2, "username": "c", "wallet_address": "w3"},
+    ]
+
+
+class _Board:
+    def __init__(self):
+        self.rows = _rows()
+        self.loads = 0
+        self.primary = []
+
+    async def load(self, limit, primary=False):
+        self.loads += 1
+        self.primary.append(primary)
+        rows = sorted(self.rows, key=lambda r: (r["points"], r["wins"], r["user_id"]), reverse=True)
+        return [dict(r) for r in rows[:limit]]
+
+    def set(self, user_id, **fields):
+        for r in self.rows:
+            if r["user_id"] == user_id:
+                r.update(fields)
+
+
+def _parse(frame: bytes):
+    lines = frame.decode().strip().split("\n")
+    fields = dict(line.split(": ", 1) for line in lines)
+    return fields["event"], json.loads(fields["data"])
+
+
+def _broadcaster(**kwargs):
+    opts = {"top_n": 2, "tick_ms": 5, "queue_size": 8, "max_subscribers": 10}
+    opts.update(kwargs)
+    return main.LeaderboardBroadcaster(**opts)
+
+
+def test_snapshot_on_connect_then_coalesced_diff_shared_by_all():
+    board = _Board()
+    bc = _broadcaster()
+
+    async def scenario():
+        s1 = await bc.subscribe(board.load)
+        s2 = await bc.subscribe(board.load)
+        first = [s1.queue.get_nowait(), s2.queue.get_nowait()]
+
+        # three battles resolve within one tick
+        board.set(3, points=250, wins=2)
+        bc.mark_dirty()
+        board.set(3, points=400, wins=4)
+        bc.mark_dirty()
+        bc.mark_dirty()
+        d1 = await asyncio.wait_for(s1.queue.get(), 1)
+        d2 = await asyncio.wait_for(s2.queue.get(), 1)
+        await asyncio.sleep(0.03)
+        assert s1.queue.empty()
+        bc.reset()
+        return first, d1, d2
+
+    first, d1, d2 = asyncio.run(scenario())
+
+    event, snap = _parse(first[0])
+    assert event == "snapshot"
+    assert [e["user_id"] for e in snap["leaderboard"]] == [1, 2]
+    assert first[0] is first[1]
+
+    assert d1 is d2  # one pre-encoded frame fanned out
+    event, diff = _parse(d1)
+    assert event == "diff"
+    assert diff["seq"] == snap["seq"] + 1
+    assert diff["changed"] == [
+        {"u": 3, "r": 1, "p": 400, "w": 4, "l": 2, "n": "c", "a": "w3"},
+        {"u": 1, "r": 2},
+    ]
+    assert diff["removed"] == [2]
+    assert board.loads == 2
+    assert board.primary == [True, True]  # refreshes never read a lagging replica
+
+
+def test_unchanged_top_sends_nothing():
+    board = _Board()
+    bc = _broadcaster()
+
+    async def scenario():
+        sub = await bc.subscribe(board.load)
+        sub.queue.get_nowait()
+        board.set(3, points=150)  # outside the top 2
+        bc.mark_dirty()
+        await asyncio.sleep(0.05)
+        empty = sub.queue.empty()
+        bc.reset()
+        return empty
+
+    assert asyncio.run(scenario())
+    assert board.loads == 2
+
+
+def test_slow_subscriber_is_dropped():
+    board = _Board()
+    bc = _broadcaster(queue_size=1)
+
+    async def scenario():
+        sub = await bc.subscribe(board.load)  # queue already holds the snapshot
+        board.set(2, points=1000)
+        bc.mark_dirty()
+        await asyncio.sleep(0.05)
+        item = sub.queue.get_nowait()
+        stats = bc.stats()
+        bc.reset()
+        return item, stats
+
+    item, stats = asyncio.run(scenario())
+    assert item is None
+    assert stats["dropped"] == 1
+    assert stats["subscribers"] == 0
+
+
+def test_stream_endpoint_emits_snapshot_and_heartbeat(monkeypatch):
+    board = _Board()
+    monkeypatch.setattr(main, "_load_leaderboard", board.load)
+    monkeypatch.setattr(main.settings, "leaderboard_stream_heartbeat_s", 0.01)
+
+    class _Request:
+        def __init__(self):
+            self.checks = 0
+
+        async def is_disconnected(self):
+            self.checks += 1
+            return self.checks > 1
+
+    async def scenario():
+        resp = await main.leaderboard_stream(_Request())
+        chunks = [chunk async for chunk in resp.body_iterator]
+        return resp, chunks
+
+    resp, chunks = asyncio.run(scenario())
+    main.leaderboard_broadcaster.reset()
+
+    assert resp.media_type == "text/event-stream"
+    assert resp.headers["cache-control"] == "no-cache"
+    assert _parse(chunks[0])[0] == "snapshot"
+    assert chunks[1:] == [b": ping\n\n"]
+    assert main.leaderboard_broadcaster.stats()["subscribers"] == 0
+
+
+def test_stream_rejects_when_full(monkeypatch):
+    monkeypatch.setattr(main.leaderboard_broadcaster, "max_subscribers", 1)
+    main.leaderboard_broadcaster._subscribers.add(object())
+    assert TestClient(main.app).get("/api/leaderboard/stream").status_code == 503
+
+
+def test_battle_changes_mark_stream_dirty(monkeypatch):
+    class _BatchDB:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def connect(self):
+            return None
+
+        def close(self):
+            return None
+
+        def execute_query(self, query, params=None, fetch="all"):
+            return [{"user_id": params[0], "points": 1, "wins": 1, "losses": 0}]
+
+    monkeypatch.setattr(main, "Database", _BatchDB)
+    asyncio.run(main.LeaderboardWriter(flush_ms=0).submit(1, points=1, wins=1))
+    assert main.leaderboard_broadcaster._dirty
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+
+import main
+
+
+class _PrimaryDB:
+    """leaderboard на primary после записи другого воркера"""
+
+    rows = {}
+    instances = []
+
+    def __init__(self, *args, read_only=False, **kwargs):
+        self.read_only = read_only
+        type(self).instances.append(self)
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query, params=None, fetch="all"):
+        q = " ".join(query.split()).lower()
+        if "where user_id = any" in q:
+            return [dict(self.rows[u], user_id=u) for u in params[0] if u in self.rows]
+        if "where user_id > %s" in q:
+            after, limit = params
+            return [dict(self.rows[u], user_id=u) for u in sorted(self.rows) if u > after][:limit]
+        return None
+
+
+def _setup(monkeypatch, rows):
+    _PrimaryDB.rows = {u: {"points": p, "wins": 0, "losses": 0} for u, p in rows.items()}
+    _PrimaryDB.instances = []
+    monkeypatch.setattr(main, "Database", _PrimaryDB)
+    for u, r in _PrimaryDB.rows.items():
+        main.rank_index.upsert(u, r["points"], 0, 0)
+    main.rank_index.loaded = True
+
+
+def test_remote_change_patches_rank_index_and_invalidates(monkeypatch):
+    _setup(monkeypatch, {1: 30, 2: 20, 3: 10})
+    _PrimaryDB.rows[3]["points"] = 50
+    del _PrimaryDB.rows[2]
+    before = main.leaderboard_snapshot.stats()["invalidations"]
+
+    asyncio.run(main.leaderboard_sync.handle(["worldbinder-other:2,3"]))
+
+    assert main.rank_index.rank_of(3)["rank"] == 1
+    assert main.rank_index.rank_of(2) is None
+    assert main.leaderboard_snapshot.stats()["invalidations"] == before + 1
+    assert main.leaderboard_broadcaster._dirty
+    # Read from the primary: the replica may not have the write yet
+    assert not any(db.read_only for db in _PrimaryDB.instances)
+
+
+def test_own_notifications_are_ignored(monkeypatch):
+    _setup(monkeypatch, {1: 30})
+    before = main.leaderboard_snapshot.stats()["invalidations"]
+
+    asyncio.run(main.leaderboard_sync.handle([f"{main.WORKER_ID}:1"]))
+
+    assert main.leaderboard_snapshot.stats()["invalidations"] == before
+    assert _PrimaryDB.instances == []
+    assert main.leaderboard_sync.stats()["own"] == 1
+
+
+def test_bulk_change_resyncs_whole_index(monkeypatch):
+    _setup(monkeypatch, {1: 30, 2: 20})
+    # e.g. a KOTH reset run by another worker
+    for r in _PrimaryDB.rows.values():
+        r["points"] = 0
+    _PrimaryDB.rows[5] = {"points": 7, "wins": 0, "losses": 0}
+
+    async def scenario():
+        await main.leaderboard_sync.handle(["worldbinder-other:*"])
+        await main.leaderboard_sync._resync
+
+    asyncio.run(scenario())
+    assert main.rank_index.rank_of(5)["rank"] == 1
+    assert main.rank_index.rank_of(1)["points"] == 0
+    assert len(main.rank_index) == 3
+    assert main.leaderboard_sync.stats()["resyncs"] == 1
+
+
+def test_reconnect_triggers_resync(monkeypatch):
+    _setup(monkeypatch, {1: 30})
+    _PrimaryDB.rows[1]["points"] = 5
+
+    async def scenario():
+        await main.leaderboard_sync.handle(None)
+        await main.leaderboard_sync._resync
+
+    asyncio.run(scenario())
+    assert main.rank_index.rank_of(1)["points"] == 5
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+import main
+
+
+class _BoardDB:
+    def __init__(self, board, fail=False):
+        self.board = board
+        self.fail = fail
+        self.queries = []
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query: str, params=None, fetch: str = "all"):
+        self.queries.append((" ".join(query.split()).lower(), params))
+        if self.fail:
+            raise main.psycopg2.OperationalError("db down")
+        rows = []
+        for i in range(0, len(params), 4):
+            uid, points, wins, losses = params[i:i + 4]
+            row = self.board.get(uid)
+            if row is None:
+                continue
+            row["points"] += points
+            row["wins"] += wins
+            row["losses"] += losses
+            rows.append({"user_id": uid, **row})
+        return rows
+
+
+def test_results_are_coalesced_into_one_set_based_update(monkeypatch):
+    db = _BoardDB({1: {"points": 100, "wins": 0, "losses": 0}, 2: {"points": 5, "wins": 0, "losses": 0}})
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    writer = main.LeaderboardWriter(flush_ms=5, max_batch=100)
+
+    async def scenario():
+        return await asyncio.gather(
+            writer.submit(1, points=300, wins=1),
+            writer.submit(2, losses=1),
+            writer.submit(1, losses=1),
+            writer.submit(1, points=50, wins=1),
+            writer.submit(99, losses=1),
+        )
+
+    r1, r2, r3, r4, missing = asyncio.run(scenario())
+
+    assert len(db.queries) == 1
+    sql, params = db.queries[0]
+    assert sql.startswith("update leaderboard as l")
+    assert "from (values" in sql
+    # one VALUES row per user, deltas summed
+    assert params == (1, 350, 2, 1, 2, 0, 0, 1, 99, 0, 0, 1)
+
+    # per-user ordering: every caller sees the row right after its own result
+    assert r1 == {"points": 400, "wins": 1, "losses": 0}
+    assert r3 == {"points": 400, "wins": 1, "losses": 1}
+    assert r4 == {"points": 450, "wins": 2, "losses": 1}
+    assert r2 == {"points": 5, "wins": 0, "losses": 1}
+    assert missing is None
+
+
+def test_batches_are_split_at_max_batch(monkeypatch):
+    db = _BoardDB({uid: {"points": 0, "wins": 0, "losses": 0} for uid in range(10)})
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    writer = main.LeaderboardWriter(flush_ms=1, max_batch=4)
+
+    async def scenario():
+        return await asyncio.gather(*(writer.submit(uid, losses=1) for uid in range(10)))
+
+    results = asyncio.run(scenario())
+    assert len(db.queries) == 3
+    assert all(r == {"points": 0, "wins": 0, "losses": 1} for r in results)
+
+
+def test_failed_flush_propagates_to_every_caller(monkeypatch):
+    db = _BoardDB({}, fail=True)
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    writer = main.LeaderboardWriter(flush_ms=1)
+
+    async def scenario():
+        return await asyncio.gather(writer.submit(1, wins=1), writer.submit(2, losses=1), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, main.psycopg2.OperationalError) for r in results)
+
+
+def test_writer_survives_event_loop_change(monkeypatch):
+    db = _BoardDB({1: {"points": 0, "wins": 0, "losses": 0}})
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    writer = main.LeaderboardWriter(flush_ms=1)
+
+    assert asyncio.run(writer.submit(1, wins=1))["wins"] == 1
+    assert asyncio.run(writer.submit(1, wins=1))["wins"] == 2
+
+
+@pytest.mark.parametrize("wins", [True, False])
+def test_resolve_battle_goes_through_writer(monkeypatch, wins):
+    submitted = []
+
+    async def fake_submit(user_id, points=0, wins=0, losses=0):
+        submitted.append((user_id, points, wins, losses))
+        return {"points": points, "wins": wins, "losses": losses}
+
+    monkeypatch.setattr(main.leaderboard_writer, "submit", fake_submit)
+    battle_id = "b-writer"
+    main.app.state.battles[battle_id] = {
+        "status": main.BattleStatus.pending,
+        "resolve_at": 0,
+        "user_id": 7,
+        "bet": 10,
+        "seed": b"seed",
+    }
+    roll = 9_999 if wins else 0
+    monkeypatch.setattr(main, "_hmac_sha256", lambda key, msg: roll.to_bytes(32, "big"))
+
+    asyncio.run(main._resolve_battle(main.app, battle_id))
+
+    battle = main.app.state.battles.pop(battle_id)
+    assert battle["status"] == main.BattleStatus.resolved
+    if wins:
+        assert submitted == [(7, 120, 1, 0)]
+    else:
+        assert submitted == [(7, 0, 0, 1)]
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import base64
+
+import base58
+import jwt
+from fastapi.testclient import TestClient
+from nacl.signing import SigningKey
+
+import main
+
+
+class _LoginDB:
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+        self.is_new = True
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute_query(self, query, params=None, fetch="all"):
+        self.calls.append((" ".join(query.split()), params))
+        now = main.datetime.utcnow()
+        return {
+            "id": 42,
+            "wallet_address": params[0],
+            "username": None,
+            "avatar_url": None,
+            "created_at": now,
+            "last_login": now,
+            "is_new": self.is_new,
+        }
+
+
+def _login(client):
+    key = SigningKey.generate()
+    public_key = base58.b58encode(key.verify_key.encode()).decode()
+    message = client.post("/api/auth/challenge", json={"publicKey": public_key}).json()["message"]
+    signature = base64.b64encode(key.sign(message.encode()).signature).decode()
+    return client.post(
+        "/api/auth/verify",
+        json={"publicKey": public_key, "signature": signature, "message": message},
+    )
+
+
+def test_login_is_a_single_statement(monkeypatch):
+    db = _LoginDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+
+    resp = _login(TestClient(main.app))
+
+    assert resp.status_code == 200
+    assert len(db.calls) == 1
+    sql, params = db.calls[0]
+    assert sql == " ".join(main.SQL_USER_LOGIN.split())
+    assert len(params) == 3
+    claims = jwt.decode(resp.json()["token"], options={"verify_signature": False})
+    assert claims["userId"] == 42
+
+
+def test_returning_user_takes_the_same_path(monkeypatch):
+    db = _LoginDB()
+    db.is_new = False
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+
+    assert _login(TestClient(main.app)).status_code == 200
+    assert len(db.calls) == 1
+
+
+def test_login_statement_initialises_tokens_and_leaderboard_atomically():
+    sql = " ".join(main.SQL_USER_LOGIN.split()).lower()
+    assert sql.startswith("with u as ( insert into users")
+    assert "insert into user_tokens" in sql and "insert into leaderboard" in sql
+    assert sql.count("on conflict (user_id) do nothing") == 2
+    assert "(xmax = 0) as is_new" in sql
+    assert main.statements.lookup(main.SQL_USER_LOGIN) is not None
+
+
+def test_pool_timeout_during_login_is_503_without_token(monkeypatch):
+    class _BusyDB(_LoginDB):
+        def execute_query(self, query, params=None, fetch="all"):
+            raise main.PoolTimeout("no connection within 0.1s")
+
+    monkeypatch.setattr(main, "Database", lambda **_: _BusyDB())
+
+    resp = _login(TestClient(main.app))
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"]
+    assert "token" not in resp.json()
+    assert "wb_token" not in resp.cookies
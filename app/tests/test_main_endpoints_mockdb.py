@@ -4,7 +4,7 @@ import main
 
 
 class _FakeDB:
-    def __init__(self):
+    def __init__(self, *args, **kwargs):
         self.connected = False
 
     def connect(self):
@@ -127,7 +127,7 @@ def test_static_index_served(client=None):
 
 def test_health_check_healthy_with_mock_db(monkeypatch):
     class _OkDB:
-        def __init__(self):
+        def __init__(self, *args, **kwargs):
             self.pool = True
 
         def connect(self):
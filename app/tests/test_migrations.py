@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import io
+import re
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+
+APP_DIR = Path(__file__).resolve().parents[1]
+
+
+def _config(buf=None):
+    cfg = Config(str(APP_DIR / "alembic.ini"), output_buffer=buf)
+    cfg.set_main_option("script_location", str(APP_DIR / "migrations"))
+    cfg.set_main_option("sqlalchemy.url", "postgresql+psycopg2://u:p@localhost/blizard")
+    return cfg
+
+
+def _render(rev_range="head"):
+    buf = io.StringIO()
+    command.upgrade(_config(buf), rev_range, sql=True)
+    return buf.getvalue()
+
+
+def test_single_linear_history():
+    script = ScriptDirectory.from_config(_config())
+    assert len(script.get_heads()) == 1
+    revs = [r.revision for r in script.walk_revisions("base", "heads")]
+    assert revs[-1] == "0001"
+
+
+def test_user_skill_levels_keyed_by_user_and_skill():
+    sql = _render()
+    m = re.search(r"CREATE TABLE IF NOT EXISTS user_skill_levels \((.*?)\);", sql, re.S)
+    assert m
+    assert "PRIMARY KEY (user_id, skill_key)" in m.group(1)
+
+
+def test_indexes_built_concurrently_outside_transaction():
+    sql = _render("0002:head")
+    stmt = (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leaderboard_rank_covering "
+        "ON leaderboard (points DESC, wins DESC) INCLUDE (user_id, losses);"
+    )
+    assert stmt in sql
+
+    before = sql[: sql.index(stmt)].rstrip()
+    assert before.endswith("COMMIT;")
+    assert "DROP INDEX CONCURRENTLY IF EXISTS idx_leaderboard_points" in sql
+    # Tables created by the same revision may be indexed inline; existing hot tables may not
+    assert not re.search(r"CREATE INDEX (?!CONCURRENTLY)[^;]* ON (leaderboard|users|user_nfts|user_tokens)\b", sql)
+
+
+def test_keyset_index_matches_cursor_order():
+    sql = _render("0003:head")
+    assert (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leaderboard_keyset "
+        "ON leaderboard (points DESC, wins DESC, user_id DESC) INCLUDE (losses);"
+    ) in sql
+    assert "VALIDATE CONSTRAINT leaderboard_sort_not_null" in sql
+    assert "ALTER COLUMN points SET NOT NULL" in sql
+
+
+def test_koth_archive_tables():
+    sql = _render("0004:head")
+    assert "period_date DATE NOT NULL UNIQUE" in sql
+    assert "PRIMARY KEY (period_id, rank)" in sql
+    assert "ON koth_standings (period_id, user_id) WHERE NOT applied" in sql
+
+
+def test_skills_trigger_notifies_listener_channel():
+    import main
+
+    sql = _render("0005:head")
+    assert f"pg_notify('{main.SKILLS_NOTIFY_CHANNEL}'" in sql
+    assert "ON skills FOR EACH STATEMENT" in sql
+
+
+def test_leaderboard_trigger_carries_origin_and_changed_ids():
+    import main
+
+    sql = _render("0006:head")
+    assert f"'{main.LEADERBOARD_NOTIFY_CHANNEL}'" in sql
+    assert "current_setting('application_name', true)" in sql
+    for event, rows in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        assert f"AFTER {event} ON leaderboard REFERENCING {rows} TABLE AS changed_rows FOR EACH STATEMENT" in sql
+    assert "AFTER TRUNCATE ON leaderboard FOR EACH STATEMENT" in sql
+
+
+def test_users_deleted_trigger_notifies_ids():
+    import main
+
+    sql = _render("0007:head")
+    assert f"pg_notify('{main.USERS_DELETED_NOTIFY_CHANNEL}', ids)" in sql
+    assert "AFTER DELETE ON users REFERENCING OLD TABLE AS deleted_rows FOR EACH STATEMENT" in sql
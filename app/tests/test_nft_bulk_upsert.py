@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from fastapi.testclient import TestClient
+
+import main
+
+WALLET = "11111111111111111111111111111112"
+
+
+class _NftDB:
+    def __init__(self, *args, **kwargs):
+        self.queries = []
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query: str, params=None, fetch: str = "all"):
+        q = " ".join(query.split()).lower()
+        self.queries.append((q, params))
+        if q.startswith("select id from users"):
+            return {"id": 1}
+        return None
+
+    def upserts(self):
+        return [(q, p) for q, p in self.queries if q.startswith("insert into user_nfts")]
+
+
+def _headers():
+    token = main.SecurityUtils.create_jwt_token(
+        {"userId": 1, "walletAddress": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION}
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _nft(i, rarity="Common"):
+    return {
+        "mintAddress": str(i) * 44,
+        "name": f"NFT {i}",
+        "imageUrl": f"http://example.com/{i}.png",
+        "rarity": rarity,
+    }
+
+
+def test_bulk_endpoint_writes_one_multi_row_upsert(monkeypatch):
+    db = _NftDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    c = TestClient(main.app)
+
+    resp = c.post(
+        "/api/user/nfts/bulk",
+        headers=_headers(),
+        json={"nfts": [_nft(1), _nft(2, "Epic"), _nft(1, "Rare")]},
+    )
+
+    assert resp.status_code == 200
+    assert resp.json()["count"] == 2
+    upserts = db.upserts()
+    assert len(upserts) == 1
+    sql, params = upserts[0]
+    assert "on conflict (user_id, mint_address)" in sql
+    assert sql.count("(%s, %s, %s, %s, %s)") == 2
+    # duplicate mint collapsed, last one wins
+    assert params[:5] == (1, "1" * 44, "NFT 1", "http://example.com/1.png", "Rare")
+
+
+def test_bulk_endpoint_rejects_empty_and_oversized(monkeypatch):
+    monkeypatch.setattr(main, "Database", _NftDB)
+    c = TestClient(main.app)
+    assert c.post("/api/user/nfts/bulk", headers=_headers(), json={"nfts": []}).status_code == 422
+    too_many = [_nft(i % 10) for i in range(101)]
+    assert c.post("/api/user/nfts/bulk", headers=_headers(), json={"nfts": too_many}).status_code == 422
+
+
+def _fake_scan(monkeypatch, items):
+    async def _fake_helius(owner: str, **_):
+        return {"result": {"items": items}}
+
+    monkeypatch.setattr(main, "_helius_get_assets_by_owner", _fake_helius)
+    monkeypatch.setattr(main.settings, "collection_address", "")
+
+
+def _asset(mint, rarity="Legendary"):
+    return {
+        "id": mint,
+        "rarity": rarity,
+        "content": {"metadata": {"name": "X" * 300}, "files": [{"uri": "http://example.com/x.png"}]},
+    }
+
+
+def test_wallet_scan_persists_own_wallet(monkeypatch):
+    db = _NftDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    _fake_scan(monkeypatch, [_asset("A" * 44), _asset("B" * 44, rarity="Mythic"), _asset("C" * 60)])
+    c = TestClient(main.app)
+
+    resp = c.post("/api/wallet/scan", headers=_headers(), json={"walletAddress": WALLET})
+
+    assert resp.status_code == 200
+    assert len(resp.json()["nfts"]) == 3
+    upserts = db.upserts()
+    assert len(upserts) == 1
+    _, params = upserts[0]
+    # invalid mint dropped, name truncated, unknown rarity normalised
+    assert len(params) == 10
+    assert params[1] == "A" * 44 and params[4] == "Legendary"
+    assert len(params[2]) == 200
+    assert params[6] == "B" * 44 and params[9] == "Common"
+
+
+def test_wallet_scan_of_other_wallet_is_not_persisted(monkeypatch):
+    db = _NftDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    _fake_scan(monkeypatch, [_asset("A" * 44)])
+    c = TestClient(main.app)
+
+    resp = c.post("/api/wallet/scan", headers=_headers(), json={"walletAddress": "2" * 44})
+
+    assert resp.status_code == 200
+    assert db.upserts() == []
+
+
+def test_wallet_scan_survives_persistence_failure(monkeypatch):
+    class _BrokenDB(_NftDB):
+        def execute_query(self, query, params=None, fetch="all"):
+            raise main.psycopg2.OperationalError("db down")
+
+    monkeypatch.setattr(main, "Database", _BrokenDB)
+    _fake_scan(monkeypatch, [_asset("A" * 44)])
+    c = TestClient(main.app)
+
+    resp = c.post("/api/wallet/scan", headers=_headers(), json={"walletAddress": WALLET})
+    assert resp.status_code == 200
+    assert resp.json()["attackBonus"] == 10
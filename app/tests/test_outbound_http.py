@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    seen = {"clients": 0, "hosts": []}
+
+    def handler(request):
+        seen["hosts"].append(request.url.host)
+        if request.url.host == "down.local":
+            return httpx.Response(502)
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": 1, "result": {"ok": True}})
+
+    real = main.OutboundHTTP._new_client
+
+    def new_client(self):
+        seen["clients"] += 1
+        client = real(self)
+        client._transport = httpx.MockTransport(handler)
+        return client
+
+    monkeypatch.setattr(main.OutboundHTTP, "_new_client", new_client)
+    return seen
+
+
+def test_client_config_separates_connect_and_read_timeouts():
+    async def build():
+        return main.outbound_http._new_client()
+
+    client = asyncio.run(build())
+    assert client.timeout.connect == main.settings.http_connect_timeout
+    assert client.timeout.read == main.settings.http_read_timeout
+    assert client.timeout.pool == main.settings.http_pool_timeout
+    pool = client._transport._pool
+    assert pool._max_connections == main.settings.http_max_connections_per_host
+    assert pool._max_keepalive_connections == main.settings.http_max_keepalive_per_host
+    assert pool._http2 == main.OutboundHTTP.http2_enabled()
+
+
+def test_one_client_per_host_reused_across_calls(mock_upstream):
+    http = main.OutboundHTTP(main.UpstreamStats())
+
+    async def scenario():
+        for _ in range(3):
+            await http.rpc("https://rpc.local/", "getTransaction", {"id": 1})
+        await http.rpc("https://helius.local/?api-key=k", "getAssetsByOwner", {"id": 2})
+        hosts = sorted(http._clients)
+        await http.aclose()
+        return hosts
+
+    assert asyncio.run(scenario()) == ["helius.local", "rpc.local"]
+    assert mock_upstream["clients"] == 2
+
+
+def test_latency_recorded_per_method_including_errors(mock_upstream):
+    stats = main.UpstreamStats()
+    http = main.OutboundHTTP(stats)
+
+    async def scenario():
+        await http.rpc("https://rpc.local/", "getTransaction", {})
+        with pytest.raises(httpx.HTTPStatusError):
+            await http.rpc("https://down.local/", "getTokenAccountsByOwner", {})
+
+    asyncio.run(scenario())
+    calls = {c["call"]: c for c in stats.snapshot()}
+    assert calls["rpc.local getTransaction"]["calls"] == 1
+    assert calls["rpc.local getTransaction"]["errors"] == 0
+    assert calls["rpc.local getTransaction"]["p50_ms"] is not None
+    assert calls["down.local getTokenAccountsByOwner"]["errors"] == 1
+
+
+def test_token_balance_goes_through_shared_client(monkeypatch, mock_upstream):
+    monkeypatch.setattr(main.settings, "solana_rpc", "https://rpc.local/")
+    assert asyncio.run(main._solana_get_token_balance("W" * 32, "M" * 32)) == 0.0
+    assert mock_upstream["hosts"] == ["rpc.local"]
+
+
+def test_admin_http_stats(monkeypatch, mock_upstream):
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    monkeypatch.setattr(main.settings, "solana_rpc", "https://rpc.local/")
+    asyncio.run(main._solana_get_transaction("S" * 64))
+
+    resp = TestClient(main.app).get("/api/admin/http", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["calls"][0]["call"] == "rpc.local getTransaction"
+    assert "http2" in body
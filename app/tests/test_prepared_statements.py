@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        if self.conn.fail_execute and sql.startswith("EXECUTE"):
+            raise main.psycopg2.errors.InvalidSqlStatementName("gone")
+
+    def fetchone(self):
+        return {"id": 7}
+
+    def fetchall(self):
+        return [{"id": 7}]
+
+
+class _Conn:
+    def __init__(self):
+        self.closed = 0
+        self.prepared = set()
+        self.executed = []
+        self.fail_execute = False
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return main.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    reg = main.StatementRegistry()
+    reg.register("lookup_user", "SELECT id FROM users WHERE wallet_address = %s AND id > %s")
+    monkeypatch.setattr(main, "statements", reg)
+    return reg
+
+
+def _db():
+    conn = _Conn()
+    pool = main.ConnectionPool(lambda: conn, min_size=0, max_size=1)
+    return main.Database(pool), conn
+
+
+def test_registered_query_is_prepared_once_per_connection(registry):
+    db, conn = _db()
+
+    for _ in range(3):
+        row = db.execute_query(
+            "SELECT id FROM users\n   WHERE wallet_address = %s AND id > %s", ("W", 0), fetch="one"
+        )
+        assert row == {"id": 7}
+
+    prepares = [sql for sql, _ in conn.executed if sql.startswith("PREPARE")]
+    executes = [(sql, p) for sql, p in conn.executed if sql.startswith("EXECUTE")]
+    assert prepares == ["PREPARE lookup_user AS SELECT id FROM users WHERE wallet_address = $1 AND id > $2"]
+    assert executes == [("EXECUTE lookup_user (%s, %s)", ("W", 0))] * 3
+
+    stats = registry.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["statements"]["lookup_user"] == {"hits": 2, "misses": 1}
+    db.close()
+
+
+def test_unregistered_query_runs_as_is(registry):
+    db, conn = _db()
+    db.execute_query("SELECT 1", fetch="one")
+    assert conn.executed == [("SELECT 1", None)]
+    assert registry.stats()["hits"] == 0
+    db.close()
+
+
+def test_lost_prepared_statement_is_reprepared(registry):
+    db, conn = _db()
+    db.execute_query("SELECT id FROM users WHERE wallet_address = %s AND id > %s", ("W", 0), fetch="one")
+
+    conn.fail_execute = True
+    with pytest.raises(main.psycopg2.errors.InvalidSqlStatementName):
+        db.execute_query("SELECT id FROM users WHERE wallet_address = %s AND id > %s", ("W", 0), fetch="one")
+    assert "lookup_user" not in conn.prepared
+    db.close()
+
+
+def test_hot_queries_are_registered():
+    for sql in (
+        main.SQL_USER_ID_BY_WALLET,
+        main.SQL_LEADERBOARD_DEBIT,
+        main.SQL_USER_LOGIN,
+    ):
+        assert main.statements.lookup(sql) is not None
+
+
+def test_admin_statement_stats(monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    c = TestClient(main.app)
+    resp = c.get("/api/admin/db/statements", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    assert "user_id_by_wallet" in resp.json()["prepared"]["statements"]
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.fail:
+            raise main.psycopg2.errors.SyntaxError("boom")
+        self._rows = list(self.conn.rows)
+        self.rowcount = len(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class _Conn:
+    closed = 0
+
+    def __init__(self):
+        self.rows = []
+        self.fail = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def get_transaction_status(self):
+        return main.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture()
+def conn(monkeypatch):
+    c = _Conn()
+    monkeypatch.setattr(main, "db_pool", main.ConnectionPool(lambda: c, min_size=0, max_size=2))
+    return c
+
+
+def _run(sql, params=None, fetch="all"):
+    db = main.Database()
+    try:
+        return db.execute_query(sql, params, fetch=fetch)
+    finally:
+        db.close()
+
+
+def test_normalize_folds_literals_and_value_lists():
+    n = main.QueryStats.normalize
+    assert n("SELECT * FROM t WHERE a = 'x''y' AND b = 42 LIMIT %s") == "SELECT * FROM t WHERE a = ? AND b = ? LIMIT ?"
+    short = main.SQL_LEADERBOARD_APPLY_BATCH.format(values="(%s, %s, %s, %s)")
+    long = main.SQL_LEADERBOARD_APPLY_BATCH.format(values=", ".join(["(%s, %s, %s, %s)"] * 50))
+    assert n(short) == n(long)
+
+
+def test_rows_and_latency_are_recorded_per_statement(conn):
+    conn.rows = [{"id": 1}, {"id": 2}, {"id": 3}]
+    _run("SELECT id FROM users WHERE id > %s", (0,))
+    _run("SELECT id   FROM users WHERE id > %s", (5,))
+    _run("SELECT id FROM users WHERE id > %s", (5,), fetch="one")
+
+    entry = main.query_stats.get("SELECT id FROM users WHERE id > %s")
+    assert entry["calls"] == 3
+    assert entry["rows"] == 7
+    assert entry["errors"] == 0
+    assert sum(entry["histogram_ms"].values()) == 3
+    assert entry["p95_ms"] is not None
+
+
+def test_errors_and_rollbacks_are_counted(conn):
+    conn.fail = True
+    with pytest.raises(main.psycopg2.Error):
+        _run("UPDATE users SET username = %s WHERE id = %s", ("x", 1), fetch="none")
+
+    entry = main.query_stats.get("UPDATE users SET username = %s WHERE id = %s")
+    assert entry["errors"] == 1
+    assert entry["rollbacks"] == 1
+    assert conn.rollbacks == 1
+
+
+def test_slow_queries_are_logged(conn, monkeypatch, caplog):
+    monkeypatch.setattr(main.query_stats, "slow_ms", 0.000001)
+    with caplog.at_level("WARNING"):
+        _run("SELECT 1")
+    slow = main.query_stats.slow_queries()
+    assert slow and slow[-1]["statement"] == "SELECT ?"
+    assert any("Slow query" in r.message for r in caplog.records)
+
+
+def test_statement_table_is_bounded():
+    stats = main.QueryStats(slow_ms=0, slow_log_size=10)
+    stats.MAX_STATEMENTS = 3
+    for i in range(10):
+        stats.record(f"SELECT * FROM t{chr(97 + i)}", 1.0)
+    keys = {row["statement"] for row in stats.snapshot()}
+    assert len(keys) == 4
+    assert main.QueryStats.OVERFLOW_KEY in keys
+
+
+def test_admin_query_stats_endpoint(conn, monkeypatch):
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    _run("SELECT 1")
+    c = TestClient(main.app)
+
+    assert c.get("/api/admin/db/queries").status_code == 403
+    assert c.get("/api/admin/db/queries?sort=bogus", headers={"X-Admin-Token": "s3cret"}).status_code == 400
+
+    resp = c.get("/api/admin/db/queries?sort=calls&limit=5", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["queries"][0]["statement"] == "SELECT ?"
+    assert "slow" in body
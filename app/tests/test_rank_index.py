@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+
+WALLET = "11111111111111111111111111111112"
+
+
+def _expected_order(scores):
+    return sorted(scores, key=lambda uid: (-scores[uid][0], -scores[uid][1], -uid))
+
+
+def test_rank_index_matches_a_full_sort_under_random_updates():
+    rng = random.Random(7)
+    index = main.RankIndex()
+    scores = {}
+    for _ in range(3000):
+        uid = rng.randint(1, 400)
+        if rng.random() < 0.1 and uid in scores:
+            index.remove(uid)
+            del scores[uid]
+            continue
+        points, wins = rng.randint(0, 50), rng.randint(0, 5)
+        index.upsert(uid, points, wins, 0)
+        scores[uid] = (points, wins)
+
+    order = _expected_order(scores)
+    assert len(index) == len(order)
+    for pos, uid in enumerate(order, start=1):
+        assert index.rank_of(uid)["rank"] == pos
+    assert [e["user_id"] for e in index.page(1, len(order))] == order
+    assert [e["user_id"] for e in index.page(10, 5)] == order[9:14]
+
+
+def test_around_is_clamped_at_the_top():
+    index = main.RankIndex()
+    for uid in range(1, 21):
+        index.upsert(uid, points=uid * 10, wins=0)
+
+    top = index.around(20, radius=3)
+    assert [e["rank"] for e in top] == [1, 2, 3, 4]
+    mid = index.around(10, radius=2)
+    assert [e["user_id"] for e in mid] == [12, 11, 10, 9, 8]
+    assert index.around(999, radius=2) == []
+
+
+def test_ties_break_on_wins_then_user_id():
+    index = main.RankIndex()
+    index.upsert(1, 100, 5)
+    index.upsert(2, 100, 7)
+    index.upsert(3, 100, 5)
+    assert [e["user_id"] for e in index.page(1, 3)] == [2, 3, 1]
+
+
+def test_paged_load_keeps_newer_live_updates():
+    index = main.RankIndex()
+    pages = []
+    table = [{"user_id": i, "points": i, "wins": 0, "losses": 0} for i in range(1, 11)]
+
+    async def load_page(after, limit):
+        pages.append(after)
+        if after == 4:
+            # a battle resolves while the index is still loading
+            index.upsert(7, 1000, 1, 0)
+        return [r for r in table if r["user_id"] > after][:limit]
+
+    asyncio.run(index.ensure_loaded(load_page, page_size=4))
+
+    assert index.loaded
+    assert pages == [0, 4, 8]
+    assert len(index) == 10
+    assert index.rank_of(7)["points"] == 1000
+    assert index.rank_of(7)["rank"] == 1
+
+
+class _RankDB:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def connect(self):
+        return None
+
+    def close(self):
+        return None
+
+    def execute_query(self, query, params=None, fetch="all"):
+        q = " ".join(query.split()).lower()
+        if q.startswith("select user_id, points, wins, losses from leaderboard where user_id > %s"):
+            after, limit = params
+            rows = [
+                {"user_id": i, "points": i * 10, "wins": 0, "losses": 1}
+                for i in range(1, 31)
+                if i > after
+            ]
+            return rows[:limit]
+        if q.startswith("select user_id, points, wins, losses from leaderboard where user_id = %s"):
+            return None
+        if "from users where wallet_address" in q:
+            return {"id": 25} if params[0] == WALLET else None
+        if "from users where id = any" in q:
+            return [{"id": i, "username": f"u{i}", "wallet_address": f"w{i}"} for i in params[0]]
+        return None
+
+
+def _headers(user_id=25):
+    token = main.SecurityUtils.create_jwt_token(
+        {"userId": user_id, "walletAddress": WALLET, "uidv": main.IDENTITY_CLAIM_VERSION}
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_my_rank_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "Database", _RankDB)
+    c = TestClient(main.app)
+
+    resp = c.get("/api/leaderboard/me", headers=_headers())
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["rank"] == 6
+    assert body["total"] == 30
+    assert body["points"] == 250
+
+    assert c.get("/api/leaderboard/me").status_code in (401, 403)
+    assert c.get("/api/leaderboard/me", headers=_headers(user_id=999)).status_code == 404
+
+
+def test_around_endpoint_accepts_id_or_wallet(monkeypatch):
+    monkeypatch.setattr(main, "Database", _RankDB)
+    c = TestClient(main.app)
+
+    by_wallet = c.get(f"/api/leaderboard/around/{WALLET}?radius=2")
+    assert by_wallet.status_code == 200
+    body = by_wallet.json()
+    assert body["rank"] == 6
+    assert [e["user_id"] for e in body["entries"]] == [27, 26, 25, 24, 23]
+    assert body["entries"][0]["username"] == "u27"
+
+    assert c.get("/api/leaderboard/around/25?radius=2").json() == body
+    assert c.get("/api/leaderboard/around/25?radius=0").status_code == 400
+    assert c.get("/api/leaderboard/around/9999").status_code == 404
+
+
+def test_around_holds_no_connection_while_loading_index(monkeypatch):
+    class _CountingRankDB(_RankDB):
+        open = 0
+        peak = 0
+
+        def connect(self):
+            type(self).open += 1
+            type(self).peak = max(type(self).peak, type(self).open)
+
+        def close(self):
+            type(self).open -= 1
+
+    monkeypatch.setattr(main, "Database", _CountingRankDB)
+    c = TestClient(main.app)
+
+    assert c.get(f"/api/leaderboard/around/{WALLET}?radius=2").status_code == 200
+    assert _CountingRankDB.open == 0
+    assert _CountingRankDB.peak == 1
+
+
+def test_writer_updates_rank_index(monkeypatch):
+    class _BatchDB(_RankDB):
+        def execute_query(self, query, params=None, fetch="all"):
+            return [{"user_id": params[0], "points": 5000, "wins": 1, "losses": 0}]
+
+    monkeypatch.setattr(main, "Database", _BatchDB)
+    main.rank_index.upsert(1, 10, 0, 0)
+    main.rank_index.upsert(2, 20, 0, 0)
+
+    asyncio.run(main.LeaderboardWriter(flush_ms=0).submit(1, points=4990, wins=1))
+
+    assert main.rank_index.rank_of(1)["rank"] == 1
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+WALLET = "11111111111111111111111111111112"
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._result = None
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        self._result = self.conn.respond(" ".join(sql.split()).lower(), params)
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return self._result or []
+
+
+class _Conn:
+    def __init__(self, name, respond=None):
+        self.name = name
+        self.closed = 0
+        self.executed = []
+        self.respond = respond or (lambda sql, params: None)
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return main.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture()
+def pools(monkeypatch):
+    primary = _Conn("primary")
+    replica = _Conn("replica")
+    primary_pool = main.ConnectionPool(lambda: primary, min_size=0, max_size=5)
+    replica_pool = main.ConnectionPool(lambda: replica, min_size=0, max_size=5)
+    monkeypatch.setattr(main, "db_pool", primary_pool)
+    monkeypatch.setattr(main, "replica_pool", replica_pool)
+    monkeypatch.setattr(main, "replica_router", main.ReplicaRouter(window_seconds=0.2))
+    return primary, replica
+
+
+def _used(read_only=False, user=None):
+    db = main.Database(read_only=read_only, user=user)
+    db.execute_query("SELECT 1", fetch="one")
+    conn = db.conn
+    db.close()
+    return conn.name
+
+
+def test_reads_go_to_replica_and_writes_to_primary(pools):
+    assert _used(read_only=True) == "replica"
+    assert _used() == "primary"
+    assert main.replica_router.stats()["replica_reads"] == 1
+
+
+def test_read_your_writes_pins_user_to_primary(pools):
+    db = main.Database(user=WALLET)
+    db.execute_query("UPDATE users SET username = %s WHERE wallet_address = %s", ("x", WALLET), fetch="none")
+    db.close()
+
+    assert _used(read_only=True, user=WALLET) == "primary"
+    assert _used(read_only=True, user="someone-else") == "replica"
+
+    time.sleep(0.25)
+    assert _used(read_only=True, user=WALLET) == "replica"
+
+
+def test_selects_on_primary_do_not_pin_user(pools):
+    db = main.Database(user=WALLET)
+    db.execute_query(main.SQL_USER_ID_BY_WALLET, (WALLET,), fetch="one")
+    db.close()
+    assert _used(read_only=True, user=WALLET) == "replica"
+
+
+def test_replica_failure_falls_back_to_primary(pools, monkeypatch):
+    def broken():
+        raise main.psycopg2.OperationalError("replica down")
+
+    monkeypatch.setattr(main, "replica_pool", main.ConnectionPool(broken, min_size=0, max_size=1))
+    assert _used(read_only=True) == "primary"
+    assert main.replica_router.stats()["replica_fallbacks"] == 1
+
+
+def test_without_replica_reads_use_primary(pools, monkeypatch):
+    monkeypatch.setattr(main, "replica_pool", None)
+    assert _used(read_only=True) == "primary"
+
+
+def test_profile_created_on_primary_when_replica_lags(pools):
+    primary, replica = pools
+    now = main.datetime.utcnow()
+
+    def primary_respond(sql, params):
+        if sql.startswith("insert into users"):
+            return {
+                "id": 5,
+                "wallet_address": params[0],
+                "username": None,
+                "avatar_url": None,
+                "created_at": now,
+                "last_login": now,
+            }
+        return None
+
+    primary.respond = primary_respond
+    token = main.SecurityUtils.create_jwt_token({"userId": 5, "walletAddress": WALLET})
+
+    resp = TestClient(main.app).get("/api/user/profile", headers={"Authorization": f"Bearer {token}"})
+
+    assert resp.status_code == 200
+    assert resp.json()["id"] == 5
+    assert any(s.lstrip().upper().startswith("SELECT") for s in replica.executed)
+    assert not any("INSERT" in s for s in replica.executed)
+    # the freshly created user now reads its own write from the primary
+    assert main.replica_router.read_from_primary(WALLET)
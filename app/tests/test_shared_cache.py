@@ -0,0 +1,291 @@
+import asyncio
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from tests.test_battle_server_authority import _BattleDB, _auth_headers
+
+
+class _RESPHandler(socketserver.StreamRequestHandler):
+    """Just enough of the Redis protocol for TieredCache"""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode())
+        return args
+
+    def _bulk(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        data = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def handle(self):
+        server = self.server
+        while True:
+            cmd = self._read_command()
+            if cmd is None:
+                return
+            if cmd[0].upper() == "SLEEP":
+                # A slow command; served outside the lock like a busy server would
+                time.sleep(float(cmd[1]))
+                self.wfile.write(b"+OK\r\n")
+                continue
+            with server.lock:
+                server.commands.append(cmd[0].upper())
+                self.wfile.write(server.apply(cmd, self))
+
+
+class _FakeRedis(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RESPHandler)
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expiry = {}
+        self.commands = []
+
+    def _live(self, key):
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return self.data.get(key)
+
+    def apply(self, cmd, h):
+        name, args = cmd[0].upper(), cmd[1:]
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "GET":
+            return h._bulk(self._live(args[0]))
+        if name == "MGET":
+            return b"*%d\r\n" % len(args) + b"".join(h._bulk(self._live(k)) for k in args)
+        if name == "SET":
+            key, value, opts = args[0], args[1], [a.upper() for a in args[2:]]
+            if "NX" in opts and self._live(key) is not None:
+                return b"$-1\r\n"
+            self.data[key] = value
+            self.expiry.pop(key, None)
+            if "PX" in opts:
+                self.expiry[key] = time.monotonic() + int(args[2 + opts.index("PX") + 1]) / 1000
+            return b"+OK\r\n"
+        if name == "DEL":
+            n = sum(1 for k in args if self._live(k) is not None)
+            for k in args:
+                self.data.pop(k, None)
+                self.expiry.pop(k, None)
+            return b":%d\r\n" % n
+        if name == "INCR":
+            value = int(self._live(args[0]) or 0) + 1
+            self.data[args[0]] = str(value)
+            return b":%d\r\n" % value
+        if name == "PEXPIRE":
+            if "NX" in [a.upper() for a in args[2:]] and args[0] in self.expiry:
+                return b":0\r\n"
+            self.expiry[args[0]] = time.monotonic() + int(args[1]) / 1000
+            return b":1\r\n"
+        if name == "EVAL":
+            key, token = args[2], args[3]
+            if self._live(key) == token:
+                self.data.pop(key, None)
+                return b":1\r\n"
+            return b":0\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+def fake_redis():
+    server = _FakeRedis()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _cache(server, **kwargs):
+    host, port = server.server_address
+    return main.TieredCache(main.RESPClient(f"redis://{host}:{port}/0", timeout=1.0), **kwargs)
+
+
+def test_local_tier_is_lru_with_ttl():
+    local = main.LocalCache(max_entries=2)
+    local.set("a", 1, ttl=60)
+    local.set("b", 2, ttl=60)
+    assert local.get("a") == (True, 1)
+    local.set("c", 3, ttl=60)
+    assert local.get("b") == (False, None)
+
+    local.set("short", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert local.get("short") == (False, None)
+
+
+def test_values_are_shared_between_workers(fake_redis):
+    worker_a = _cache(fake_redis).namespace("scan")
+    worker_b = _cache(fake_redis).namespace("scan")
+
+    async def scenario():
+        await worker_a.set_many({"w1": {"nfts": [1]}, "w2": {"nfts": []}}, ttl=60)
+        found = await worker_b.get_many(["w1", "w2", "w3"])
+        await worker_a.delete("w1")
+        return found, await _cache(fake_redis).namespace("scan").get("w1")
+
+    found, deleted = asyncio.run(scenario())
+    assert found == {"w1": {"nfts": [1]}, "w2": {"nfts": []}}
+    assert deleted is None
+    assert "wb:scan:w2" in fake_redis.data
+
+
+def test_counters_are_shared_between_workers(fake_redis):
+    async def scenario():
+        a = _cache(fake_redis).namespace("ratelimit")
+        b = _cache(fake_redis).namespace("ratelimit")
+        return [await a.incr("ip", 60), await b.incr("ip", 60), await a.incr("ip", 60)]
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+    assert "wb:ratelimit:ip" in fake_redis.expiry
+
+
+def test_get_or_set_loads_once_across_callers_and_workers(fake_redis):
+    calls = {"n": 0}
+
+    async def loader():
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        return {"top": [1, 2, 3]}
+
+    async def scenario():
+        a = _cache(fake_redis).namespace("leaderboard")
+        b = _cache(fake_redis).namespace("leaderboard")
+        first = await asyncio.gather(*(a.get_or_set("top", loader, ttl=30) for _ in range(20)))
+        second = await b.get_or_set("top", loader, ttl=30)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert calls["n"] == 1
+    assert all(r == {"top": [1, 2, 3]} for r in first)
+    assert second == {"top": [1, 2, 3]}
+    assert not any(k.endswith(":lock") for k in fake_redis.data)
+
+
+def test_get_or_set_waits_for_lock_holder_in_other_worker(fake_redis):
+    fake_redis.data["wb:leaderboard:top:lock"] = "other-worker"
+
+    async def loader():
+        raise AssertionError("the lock holder loads, not us")
+
+    async def publish_later():
+        await asyncio.sleep(0.1)
+        fake_redis.data["wb:leaderboard:top"] = '{"top":[7]}'
+
+    async def scenario():
+        cache = _cache(fake_redis)
+        publisher = asyncio.create_task(publish_later())
+        value = await cache.namespace("leaderboard").get_or_set("top", loader, ttl=30)
+        await publisher
+        return value, cache.stats()
+
+    value, stats = asyncio.run(scenario())
+    assert value == {"top": [7]}
+    assert stats["lock_waits"] == 1
+
+
+def test_concurrent_commands_use_separate_connections(fake_redis):
+    host, port = fake_redis.server_address
+    client = main.RESPClient(f"redis://{host}:{port}/0", timeout=2.0, pool_size=4)
+
+    async def scenario():
+        started = time.monotonic()
+        await asyncio.gather(*(client.execute("SLEEP", 0.2) for _ in range(4)))
+        elapsed = time.monotonic() - started
+        await client.close()
+        return elapsed
+
+    # Not four round trips queued behind one socket
+    assert asyncio.run(scenario()) < 0.6
+
+
+def test_waiting_for_a_connection_counts_toward_timeout(fake_redis):
+    host, port = fake_redis.server_address
+    client = main.RESPClient(f"redis://{host}:{port}/0", timeout=0.3, pool_size=1)
+
+    async def scenario():
+        started = time.monotonic()
+        results = await asyncio.gather(
+            *(client.execute("SLEEP", 0.2) for _ in range(5)), return_exceptions=True
+        )
+        elapsed = time.monotonic() - started
+        await client.close()
+        return results, elapsed
+
+    results, elapsed = asyncio.run(scenario())
+    # Queued callers give up within the timeout instead of waiting 5 x 0.2s
+    assert results[0] == "OK"
+    assert all(isinstance(r, main.CacheBackendError) for r in results[1:])
+    assert elapsed < 0.6
+
+
+def test_unreachable_shared_tier_degrades_to_local():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    cache = main.TieredCache(main.RESPClient(f"redis://127.0.0.1:{port}", timeout=0.2))
+    ns = cache.namespace("x")
+
+    async def scenario():
+        await ns.set("k", 1, ttl=60)
+        return await ns.get("k"), await ns.incr("n", 60), await ns.get_or_set("v", _answer, 60)
+
+    async def _answer():
+        return 42
+
+    assert asyncio.run(scenario()) == (1, 1, 42)
+    stats = cache.stats()
+    assert stats["shared_errors"] == 1
+    assert stats["shared_down"]
+
+
+def test_rate_limit_is_enforced_through_shared_tier(monkeypatch, fake_redis):
+    monkeypatch.setattr(main, "shared_cache", _cache(fake_redis))
+    monkeypatch.setattr(main, "rate_limit_cache", main.shared_cache.namespace("ratelimit"))
+    monkeypatch.setattr(main.settings, "rate_limit_requests", 2)
+    monkeypatch.setattr(main.app.state, "testing", False)
+
+    c = TestClient(main.app)
+    codes = [c.get("/api").status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    assert any(k.startswith("wb:ratelimit:testclient:") for k in fake_redis.data)
+
+
+def test_battle_status_served_by_any_worker(monkeypatch, fake_redis):
+    db = _BattleDB()
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    monkeypatch.setattr(main, "shared_cache", _cache(fake_redis))
+    monkeypatch.setattr(main, "battle_cache", main.shared_cache.namespace("battle"))
+
+    c = TestClient(main.app)
+    headers = _auth_headers(db.wallet)
+    battle_id = c.post(
+        "/api/battle/start", headers=headers, json={"mintAddress": "1" * 44, "bet": 100}
+    ).json()["battle_id"]
+
+    # Simulate a poll landing on a worker that did not start the battle
+    main.app.state.battles.pop(battle_id)
+    main.shared_cache.clear()
+    resp = c.get(f"/api/battle/{battle_id}", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "pending"
@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    flights = main.SingleFlight()
+    calls = {"n": 0}
+
+    async def fetch():
+        calls["n"] += 1
+        await asyncio.sleep(0.02)
+        return {"value": calls["n"]}
+
+    async def scenario():
+        same = await asyncio.gather(*(flights.do("k", fetch, group="getTransaction") for _ in range(10)))
+        other = await flights.do("other", fetch, group="getTransaction")
+        return same, other
+
+    same, other = asyncio.run(scenario())
+    assert calls["n"] == 2
+    assert all(r is same[0] for r in same)
+    assert other == {"value": 2}
+    stats = flights.stats()
+    assert stats["groups"]["getTransaction"] == {"calls": 11, "executions": 2, "merged": 9, "saved": 9}
+    assert stats["inflight"] == 0
+
+
+def test_error_is_shared_and_not_cached():
+    flights = main.SingleFlight()
+    calls = {"n": 0}
+
+    async def failing():
+        calls["n"] += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("rpc down")
+
+    async def scenario():
+        results = await asyncio.gather(*(flights.do("k", failing) for _ in range(3)), return_exceptions=True)
+        with pytest.raises(RuntimeError):
+            await flights.do("k", failing)
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) and r is results[0] for r in results)
+    assert calls["n"] == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flights = main.SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.03)
+        return "done"
+
+    async def scenario():
+        first = asyncio.create_task(flights.do("k", slow))
+        second = asyncio.create_task(flights.do("k", slow))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+
+
+def test_duplicate_rpc_calls_reach_upstream_once(monkeypatch):
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"jsonrpc": "2.0", "result": {"ok": True}})
+
+    real = main.OutboundHTTP._new_client
+
+    def new_client(self):
+        client = real(self)
+        client._transport = httpx.MockTransport(handler)
+        return client
+
+    monkeypatch.setattr(main.OutboundHTTP, "_new_client", new_client)
+    http = main.OutboundHTTP(main.UpstreamStats())
+
+    async def scenario():
+        # Tabs send the same params with different JSON-RPC ids
+        same = [
+            http.rpc("https://rpc.local/", "getTransaction", {"jsonrpc": "2.0", "id": i, "params": ["sig"]})
+            for i in range(5)
+        ]
+        other = http.rpc("https://rpc.local/", "getTransaction", {"jsonrpc": "2.0", "id": 9, "params": ["sig2"]})
+        return await asyncio.gather(*same, other)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 6
+    assert len(requests) == 2
+    assert http.info()["singleflight"]["groups"]["getTransaction"]["saved"] == 4
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from tests.test_skills_upgrade_mocked import _auth_headers
+
+
+class _CatalogueDB:
+    rows = [{"id": 1, "name": "Fire Strike", "required_level": 1}]
+    calls = 0
+    fail = False
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def connect(self):
+        if type(self).fail:
+            raise main.psycopg2.OperationalError("db down")
+
+    def close(self):
+        pass
+
+    def execute_query(self, query, params=None, fetch="all"):
+        type(self).calls += 1
+        return [dict(r) for r in type(self).rows]
+
+
+@pytest.fixture
+def catalogue_db(monkeypatch):
+    _CatalogueDB.rows = [{"id": 1, "name": "Fire Strike", "required_level": 1}]
+    _CatalogueDB.calls = 0
+    _CatalogueDB.fail = False
+    monkeypatch.setattr(main, "Database", _CatalogueDB)
+    return _CatalogueDB
+
+
+def test_scaling_rules_follow_spec():
+    blade = main.SKILL_RULES["bladeStrike"]
+    assert blade.damage(1) == 18
+    assert blade.damage(5) == 26
+    assert blade.cooldown(1) == 1.3
+    assert blade.cooldown(3) == 0.5
+    assert main.SKILL_RULES["meteorRain"].max_level == 3
+    assert main.SKILL_RULES["healing"].damage(4) == 0
+
+
+def test_reads_are_served_from_memory(catalogue_db):
+    c = TestClient(main.app)
+    for _ in range(3):
+        body = c.get("/api/skills").json()
+    assert body["skills"][0]["name"] == "Fire Strike"
+    assert body["rules"]["energyBurst"]["baseDamage"] == 55
+    assert catalogue_db.calls == 1
+
+
+def test_catalogue_is_immutable(catalogue_db):
+    catalogue = asyncio.run(main.skill_registry.get())
+    with pytest.raises(TypeError):
+        catalogue.skills[0]["name"] = "x"
+    with pytest.raises(TypeError):
+        catalogue.rules["bladeStrike"] = None
+
+
+def test_admin_reload_swaps_catalogue(monkeypatch, catalogue_db):
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    c = TestClient(main.app)
+    first = c.get("/api/skills")
+
+    catalogue_db.rows = catalogue_db.rows + [{"id": 2, "name": "Ice Shield", "required_level": 1}]
+    resp = c.post("/api/admin/skills/reload", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    assert resp.json()["skills"] == 2
+
+    second = c.get("/api/skills", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert [s["name"] for s in second.json()["skills"]] == ["Fire Strike", "Ice Shield"]
+
+
+def test_failed_reload_keeps_previous_catalogue(catalogue_db):
+    before = asyncio.run(main.skill_registry.reload())
+    catalogue_db.fail = True
+    with pytest.raises(main.psycopg2.OperationalError):
+        asyncio.run(main.skill_registry.reload())
+    assert main.skill_registry.catalogue is before
+    assert main.skill_registry.stats()["failures"] == 1
+
+
+def test_upgrade_rejects_unknown_skill_without_io(monkeypatch):
+    async def _no_tx(sig):
+        raise AssertionError("chain must not be queried")
+
+    def _no_db(*args, **kwargs):
+        raise AssertionError("database must not be queried")
+
+    monkeypatch.setattr(main, "_solana_get_transaction", _no_tx)
+    monkeypatch.setattr(main, "Database", _no_db)
+
+    c = TestClient(main.app)
+    resp = c.post(
+        "/api/skills/upgrade",
+        headers=_auth_headers(),
+        json={"skillKey": "fireball", "txSignature": "S" * 64},
+    )
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Unknown skill"
+
+
+def test_reload_reads_primary(catalogue_db, monkeypatch):
+    opened = []
+
+    class _PrimaryCatalogueDB(catalogue_db):
+        def __init__(self, *args, **kwargs):
+            opened.append(kwargs.get("read_only", False))
+
+    monkeypatch.setattr(main, "Database", _PrimaryCatalogueDB)
+
+    asyncio.run(main.skill_registry.reload())
+
+    assert opened == [False]
@@ -54,12 +54,11 @@ def test_skills_upgrade_rejects_invalid_burn(monkeypatch):
     assert resp.status_code == 400
 
 
-def test_skills_upgrade_accepts_valid_burn_and_updates_level(monkeypatch):
+def _valid_burn(monkeypatch, wallet):
     monkeypatch.setattr(main.settings, "token_mint", "MINT")
     monkeypatch.setattr(main.settings, "token_decimals", 6)
     monkeypatch.setattr(main.settings, "burn_cost_per_level", 50000)
 
-    wallet = "11111111111111111111111111111112"
     raw_amount = 50000 * (10**6)
 
     async def _fake_tx(sig: str):
@@ -87,8 +86,13 @@ def test_skills_upgrade_accepts_valid_burn_and_updates_level(monkeypatch):
 
     monkeypatch.setattr(main, "_solana_get_transaction", _fake_tx)
 
+
+def test_skills_upgrade_accepts_valid_burn_and_updates_level(monkeypatch):
+    wallet = "11111111111111111111111111111112"
+    _valid_burn(monkeypatch, wallet)
+
     db = _FakeDB()
-    monkeypatch.setattr(main, "Database", lambda: db)
+    monkeypatch.setattr(main, "Database", lambda **_: db)
 
     c = TestClient(main.app)
     resp = c.post(
@@ -101,3 +105,57 @@ def test_skills_upgrade_accepts_valid_burn_and_updates_level(monkeypatch):
     body = resp.json()
     assert body["skillKey"] == "bladeStrike"
     assert body["level"] >= 2
+
+
+def test_skills_upgrade_pool_timeout_is_503_not_level_one(monkeypatch):
+    wallet = "11111111111111111111111111111112"
+    _valid_burn(monkeypatch, wallet)
+
+    class _BusyDB(_FakeDB):
+        def connect(self):
+            raise main.PoolTimeout("no connection within 0.1s")
+
+    monkeypatch.setattr(main, "Database", lambda **_: _BusyDB())
+
+    resp = TestClient(main.app).post(
+        "/api/skills/upgrade",
+        headers=_auth_headers(wallet),
+        json={"skillKey": "bladeStrike", "txSignature": "S" * 64},
+    )
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"]
+
+
+def test_skills_upgrade_stops_at_max_level(monkeypatch):
+    wallet = "11111111111111111111111111111112"
+    _valid_burn(monkeypatch, wallet)
+    cap = main.skill_registry.rule("bladeStrike").max_level
+
+    class _CappedDB(_FakeDB):
+        def execute_query(self, query: str, params=None, fetch: str = "all"):
+            q = " ".join(query.split()).lower()
+            if q.startswith("insert into user_skill_levels"):
+                assert "where user_skill_levels.level < %s" in q
+                if self.level >= params[2]:
+                    return None
+                self.level += 1
+                return {"level": self.level}
+            return super().execute_query(query, params, fetch)
+
+    db = _CappedDB()
+    db.level = cap - 1
+    monkeypatch.setattr(main, "Database", lambda **_: db)
+    c = TestClient(main.app)
+
+    def upgrade():
+        return c.post(
+            "/api/skills/upgrade",
+            headers=_auth_headers(wallet),
+            json={"skillKey": "bladeStrike", "txSignature": "S" * 64},
+        )
+
+    assert upgrade().json()["level"] == cap
+    resp = upgrade()
+    assert resp.status_code == 409
+    assert db.level == cap
@@ -0,0 +1,202 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+MINT = "Mint1111111111111111111111111111111111111111"
+
+
+def _account(amount, decimals=6):
+    return {
+        "account": {
+            "data": {
+                "parsed": {
+                    "info": {
+                        "tokenAmount": {
+                            "amount": str(amount),
+                            "decimals": decimals,
+                            "uiAmount": amount / 10 ** decimals,
+                            "uiAmountString": str(amount / 10 ** decimals),
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+
+class FakeRPC:
+    """Узел Solana: у кошелька wN - N токен-аккаунтов по 1.5 токена"""
+
+    def __init__(self, batch=True, broken=(), batch_status=None):
+        self.batch = batch
+        self.batch_status = batch_status
+        self.broken = set(broken)
+        self.posts = []
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def reply(self, call):
+        wallet = call["params"][0]
+        if wallet in self.broken:
+            return {"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32602, "message": "Invalid param"}}
+        n = int(wallet[1:].rstrip("x"))
+        return {"jsonrpc": "2.0", "id": call["id"], "result": {"value": [_account(1_500_000) for _ in range(n)]}}
+
+    async def handler(self, request):
+        body = json.loads(request.content)
+        self.posts.append(body)
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            await asyncio.sleep(0.01)
+            if isinstance(body, list):
+                if self.batch_status:
+                    return httpx.Response(self.batch_status, text="Request Entity Too Large")
+                if not self.batch:
+                    return httpx.Response(200, json={"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Batch requests are disabled"}})
+                # Batch replies may come back in any order
+                return httpx.Response(200, json=[self.reply(c) for c in reversed(body)])
+            return httpx.Response(200, json=self.reply(body))
+        finally:
+            self.inflight -= 1
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    monkeypatch.setattr(main.settings, "solana_rpc", "https://rpc.local/")
+    monkeypatch.setattr(main.settings, "token_mint", MINT)
+    server = {}
+
+    def new_client(self):
+        client = real(self)
+        client._transport = httpx.MockTransport(server["rpc"].handler)
+        return client
+
+    real = main.OutboundHTTP._new_client
+    monkeypatch.setattr(main.OutboundHTTP, "_new_client", new_client)
+
+    def make(**kwargs):
+        server["rpc"] = FakeRPC(**kwargs)
+        return server["rpc"]
+
+    return make
+
+
+def _run(coro_fn):
+    async def go():
+        try:
+            return await coro_fn()
+        finally:
+            await main.outbound_http.aclose()
+
+    return asyncio.run(go())
+
+
+def test_balance_sums_all_token_accounts():
+    data = {"result": {"value": [_account(1_500_000), _account(2_250_000), _account(1)]}}
+    assert main._token_accounts_balance(data) == pytest.approx(3.750001)
+    assert main._token_accounts_balance({"result": {"value": []}}) == 0.0
+    assert main._token_accounts_balance({"error": {"code": -1}}) is None
+
+
+def test_single_balance_sums_accounts(rpc):
+    rpc()
+    assert _run(lambda: main._solana_get_token_balance("w3", MINT)) == pytest.approx(4.5)
+
+
+def test_batches_with_bounded_concurrency(rpc, monkeypatch):
+    monkeypatch.setattr(main.settings, "solana_rpc_batch_size", 10)
+    monkeypatch.setattr(main.settings, "solana_rpc_batch_concurrency", 2)
+    fake = rpc()
+    wallets = [f"w{i}" for i in range(45)] + ["w1"]
+
+    balances = _run(lambda: main._solana_get_token_balances(wallets, MINT))
+
+    assert list(balances) == [f"w{i}" for i in range(45)]
+    assert balances["w0"] == 0.0
+    assert balances["w7"] == pytest.approx(10.5)
+    assert [len(p) for p in fake.posts] == [10, 10, 10, 10, 5]
+    assert fake.max_inflight == 2
+    assert main.upstream_stats.snapshot()
+
+
+def test_per_wallet_errors_are_none(rpc):
+    rpc(broken=["w2"])
+
+    balances = _run(lambda: main._solana_get_token_balances(["w1", "w2"], MINT))
+
+    assert balances == {"w1": pytest.approx(1.5), "w2": None}
+
+
+def test_falls_back_to_single_calls_without_batch_support(rpc, monkeypatch):
+    monkeypatch.setattr(main.settings, "solana_rpc_batch_size", 3)
+    fake = rpc(batch=False)
+
+    balances = _run(lambda: main._solana_get_token_balances(["w1", "w2", "w3"], MINT))
+
+    assert balances == {"w1": pytest.approx(1.5), "w2": pytest.approx(3.0), "w3": pytest.approx(4.5)}
+    assert [isinstance(p, list) for p in fake.posts] == [True, False, False, False]
+
+
+def test_falls_back_to_single_calls_when_batch_post_is_refused(rpc, monkeypatch):
+    monkeypatch.setattr(main.settings, "solana_rpc_batch_size", 3)
+    fake = rpc(batch_status=413)
+
+    balances = _run(lambda: main._solana_get_token_balances(["w1", "w2", "w3"], MINT))
+
+    assert balances == {"w1": pytest.approx(1.5), "w2": pytest.approx(3.0), "w3": pytest.approx(4.5)}
+    assert [isinstance(p, list) for p in fake.posts] == [True, False, False, False]
+
+
+def test_rate_limited_batch_is_not_retried_one_by_one(rpc):
+    fake = rpc(batch_status=429)
+
+    balances = _run(lambda: main._solana_get_token_balances(["w1", "w2"], MINT))
+
+    assert balances == {"w1": None, "w2": None}
+    assert len(fake.posts) == 1
+
+
+def _wallet(n):
+    """Адрес нужной для валидации длины, FakeRPC видит в нём wN"""
+    return f"w{n}".ljust(44, "x")
+
+
+def test_admin_token_balances(rpc, monkeypatch):
+    w2, w9 = _wallet(2), _wallet(9)
+    rpc(broken=[w9])
+    c = TestClient(main.app)
+
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    assert c.post("/api/admin/token-balances", json={"wallets": [w2]}).status_code == 403
+
+    resp = c.post(
+        "/api/admin/token-balances",
+        json={"wallets": [w2, w9]},
+        headers={"X-Admin-Token": "s3cret"},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["mint"] == MINT
+    assert body["balances"] == {w2: 3.0, w9: None}
+    assert body["failed"] == [w9]
+
+
+def test_admin_token_balances_validates_each_wallet(rpc, monkeypatch):
+    fake = rpc()
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    c = TestClient(main.app)
+
+    for bad in ("w2", "x" * 61):
+        resp = c.post(
+            "/api/admin/token-balances",
+            json={"wallets": [_wallet(1), bad]},
+            headers={"X-Admin-Token": "s3cret"},
+        )
+        assert resp.status_code == 422
+    assert fake.posts == []
@@ -0,0 +1,197 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from tests.test_wallet_scan_mocked import _auth_headers
+
+WALLET = "11111111111111111111111111111112"
+OTHER = "So11111111111111111111111111111111111111112"
+
+
+def _asset(i):
+    return {
+        "id": f"nft{i}",
+        "grouping": [{"group_key": "collection", "group_value": "COL"}],
+        "content": {"metadata": {"name": f"NFT #{i}"}, "files": [{"uri": f"http://example.com/{i}.png"}]},
+    }
+
+
+def _helius(monkeypatch, items):
+    calls = {"n": 0}
+
+    async def fake(owner, **_):
+        calls["n"] += 1
+        return {"result": {"items": list(items)}}
+
+    monkeypatch.setattr(main.settings, "collection_address", "COL")
+    monkeypatch.setattr(main, "_helius_get_assets_by_owner", fake)
+    monkeypatch.setattr(main, "_persist_scanned_nfts", _no_persist)
+    return calls
+
+
+async def _no_persist(current_user, nfts):
+    return None
+
+
+def _scan(c, wallet=WALLET, **extra):
+    return c.post("/api/wallet/scan", headers=_auth_headers(), json={"walletAddress": wallet, **extra})
+
+
+def test_repeat_scans_are_served_from_cache(monkeypatch):
+    calls = _helius(monkeypatch, [_asset(1)])
+    c = TestClient(main.app)
+
+    first = _scan(c)
+    second = _scan(c)
+    assert first.headers["x-cache"] == "MISS"
+    assert second.headers["x-cache"] == "FRESH"
+    assert second.json() == first.json()
+    assert calls["n"] == 1
+
+
+def test_owner_refresh_bypasses_cache_but_not_for_other_wallets(monkeypatch):
+    calls = _helius(monkeypatch, [_asset(1)])
+    c = TestClient(main.app)
+
+    _scan(c)
+    assert _scan(c, refresh=True).headers["x-cache"] == "MISS"
+    assert calls["n"] == 2
+
+    _scan(c, wallet=OTHER)
+    assert _scan(c, wallet=OTHER, refresh=True).headers["x-cache"] == "FRESH"
+    assert calls["n"] == 3
+
+
+def test_admin_invalidation(monkeypatch):
+    calls = _helius(monkeypatch, [])
+    monkeypatch.setattr(main.settings, "admin_token", "s3cret")
+    c = TestClient(main.app)
+
+    _scan(c)
+    resp = c.post(f"/api/admin/scan-cache/invalidate?wallet={WALLET}", headers={"X-Admin-Token": "s3cret"})
+    assert resp.status_code == 200
+    assert _scan(c).headers["x-cache"] == "MISS"
+    assert calls["n"] == 2
+
+
+def test_owner_scan_persists_on_cache_hits(monkeypatch):
+    _helius(monkeypatch, [_asset(1)])
+    persisted = []
+
+    async def persist(current_user, nfts):
+        persisted.append((current_user["wallet_address"], [n["id"] for n in nfts]))
+
+    monkeypatch.setattr(main, "_persist_scanned_nfts", persist)
+    c = TestClient(main.app)
+
+    # Another user's scan fills the cache for WALLET ...
+    other = c.post(
+        "/api/wallet/scan", headers=_auth_headers(wallet=OTHER), json={"walletAddress": WALLET}
+    )
+    assert other.headers["x-cache"] == "MISS"
+    assert persisted == []
+
+    # ... and the owner's own scan is a hit that still records their holdings
+    assert _scan(c).headers["x-cache"] == "FRESH"
+    assert persisted == [(WALLET, ["nft1"])]
+
+
+def _cache(fresh=60.0, stale=60.0, empty=300.0):
+    return main.WalletScanCache(main.shared_cache.namespace("scan-test"), fresh, stale, empty)
+
+
+def test_stale_entry_served_while_one_background_refresh_runs():
+    cache = _cache(fresh=0.05)
+    calls = {"n": 0}
+
+    async def loader():
+        calls["n"] += 1
+        await asyncio.sleep(0.02)
+        return [{"id": f"v{calls['n']}"}]
+
+    async def scenario():
+        await cache.get("w", "COL", loader)
+        await asyncio.sleep(0.06)
+        stale = await asyncio.gather(*(cache.get("w", "COL", loader) for _ in range(5)))
+        await asyncio.sleep(0.05)
+        return stale, await cache.get("w", "COL", loader)
+
+    stale, after = asyncio.run(scenario())
+    assert all(r == ([{"id": "v1"}], "stale") for r in stale)
+    assert after == ([{"id": "v2"}], "fresh")
+    assert calls["n"] == 2
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_empty_results_stay_fresh_longer():
+    cache = _cache(fresh=0.01, empty=60.0)
+
+    async def empty():
+        return []
+
+    async def scenario():
+        await cache.get("w", "COL", empty)
+        await asyncio.sleep(0.02)
+        return await cache.get("w", "COL", empty)
+
+    assert asyncio.run(scenario()) == ([], "fresh")
+
+
+def test_failed_refresh_keeps_stale_copy():
+    cache = _cache(fresh=0.01)
+    calls = {"n": 0}
+
+    async def loader():
+        calls["n"] += 1
+        if calls["n"] > 1:
+            raise RuntimeError("helius down")
+        return [{"id": "old"}]
+
+    async def scenario():
+        await cache.get("w", "COL", loader)
+        await asyncio.sleep(0.02)
+        first = await cache.get("w", "COL", loader)
+        await asyncio.sleep(0.01)
+        second = await cache.get("w", "COL", loader)
+        await asyncio.sleep(0.01)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == ([{"id": "old"}], "stale")
+    # Each later hit retries the refresh; the stale copy is served meanwhile
+    assert second == ([{"id": "old"}], "stale")
+    assert cache.stats()["refresh_errors"] == 2
+
+
+def test_concurrent_misses_share_one_scan():
+    cache = _cache()
+    calls = {"n": 0}
+
+    async def loader():
+        calls["n"] += 1
+        await asyncio.sleep(0.02)
+        return [{"id": "a"}]
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("w", "COL", loader) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert all(r == ([{"id": "a"}], "miss") for r in results)
+    assert calls["n"] == 1
+
+
+def test_entry_past_stale_window_is_reloaded():
+    cache = _cache(fresh=0.01, stale=0.01)
+    calls = {"n": 0}
+
+    async def loader():
+        calls["n"] += 1
+        return [{"id": f"v{calls['n']}"}]
+
+    async def scenario():
+        await cache.get("w", "COL", loader)
+        await asyncio.sleep(0.03)
+        return await cache.get("w", "COL", loader)
+
+    assert asyncio.run(scenario()) == ([{"id": "v2"}], "miss")
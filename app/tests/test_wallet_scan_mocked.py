@@ -14,7 +14,7 @@ def test_wallet_scan_filters_collection_limits_and_attack_bonus(monkeypatch):
     # Arrange
     monkeypatch.setattr(main.settings, "collection_address", "COLLECTION_ABC")
 
-    async def _fake_helius(owner: str):
+    async def _fake_helius(owner: str, **_):
         assert owner
         return {
             "result": {
@@ -1,3 +1,7 @@
+-- Начальная схема и тестовые данные для docker-entrypoint-initdb.d.
+-- Изменения схемы вносятся только миграциями alembic (app/migrations),
+-- которые приложение применяет при старте (alembic upgrade head).
+
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     wallet_address VARCHAR(44) UNIQUE NOT NULL,